@@ -0,0 +1,357 @@
+import hashlib
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+import http_policy
+import http_transport
+from permission_cache import PermissionCache
+from permission_snapshot import PermissionSnapshot
+from drupal_session import DrupalSession
+import timing_spans
+from app_config import config
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_settings():
+    """Config values used per lookup; re-read when config.ini changes on a running kiosk."""
+    global debug_mode, permission_id, workstation_id, api_url_template, parallel_lookup, hedge_permission
+    debug_mode = config.getboolean('DEFAULT', 'debug_mode', fallback=False)
+    permission_id = config.get('Login', 'permission_id')
+    workstation_id = config.get('Station', 'workstation_id')
+    api_url_template = config.get('Login', 'api_url')
+    # Opt-in: send the permission and user-info requests together so a denial needs one round trip, not two
+    parallel_lookup = config.getboolean('Login', 'parallel_lookup', fallback=False)
+    # Opt-in: send a second permission request when the first is slower than usual, and take whichever answers first
+    hedge_permission = config.getboolean('HTTP', 'hedge_permission', fallback=False)
+
+
+load_settings()
+
+USER_INFO_URL = "https://makehaven.org/api/v0/{endpoint}/{identifier}/user"
+
+DENIED_NOT_RECOGNIZED = "Denied because account not recognized as in the system."
+DENIED_INACTIVE = "Denied because membership is not active."
+DENIED_NO_PERMISSION = "Denied because does not have badge/permission for this tool."
+FAILED_TO_CONTACT = "Failed to contact server or access denied."
+
+# Everything in this module may run on a worker thread, so debug output is queued
+# here and drained into the Tk debug box by the UI thread.
+debug_messages = queue.Queue()
+
+def add_debug_message(message):
+    if debug_mode:
+        debug_messages.put(message)
+
+# Local permission cache in front of request_access()
+permission_cache = None
+if config.getboolean('PermissionCache', 'enabled', fallback=False):
+    cache_path = config.get('PermissionCache', 'persist_path', fallback='')
+    if cache_path and not os.path.isabs(cache_path):
+        cache_path = os.path.join(script_dir, cache_path)
+    permission_cache = PermissionCache(
+        max_entries=config.getint('PermissionCache', 'max_entries', fallback=500),
+        grant_ttl=config.getint('PermissionCache', 'grant_ttl', fallback=3600),
+        deny_ttl=config.getint('PermissionCache', 'deny_ttl', fallback=60),
+        stale_window=config.getint('PermissionCache', 'stale_window', fallback=0),
+        revalidate_after=config.getint('PermissionCache', 'revalidate_after', fallback=30),
+        persist_path=cache_path or None,
+    )
+
+# Bulk snapshot of everyone holding permission_id, consulted before the cache and the API
+permission_snapshot = None
+snapshot_url = config.get('Snapshot', 'url', fallback='')
+if config.getboolean('Snapshot', 'enabled', fallback=False) and snapshot_url:
+    snapshot_path = config.get('Snapshot', 'path', fallback='permission_snapshot.idx')
+    if not os.path.isabs(snapshot_path):
+        snapshot_path = os.path.join(script_dir, snapshot_path)
+    permission_snapshot = PermissionSnapshot(
+        snapshot_path,
+        permission_id,
+        max_age=config.getint('Snapshot', 'max_age', fallback=3600),
+        full_every=config.getint('Snapshot', 'full_every', fallback=86400),
+    )
+
+# Persistent, self-healing login for the workstation account
+session_cookie_path = config.get('Login', 'session_cookie_path', fallback='')
+if session_cookie_path and not os.path.isabs(session_cookie_path):
+    session_cookie_path = os.path.join(script_dir, session_cookie_path)
+
+drupal = DrupalSession(
+    config.get('Login', 'login_url'),
+    config.get('Login', 'username'),
+    config.get('Login', 'password'),
+    cookie_path=session_cookie_path or None,
+    max_age=config.getint('Login', 'session_max_age', fallback=3600),
+    refresh_margin=config.getint('Login', 'session_refresh_margin', fallback=300),
+    headers={"Cache-Control": "private, max-age=0, no-cache"},
+)
+
+@config.on_reload
+def apply_reloaded_settings():
+    load_settings()
+    # New credentials or login URL take effect with the next login
+    drupal.login_url = config.get('Login', 'login_url')
+    drupal.username = config.get('Login', 'username')
+    drupal.password = config.get('Login', 'password')
+
+
+def station_profile(profile=None):
+    """The station a lookup is for: this kiosk's own settings, unless the station daemon passes another station's profile."""
+    return profile or {'workstation_id': workstation_id, 'permission_id': permission_id}
+
+
+def login_to_drupal():
+    return drupal.login()
+
+
+def ensure_session():
+    """Make sure the workstation is logged in; normally already done by warm_up()."""
+    with timing_spans.span('session_ensure'):
+        ok = drupal.ensure()
+    if not ok:
+        add_debug_message("Login failed. Please check credentials.")
+        return False
+    return True
+
+
+def warm_up():
+    """Log in (or reuse the saved session) before the first scan and keep the session alive from then on."""
+    ensure_session()
+    drupal.start_keepalive()
+    if permission_snapshot is not None:
+        permission_snapshot.start_sync(fetch_permission_snapshot, interval=config.getint('Snapshot', 'sync_interval', fallback=300))
+
+
+def prewarm(identifiers, profile=None):
+    """Get ready for an expected scan: a live session, and the permission cache filled for each identifier."""
+    ensure_session()
+    if permission_cache is None:
+        return
+    for identifier in identifiers:
+        lookup_permission(identifier, "@" in identifier, profile)
+
+
+def request_access(identifier, is_email, profile=None):
+    profile = station_profile(profile)
+    if not ensure_session():
+        return None
+
+    # Determine the endpoint based on the type of request (email or serial)
+    endpoint = "email" if is_email else "serial"
+
+    # Construct the API URL with additional parameters
+    api_url = api_url_template.format(endpoint=endpoint, identifier=identifier, permission_id=profile['permission_id'])
+    api_url += f"?source={profile['workstation_id']}&method=MakerAuth"
+
+    # Always a fresh answer; the User-Agent and pooled connection come from http_transport
+    headers = {"Cache-Control": "no-cache"}
+
+    # Make the GET request (re-logs in and retries once if the session was rejected)
+    with timing_spans.span('permission_get'):
+        response = drupal.get(api_url, endpoint='permission', headers=headers)
+    if response is None:
+        return None
+
+    # Debugging outputs
+    if debug_mode:
+        add_debug_message(f"Request URL: {api_url}")
+        add_debug_message(f"Response status code: {response.status_code}")
+        add_debug_message(f"Response headers: {response.headers}")
+        add_debug_message(f"Response text: {response.text}")
+        try:
+            response_data = response.json()
+            add_debug_message(f"Response JSON: {response_data}")
+        except ValueError:
+            add_debug_message("Response body could not be converted to JSON.")
+
+    return response
+
+
+def request_user_info(identifier, is_email):
+    """Function to make API call to retrieve user information by email or serial number."""
+    if not ensure_session():
+        return None
+
+    # Construct the API URL based on whether the identifier is an email or serial number
+    endpoint = "email" if is_email else "serial"
+    api_url = USER_INFO_URL.format(endpoint=endpoint, identifier=identifier)
+
+    # Make the API request and return the response
+    with timing_spans.span('user_info_get'):
+        return drupal.get(api_url, endpoint='user_info')
+
+
+def post_outbox_batch(events):
+    """Deliver a batch of queued kiosk events; True when the server accepted all of them."""
+    outbox_url = config.get('Outbox', 'url', fallback='')
+    if not outbox_url:
+        return False
+    # The batch key lets the server recognise a re-sent batch; each event also carries its own key
+    batch_key = hashlib.sha256("".join(event['idempotency_key'] for event in events).encode('utf-8')).hexdigest()
+    try:
+        response = drupal.post(outbox_url, endpoint='outbox', json={'source': workstation_id, 'events': events}, headers={"Idempotency-Key": batch_key})
+    except http_transport.HTTPError as e:
+        print(f"Outbox delivery failed: {e}")
+        return False
+    return response is not None and 200 <= response.status_code < 300
+
+
+def fetch_permission_data(identifier, is_email, profile=None):
+    """Call the permission endpoint and return the parsed list, or None if the server could not be used."""
+    if hedge_permission:
+        # Only the first copy records into the scan's trace, so the stage timings are not counted twice
+        return http_policy.hedged(
+            timing_spans.traced(timing_spans.current(), lambda: _fetch_permission_data(identifier, is_email, profile)),
+            'permission',
+            second=lambda: _fetch_permission_data(identifier, is_email, profile),
+        )
+    return _fetch_permission_data(identifier, is_email, profile)
+
+
+def _fetch_permission_data(identifier, is_email, profile):
+    try:
+        response = request_access(identifier, is_email, profile)
+    except http_transport.HTTPError as e:
+        print(f"Permission request failed: {e}")
+        return None
+    if response is None or response.status_code != 200:
+        return None
+    try:
+        with timing_spans.span('permission_parse'):
+            return response.json()
+    except ValueError:
+        return None
+
+
+def fetch_permission_snapshot(since=None):
+    """Download the full list of members holding permission_id, or only the changes since version `since`."""
+    if not ensure_session():
+        return None
+    params = {'source': workstation_id}
+    if since:
+        params['since'] = since
+    try:
+        response = drupal.get(snapshot_url.format(permission_id=permission_id), endpoint='snapshot', params=params)
+    except http_transport.HTTPError as e:
+        print(f"Permission snapshot request failed: {e}")
+        return None
+    if response is None:
+        return None
+    if response.status_code == 304:
+        return {'not_modified': True}
+    if response.status_code != 200:
+        return None
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+
+def fetch_user_data(identifier, is_email):
+    """Call the user endpoint and return the parsed list, or None if the server could not be used."""
+    try:
+        response = request_user_info(identifier, is_email)
+    except http_transport.HTTPError as e:
+        print(f"User info request failed: {e}")
+        return None
+    if response is None or response.status_code != 200:
+        return None
+    try:
+        with timing_spans.span('user_info_parse'):
+            return response.json()
+    except ValueError:
+        return None
+
+
+def lookup_permission(identifier, is_email, profile=None):
+    """Answer a permission check from the snapshot or the local cache when possible, otherwise from the API."""
+    if permission_snapshot is not None and station_profile(profile)['permission_id'] == permission_snapshot.permission_id:
+        with timing_spans.span('snapshot_lookup'):
+            data = permission_snapshot.lookup(identifier)
+        if data is not None:
+            add_debug_message(f"Permission snapshot: {permission_snapshot.stats_line()}")
+            return data
+
+    if permission_cache is None:
+        return fetch_permission_data(identifier, is_email, profile)
+
+    # Includes the cache check, so a hit shows up as a near-zero lookup with no permission_get
+    with timing_spans.span('permission_lookup'):
+        data = permission_cache.lookup(identifier, station_profile(profile)['permission_id'], fetch=lambda: fetch_permission_data(identifier, is_email, profile))
+    add_debug_message(f"Permission cache: {permission_cache.stats_line()}")
+    return data
+
+
+def describe_denial(user_data, default_message=DENIED_NOT_RECOGNIZED):
+    """Work out the denial reason from the user endpoint's response."""
+    if not user_data:
+        # The API call was successful, but no user data was returned - unrecognized account
+        return DENIED_NOT_RECOGNIZED
+
+    # Extract 'access' field from the first item in the response data
+    access_status = user_data[0].get('access', '').lower()
+
+    if "denied" in access_status:
+        # User is a former member with inactive membership
+        return DENIED_INACTIVE
+    if "member" in access_status:
+        # User is a current member but may not have permission for this specific tool
+        return DENIED_NO_PERMISSION
+    # Default message for unexpected cases
+    return default_message
+
+
+# Pool for the speculative user-info request sent alongside the permission request
+_speculative_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="user-info")
+
+def cached_grant(identifier, profile=None):
+    """True when the permission cache already holds a grant, so a speculative user-info request would be wasted."""
+    if permission_cache is None:
+        return False
+    data, age, state = permission_cache.get(identifier, station_profile(profile)['permission_id'])
+    return bool(state and data)
+
+
+def resolve_access(identifier, trace=None, profile=None):
+    """Decide access for one scan. Runs on a worker thread and never touches the UI.
+
+    Returns a dict with 'granted' (bool), 'message' (for denials and errors)
+    and 'data' (the permission API result when granted). Stage timings are
+    recorded into `trace` (a timing_spans.Trace) when one is given. `profile`
+    is another station's settings when the station daemon asks on its behalf.
+    """
+    with timing_spans.activate(trace), timing_spans.span('resolve_access'):
+        result = _resolve_access(identifier, trace, profile)
+    if trace is not None:
+        trace.mark('resolved')
+    return result
+
+
+def _resolve_access(identifier, trace, profile):
+    is_email = "@" in identifier
+
+    # In parallel mode the user-info request goes out at the same time as the permission request
+    user_future = None
+    if parallel_lookup and not cached_grant(identifier, profile):
+        user_future = _speculative_pool.submit(timing_spans.traced(trace, fetch_user_data), identifier, is_email)
+
+    # Initial access request based on the identifier (answered locally on a cache hit)
+    data = lookup_permission(identifier, is_email, profile)
+    if data is None:
+        # Handle failed initial API call or access denied without specific information
+        return {'granted': False, 'message': FAILED_TO_CONTACT, 'data': None}
+    if data:
+        # Granted: the decision does not wait for the speculative request
+        if user_future is not None:
+            user_future.cancel()
+        return {'granted': True, 'message': None, 'data': data}
+
+    # If data is empty, it might be a former member, unrecognized account, or lack permission
+    if user_future is not None:
+        user_data = user_future.result()
+    else:
+        user_data = fetch_user_data(identifier, is_email)
+    if user_data is None:
+        return {'granted': False, 'message': FAILED_TO_CONTACT, 'data': None}
+    return {'granted': False, 'message': describe_denial(user_data), 'data': None}
@@ -0,0 +1,377 @@
+"""config.ini, loaded once per process and shared by every module, with a schema and hot reload.
+
+`config` answers the usual ConfigParser calls (get, getint, getboolean,
+sections, ...). `config.value(section, key)` returns a key converted to its
+schema type, with the schema default when it is not set.
+
+The file is read from the script directory, never the current directory.
+Unknown keys, missing required keys and values of the wrong type are
+reported when the process starts. `config.watch()` re-reads the file when
+its mtime changes and calls the `on_reload` callbacks. Modules use these
+callbacks to refresh the settings they keep in globals (permission,
+endpoints, messages, timeouts). Settings that decide what gets built
+(caches, daemon mode, reader device) still need a restart.
+
+Usage:
+    python app_config.py    # check config.ini and print every setting
+"""
+import configparser
+import fnmatch
+import os
+import sys
+import threading
+import time
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(script_dir, 'config.ini')
+
+REQUIRED = object()
+
+# section -> key -> (type, default). A type is str, int, float, bool or a tuple of allowed values.
+SCHEMA = {
+    'DEFAULT': {
+        'debug_mode': (bool, False),
+    },
+    'Station': {
+        'workstation_id': (str, REQUIRED),
+        'tool_numerical_id': (str, "0"),
+    },
+    'Login': {
+        'permission_id': (str, REQUIRED),
+        'api_url': (str, REQUIRED),
+        'login_url': (str, REQUIRED),
+        'username': (str, REQUIRED),
+        'password': (str, REQUIRED),
+        'test_url': (str, ""),
+        'input_format': (('hexadecimal', 'decimal'), 'hexadecimal'),
+        'parallel_lookup': (bool, False),
+        'session_cookie_path': (str, ""),
+        'session_max_age': (int, 3600),
+        'session_refresh_margin': (int, 300),
+    },
+    'PermissionCache': {
+        'enabled': (bool, False),
+        'max_entries': (int, 500),
+        'grant_ttl': (int, 3600),
+        'deny_ttl': (int, 60),
+        'stale_window': (int, 0),
+        'revalidate_after': (int, 30),
+        'persist_path': (str, ""),
+    },
+    'Snapshot': {
+        'enabled': (bool, False),
+        'url': (str, ""),
+        'path': (str, "permission_snapshot.idx"),
+        'sync_interval': (int, 300),
+        'max_age': (int, 3600),
+        'full_every': (int, 86400),
+    },
+    'Reservations': {
+        'min_poll_interval': (int, 60),
+        'max_poll_interval': (int, 900),
+        'prewarm': (bool, False),
+        'prewarm_window_minutes': (int, 15),
+        'prewarm_lead': (int, 120),
+    },
+    'SessionTime': {
+        'enable_timer_window': (bool, False),
+        'journal_path': (str, "session_journal.json"),
+        'resume_max_hours': (float, 12.0),
+    },
+    'UsageInput': {
+        'require_usage_input': (bool, False),
+        'usage_unit': (str, "units"),
+        'material_id': (str, ""),
+    },
+    'EndingPage': {
+        'show_ending_window': (bool, True),
+        'end_message': (str, "Thank you for using the station."),
+        'show_experience_scale': (bool, False),
+        'api_material_url': (str, ""),
+        'experience_question': (str, "How was your experience?"),
+        'high_label': (str, "Excellent"),
+        'low_label': (str, "Poor"),
+    },
+    'Materials': {
+        'cache_dir': (str, "cache/materials"),
+        'thumbnail_height': (int, 100),
+        'material_url': (str, "https://www.makehaven.org/api/v0/material/"),
+    },
+    'QRCode': {
+        'memory_entries': (int, 64),
+        'disk_cache': (bool, True),
+        'cache_dir': (str, "cache/qr"),
+    },
+    'Logging': {
+        'log_file_path': (str, "SessionLog.txt"),
+        'flush_interval': (float, 1.0),
+        'fsync': (('never', 'batch', 'always'), 'batch'),
+        'rotate_max_bytes': (int, 0),
+        'rotate_interval': (('none', 'daily', 'weekly', 'monthly'), 'none'),
+    },
+    'SessionStore': {
+        'enabled': (bool, False),
+        'db_path': (str, "sessions.db"),
+        'keep_days': (int, 90),
+    },
+    'Outbox': {
+        'enabled': (bool, False),
+        'url': (str, ""),
+        'db_path': (str, "outbox.db"),
+        'batch_size': (int, 100),
+        'max_backoff': (int, 600),
+    },
+    'Graylog': {
+        'enabled': (bool, True),
+        'server_ip': (str, ""),
+        'server_port': (int, 12201),
+        'protocol': (('udp', 'tcp'), 'udp'),
+        'batch_size': (int, 50),
+        'flush_interval': (float, 2.0),
+        'queue_size': (int, 10000),
+        'spool_path': (str, "graylog_spool.jsonl"),
+        'spool_max_bytes': (int, 5000000),
+    },
+    'HTTP': {
+        'connect_timeout': (float, 3.05),
+        'min_read_timeout': (float, 1.0),
+        'adaptive_timeouts': (bool, True),
+        '*_timeout': (float, 30.0),  # Read timeout ceiling per endpoint
+        'breaker_failures': (int, 3),
+        'breaker_reset': (float, 30.0),
+        'hedge_permission': (bool, False),
+        'hedge_after_min': (float, 0.3),
+        'http2': (bool, True),
+        'max_connections': (int, 20),
+        'max_keepalive': (int, 10),
+        'keepalive_expiry': (float, 60.0),
+        'user_agent': (str, ""),
+    },
+    'Timing': {
+        'dump_path': (str, "timing_stats.json"),
+        'dump_interval': (float, 60.0),
+    },
+    'Daemon': {
+        'use_daemon': (bool, False),
+        'station': (str, ""),
+        'socket_path': (str, "maker-light-auth.sock"),
+    },
+    'Station:*': {
+        'workstation_id': (str, ""),
+        'permission_id': (str, ""),
+        'tool_numerical_id': (str, "0"),
+    },
+    'Reader': {
+        'device': (str, ""),
+        'baud_rate': (int, 9600),
+        'frame_gap_ms': (int, 50),
+        'min_length': (int, 4),
+        'max_length': (int, 20),
+        'duplicate_window': (float, 3.0),
+    },
+    'Config': {
+        'watch_interval': (float, 5.0),
+    },
+}
+
+_BOOLEANS = configparser.ConfigParser.BOOLEAN_STATES
+
+
+def schema_for(section):
+    """The schema of a section, matching patterns like 'Station:*'; None for an unknown section."""
+    if section in SCHEMA:
+        return SCHEMA[section]
+    for pattern, keys in SCHEMA.items():
+        if '*' in pattern and fnmatch.fnmatchcase(section, pattern):
+            return keys
+    return None
+
+
+def key_spec(section, key):
+    keys = schema_for(section) or {}
+    if key in keys:
+        return keys[key]
+    for pattern, spec in keys.items():
+        if '*' in pattern and fnmatch.fnmatchcase(key, pattern):
+            return spec
+    if key in SCHEMA['DEFAULT']:
+        return SCHEMA['DEFAULT'][key]
+    return None
+
+
+def convert(kind, text):
+    """`text` as `kind`; raises ValueError when it does not fit."""
+    if kind is bool:
+        if text.lower() not in _BOOLEANS:
+            raise ValueError(f"not a boolean: {text!r}")
+        return _BOOLEANS[text.lower()]
+    if isinstance(kind, tuple):
+        value = text.strip().lower()
+        if value not in kind:
+            raise ValueError(f"{text!r} is not one of {', '.join(kind)}")
+        return value
+    return kind(text)
+
+
+def validate(parser):
+    """Problems with a parsed config, as readable lines."""
+    problems = []
+    defaults = set(parser.defaults())
+    for key in defaults:
+        if key not in SCHEMA['DEFAULT']:
+            problems.append(f"unknown key [DEFAULT] {key}")
+    for section in parser.sections():
+        if schema_for(section) is None:
+            problems.append(f"unknown section [{section}]")
+            continue
+        for key, text in parser.items(section, raw=True):
+            if key in defaults and parser.get(section, key, raw=True) == parser.defaults()[key]:
+                continue
+            spec = key_spec(section, key)
+            if spec is None:
+                problems.append(f"unknown key [{section}] {key}")
+                continue
+            try:
+                convert(spec[0], text)
+            except ValueError as e:
+                problems.append(f"bad value for [{section}] {key}: {e}")
+    for section, keys in SCHEMA.items():
+        if '*' in section:
+            continue
+        for key, (kind, default) in keys.items():
+            if default is REQUIRED and not (parser.has_option(section, key) and parser.get(section, key, raw=True).strip()):
+                problems.append(f"missing required key [{section}] {key}")
+    return problems
+
+
+class AppConfig:
+    """The shared, reloadable configuration. Reads go to whichever parsed file is current."""
+
+    def __init__(self, path=CONFIG_PATH):
+        self.path = path
+        self.problems = []
+        self.reloads = 0
+        self._parser = configparser.ConfigParser()
+        self._stamp = None
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._watch_thread = None
+        self.load(initial=True)
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load(self, initial=False):
+        """Parse the file. At start-up it is used as it is; a reload with errors keeps the previous settings."""
+        stamp = self._file_stamp()
+        parser = configparser.ConfigParser()
+        try:
+            read = parser.read(self.path)
+        except configparser.Error as e:
+            print(f"Could not parse {self.path}: {e}")
+            self._stamp = stamp
+            return False
+        if not read:
+            print(f"Configuration file {self.path} not found")
+        problems = validate(parser)
+        for problem in problems:
+            print(f"{os.path.basename(self.path)}: {problem}")
+        self._stamp = stamp
+        if not initial and any(problem.startswith(("missing required", "bad value")) for problem in problems):
+            print(f"Keeping the previous settings until {os.path.basename(self.path)} is fixed")
+            return False
+        self.problems = problems
+        self._parser = parser  # One reference swap, so readers see either the old or the new file
+        return True
+
+    def reload_if_changed(self):
+        """Re-read the file if it changed on disk. Returns True when new settings were applied."""
+        with self._lock:
+            if self._file_stamp() == self._stamp or not self.load():
+                return False
+            self.reloads += 1
+            listeners = list(self._listeners)
+        print(f"Reloaded {self.path}")
+        for callback in listeners:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Applying reloaded settings failed in {getattr(callback, '__module__', callback)}: {e}")
+        return True
+
+    def on_reload(self, callback):
+        """Call `callback()` (on the watcher thread) after each successful reload."""
+        self._listeners.append(callback)
+        return callback
+
+    def watch(self, interval=None):
+        """Check the file's mtime every `interval` seconds ([Config] watch_interval) in a background thread."""
+        interval = self.value('Config', 'watch_interval') if interval is None else interval
+        if self._watch_thread is not None or interval <= 0:
+            return
+
+        def watcher():
+            while True:
+                time.sleep(interval)
+                self.reload_if_changed()
+
+        self._watch_thread = threading.Thread(target=watcher, name="config-watch", daemon=True)
+        self._watch_thread.start()
+
+    def value(self, section, key):
+        """A setting converted to its schema type; the schema default when unset or unparseable."""
+        spec = key_spec(section, key)
+        if spec is None:
+            raise KeyError(f"[{section}] {key} is not in the config schema")
+        kind, default = spec
+        parser = self._parser
+        if parser.has_option(section, key):
+            try:
+                return convert(kind, parser.get(section, key))
+            except ValueError:
+                pass
+        if default is REQUIRED:
+            raise KeyError(f"[{section}] {key} is required in {self.path}")
+        return default
+
+    # ConfigParser-compatible reads, so modules keep their config.get(...) calls
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._parser, name)
+
+    def __getitem__(self, section):
+        return self._parser[section]
+
+    def __contains__(self, section):
+        return section in self._parser
+
+
+config = AppConfig()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    checked = AppConfig(argv[0]) if argv else config
+    for section in ['DEFAULT'] + checked.sections():
+        keys = checked.defaults() if section == 'DEFAULT' else checked[section]
+        print(f"[{section}]")
+        for key in keys:
+            if section != 'DEFAULT' and key in checked.defaults():
+                continue
+            spec = key_spec(section, key)
+            try:
+                shown = repr(convert(spec[0], checked.get(section, key))) if spec else "(unknown key)"
+            except ValueError as e:
+                shown = f"(bad value: {e})"
+            print(f"  {key} = {shown}")
+    print(f"{len(checked.problems)} problem(s)")
+    return 1 if checked.problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
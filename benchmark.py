@@ -0,0 +1,166 @@
+"""Latency benchmark of the kiosk's network paths against the local mock API (mock_api.py).
+
+Drives request_access, resolve_access (the work behind handle_access, without
+the Tk window), fetch_upcoming_reservations and fetch_consumables headlessly
+and reports p50/p95/p99 latencies and how many requests reached the server.
+Nothing on disk is touched: the session cookie, permission cache and
+materials cache all live in a temporary directory for the run.
+
+Usage:
+    python benchmark.py [--iterations 200] [--members 50] [--latency 80] [--jitter 20] [--error-rate 0.02] [--json results.json]
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+from mock_api import MockServer
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100.0 * len(ordered)) - 1))]
+
+
+def identifiers(count):
+    """Half serials, half emails, so both endpoints are exercised."""
+    return [f"member{n}@example.org" if n % 2 else f"{0x1A2B3C00 + n:X}" for n in range(count)]
+
+
+def point_at(base_url, workdir):
+    """Redirect every module's endpoints and on-disk state to the mock server and a scratch directory."""
+    import access_client
+    import materials_cache
+    import reservation_poller
+    from drupal_session import DrupalSession
+
+    access_client.api_url_template = base_url + "/api/v0/{endpoint}/{identifier}/permission/{permission_id}"
+    access_client.USER_INFO_URL = base_url + "/api/v0/{endpoint}/{identifier}/user"
+    access_client.drupal = DrupalSession(base_url + "/user/login", "bench", "bench", cookie_path=os.path.join(workdir, "session.json"),
+                                         headers=access_client.drupal.headers)
+    access_client.permission_cache = None
+    access_client.permission_snapshot = None
+    reservation_poller.RESERVATIONS_URL = base_url + "/api/v0/reservation/upcoming/equipment/{equipment_id}"
+    materials_cache.MATERIALS_URL = base_url + "/api/v0/materials/equipment/{tool_numerical_id}"
+    materials_cache.SITE_URL = base_url
+    materials_cache.cache_dir = os.path.join(workdir, "materials")
+
+
+def run_scenario(name, server, calls, fn):
+    """Time `fn(i)` for i in range(calls). `fn` returns True when the call succeeded."""
+    import http_policy
+    http_policy.reset()  # Every scenario learns its own timeouts, and starts with closed breakers
+    before = server.counts()
+    samples, failures = [], 0
+    for i in range(calls):
+        started = time.perf_counter()
+        try:
+            ok = fn(i)
+        except Exception as e:
+            print(f"{name}: call {i} raised {e}", file=sys.stderr)
+            ok = False
+        samples.append((time.perf_counter() - started) * 1000)
+        if not ok:
+            failures += 1
+    after = server.counts()
+    requests_made = {key: after[key] - before.get(key, 0) for key in after if after[key] != before.get(key, 0)}
+    samples.sort()
+    return {
+        'scenario': name,
+        'calls': calls,
+        'failures': failures,
+        'p50_ms': percentile(samples, 50),
+        'p95_ms': percentile(samples, 95),
+        'p99_ms': percentile(samples, 99),
+        'max_ms': samples[-1] if samples else 0.0,
+        'requests': requests_made,
+    }
+
+
+def run_benchmarks(server, iterations, members, workdir):
+    import access_client
+    import reservation_poller
+    from ending_window import fetch_consumables
+    from permission_cache import PermissionCache
+
+    point_at(server.base_url, workdir)
+    scans = identifiers(members)
+
+    def scan(i):
+        return scans[i % len(scans)]
+
+    def resolved(i):
+        return access_client.resolve_access(scan(i))['message'] != access_client.FAILED_TO_CONTACT
+
+    def request_access(i):
+        identifier = scan(i)
+        response = access_client.request_access(identifier, "@" in identifier)
+        return response is not None and response.status_code == 200
+
+    results = [run_scenario("login", server, 1, lambda i: access_client.drupal.login())]
+    results.append(run_scenario("request_access", server, iterations, request_access))
+
+    access_client.parallel_lookup = False
+    results.append(run_scenario("resolve_access (no cache)", server, iterations, resolved))
+    access_client.parallel_lookup = True
+    results.append(run_scenario("resolve_access (no cache, parallel)", server, iterations, resolved))
+    access_client.parallel_lookup = False
+    access_client.hedge_permission = True
+    results.append(run_scenario("resolve_access (no cache, hedged)", server, iterations, resolved))
+    access_client.hedge_permission = False
+
+    access_client.permission_cache = PermissionCache(max_entries=max(members, 1), grant_ttl=3600, deny_ttl=60)
+    results.append(run_scenario("resolve_access (permission cache)", server, iterations, resolved))
+    access_client.permission_cache = None
+
+    equipment_id = access_client.config.get('Station', 'tool_numerical_id', fallback="0")
+    results.append(run_scenario("fetch_upcoming_reservations", server, iterations,
+                                lambda i: isinstance(reservation_poller.fetch_upcoming_reservations(equipment_id), list)))
+    poller = reservation_poller.ReservationPoller(equipment_id)
+    results.append(run_scenario("ReservationPoller.poll_once (conditional)", server, iterations,
+                                lambda i: poller.poll_once() or bool(poller.reservations)))
+    results.append(run_scenario("fetch_consumables", server, iterations, lambda i: bool(fetch_consumables(equipment_id))))
+    return results
+
+
+def print_report(results, server, args, stream=sys.stdout):
+    print(f"Mock API at {server.base_url}: latency {args.latency} ms, jitter +/-{args.jitter} ms, error rate {args.error_rate:.1%}", file=stream)
+    print(f"{'scenario':<44} {'calls':>6} {'fail':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}  requests", file=stream)
+    for result in results:
+        requests_made = ", ".join(f"{key}={value}" for key, value in sorted(result['requests'].items())) or "none"
+        print(f"{result['scenario']:<44} {result['calls']:>6} {result['failures']:>5} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f}"
+              f" {result['p99_ms']:>8.1f} {result['max_ms']:>8.1f}  {requests_made}", file=stream)
+    totals = server.counts()
+    print("Server request counts: " + ", ".join(f"{key}={value}" for key, value in sorted(totals.items())), file=stream)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the kiosk's network paths against a local mock API.")
+    parser.add_argument('--iterations', type=int, default=200, help="calls per scenario")
+    parser.add_argument('--members', type=int, default=50, help="distinct identifiers cycled through")
+    parser.add_argument('--latency', type=float, default=50, help="mock server latency per request, ms")
+    parser.add_argument('--jitter', type=float, default=10, help="+/- random latency, ms")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    server = MockServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate).start()
+    try:
+        with tempfile.TemporaryDirectory(prefix="kiosk-bench-") as workdir:
+            results = run_benchmarks(server, args.iterations, args.members, workdir)
+        print_report(results, server, args)
+    finally:
+        server.stop()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
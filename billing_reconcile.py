@@ -0,0 +1,260 @@
+"""Reconcile consumable usage in the session logs against what members said at the ending screen.
+
+Members pay for consumables themselves through the payment QR code, then
+press "I paid" (payment_submitted) or "Nothing Due" (nothing_due). This job
+streams the session logs (every rotated file, any row layout, see
+log_parsing) and follows each member through their sessions. Usage rows are
+priced against the cached materials catalog of the station's tool. The usage
+since a member's previous choice is settled by their next choice, or left
+unsettled when their next session starts without one. Memory use depends on
+the number of members, not the length of the history.
+
+Only the member's claim is logged, not an amount, so "paid" means the
+usage was followed by "I paid". Usage followed by "Nothing Due", or by no
+choice at all, counts as outstanding.
+
+Usage:
+    python billing_reconcile.py                          # the configured log and its rotated files
+    python billing_reconcile.py logs/ --since 2026-01-01  # every station's CSV logs under logs/
+    python billing_reconcile.py SessionLog.csv --format csv > outstanding.csv
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+
+import event_log
+import materials_cache
+from app_config import config
+from log_parsing import EventReader, log_files, member_key
+
+ZERO = Decimal('0')
+CHOICES = ('payment_submitted', 'nothing_due', 'not_me')
+RELEVANT = frozenset(('start', 'usage') + CHOICES)
+
+
+def parse_amount(text):
+    """Decimal from '5', '2.50' or '$1,250.00'; None when it is not a number."""
+    try:
+        return Decimal(str(text).replace('$', '').replace(',', '').strip())
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def normalize_unit(unit):
+    unit = (unit or "").strip().lower()
+    return unit[:-1] if unit.endswith('s') and len(unit) > 1 else unit
+
+
+def station_tools():
+    """Workstation id -> tool_numerical_id, from [Station] and every [Station:<name>] profile."""
+    tools = {config.get('Station', 'workstation_id', fallback=''): config.get('Station', 'tool_numerical_id', fallback="0")}
+    for section in config.sections():
+        if section.startswith('Station:'):
+            name = section[len('Station:'):].strip()
+            tools[config.get(section, 'workstation_id', fallback=name)] = config.get(section, 'tool_numerical_id', fallback="0")
+    return tools
+
+
+class PriceBook:
+    """Unit price for a usage row: the cached catalog material of the station's tool sold in the row's unit.
+
+    When a catalog has several materials in that unit at different prices
+    the row cannot be priced; `material` names the one to use instead.
+    Catalogs are read from materials_cache only, never fetched.
+    """
+
+    def __init__(self, tools, default_tool, material=None):
+        self.tools = tools
+        self.default_tool = default_tool
+        self.material = material.lower() if material else None
+        self.missing_catalogs = set()
+        self._prices = {}
+
+    def price(self, station, unit):
+        tool = self.tools.get(station, self.default_tool)
+        key = (tool, normalize_unit(unit))
+        if key not in self._prices:
+            self._prices[key] = self._lookup(*key)
+        return self._prices[key]
+
+    def _lookup(self, tool, unit):
+        catalog = materials_cache.cached_catalog(tool)
+        if catalog is None:
+            self.missing_catalogs.add(tool)
+            return None
+        if self.material:
+            candidates = [m for m in catalog if str(m.get('label', '')).lower() == self.material]
+        else:
+            candidates = [m for m in catalog if normalize_unit(m.get('unit')) == unit]
+        prices = {parse_amount(m.get('cost')) for m in candidates} - {None}
+        return prices.pop() if len(prices) == 1 else None
+
+
+class Account:
+    """One member's running totals."""
+
+    __slots__ = ('name', 'usage_rows', 'charged', 'paid', 'nothing_due', 'unsettled', 'unpriced', 'last_seen')
+
+    def __init__(self, name):
+        self.name = name
+        self.usage_rows = 0
+        self.charged = ZERO
+        self.paid = ZERO
+        self.nothing_due = ZERO   # Charged usage the member then marked "Nothing Due"
+        self.unsettled = ZERO     # Charged usage with no choice logged before the next session
+        self.unpriced = 0
+        self.last_seen = ""
+
+    @property
+    def outstanding(self):
+        return self.charged - self.paid
+
+    def as_dict(self):
+        return {
+            'member': self.name,
+            'usage_rows': self.usage_rows,
+            'charged': str(self.charged),
+            'paid': str(self.paid),
+            'nothing_due': str(self.nothing_due),
+            'unsettled': str(self.unsettled),
+            'outstanding': str(self.outstanding),
+            'unpriced_usage': self.unpriced,
+            'last_seen': self.last_seen,
+        }
+
+
+class Reconciler:
+    def __init__(self, prices, since=None, until=None):
+        self.prices = prices
+        self.since = since
+        self.until = until
+        self.accounts = {}
+        self.pending = {}   # (log directory, member) -> usage charged since the member's last choice
+        self.choices_without_usage = 0
+        self.bad_usage = 0
+
+    def _account(self, member, event):
+        account = self.accounts.get(member)
+        if account is None:
+            account = self.accounts[member] = Account(f"{event['first_name']} {event['last_name']}".strip())
+        account.last_seen = event['timestamp']
+        return account
+
+    def _settle(self, key, account, choice):
+        charge = self.pending.pop(key, None)
+        if charge is None:
+            if choice is not None:
+                self.choices_without_usage += 1
+            return
+        if choice == 'payment_submitted':
+            account.paid += charge
+        elif choice == 'nothing_due':
+            account.nothing_due += charge
+        else:
+            account.unsettled += charge
+
+    def add(self, event, source):
+        """Fold one event in. `source` groups events from one station's log stream (its directory)."""
+        action = event['action']
+        if action not in RELEVANT:
+            return
+        timestamp = event['timestamp']
+        if (self.since and timestamp < self.since) or (self.until and timestamp >= self.until):
+            return
+        member = member_key(event['first_name'], event['last_name'])
+        account = self._account(member, event)
+        key = (source, member)
+        if action == 'start':
+            self._settle(key, account, None)
+        elif action == 'usage':
+            quantity = parse_amount(event['usage'])
+            if quantity is None:
+                self.bad_usage += 1
+                return
+            account.usage_rows += 1
+            price = self.prices.price(event['station'], event['usage_unit'])
+            if price is None:
+                account.unpriced += 1
+                self.pending.setdefault(key, ZERO)
+                return
+            charge = quantity * price
+            account.charged += charge
+            self.pending[key] = self.pending.get(key, ZERO) + charge
+        else:
+            # "Not me" means someone else ended the session; the member never made a choice
+            self._settle(key, account, None if action == 'not_me' else action)
+
+    def finish(self):
+        """Leave usage with no choice logged as unsettled."""
+        for (source, member), charge in list(self.pending.items()):
+            self._settle((source, member), self.accounts[member], None)
+
+    def outstanding(self, include_settled=False):
+        accounts = [account for account in self.accounts.values()
+                    if include_settled or account.outstanding > 0 or account.unpriced]
+        return sorted(accounts, key=lambda account: (-account.outstanding, account.name))
+
+
+def print_table(accounts):
+    print(f"{'Member':<28} {'Usage':>5} {'Charged':>10} {'Paid':>10} {'Nothing due':>11} {'Unsettled':>10} {'Outstanding':>11} {'Unpriced':>8}")
+    for account in accounts:
+        print(f"{account.name[:28]:<28} {account.usage_rows:>5} {account.charged:>10.2f} {account.paid:>10.2f} "
+              f"{account.nothing_due:>11.2f} {account.unsettled:>10.2f} {account.outstanding:>11.2f} {account.unpriced:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-member outstanding consumable charges from the session logs.")
+    parser.add_argument('paths', nargs='*', help="log files or directories (default: [Logging] log_file_path and its rotated files)")
+    parser.add_argument('--since', help="YYYY-MM-DD[ HH:MM:SS]")
+    parser.add_argument('--until', help="YYYY-MM-DD[ HH:MM:SS]")
+    parser.add_argument('--text', action='store_true', help="read .txt logs in directories instead of .csv")
+    parser.add_argument('--tool', help="tool_numerical_id for stations not in config.ini (default: [Station] tool_numerical_id)")
+    parser.add_argument('--material', help="catalog label to price all usage with")
+    parser.add_argument('--all', action='store_true', help="list members with nothing outstanding too")
+    parser.add_argument('--format', choices=('table', 'csv', 'json'), default='table')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    paths = args.paths or [event_log.csv_path_for(event_log.resolve_log_path())]
+    files = log_files(paths, '.txt' if args.text else '.csv')
+    prices = PriceBook(station_tools(), args.tool or config.get('Station', 'tool_numerical_id', fallback="0"), args.material)
+    reconciler = Reconciler(prices, args.since, args.until)
+    reader = EventReader(RELEVANT)
+    for path in files:
+        source = os.path.dirname(os.path.abspath(path))
+        for event, _ in reader.read(path):
+            reconciler.add(event, source)
+    reconciler.finish()
+
+    accounts = reconciler.outstanding(args.all)
+    if args.format == 'json':
+        json.dump([account.as_dict() for account in accounts], sys.stdout, indent=2)
+        print()
+    elif args.format == 'csv':
+        writer = csv.writer(sys.stdout)
+        writer.writerow(Account('').as_dict().keys())
+        for account in accounts:
+            writer.writerow(account.as_dict().values())
+    else:
+        print_table(accounts)
+
+    total = sum((account.outstanding for account in accounts), ZERO)
+    print(f"{len(files)} files, {reader.events} billing events ({reader.skipped} unreadable rows skipped), "
+          f"{len(accounts)} members, {total:.2f} outstanding ({(time.perf_counter() - started):.2f} s)", file=sys.stderr)
+    unpriced = sum(account.unpriced for account in reconciler.accounts.values())
+    if unpriced:
+        print(f"{unpriced} usage rows could not be priced; try --material", file=sys.stderr)
+    if prices.missing_catalogs:
+        print(f"No cached materials catalog for tool(s) {', '.join(sorted(prices.missing_catalogs))}; "
+              "open the ending screen once online to fetch it", file=sys.stderr)
+    if reconciler.bad_usage:
+        print(f"{reconciler.bad_usage} usage rows had no readable amount", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""Thin kiosk backend that hands access checks and session logging to the station daemon (station_daemon.py).
+
+Offers the parts of access_client the kiosk uses, so maker-light-auth.pyw can
+use either one. It never imports requests or opens a Drupal session itself.
+"""
+import atexit
+import datetime
+import json
+import os
+import queue
+import socket
+import threading
+import time
+
+import timing_spans
+from app_config import config
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Same wording as access_client, which this module deliberately does not import
+FAILED_TO_CONTACT = "Failed to contact server or access denied."
+
+permission_id = config.get('Login', 'permission_id')
+workstation_id = config.get('Station', 'workstation_id')
+# Which [Station:<name>] profile of the daemon this kiosk is
+station = config.get('Daemon', 'station', fallback='') or workstation_id
+socket_path = config.get('Daemon', 'socket_path', fallback='maker-light-auth.sock')
+if not os.path.isabs(socket_path):
+    socket_path = os.path.join(script_dir, socket_path)
+
+# Kept for the kiosk's debug box; the daemon does the lookups, so nothing is queued here
+debug_messages = queue.Queue()
+
+
+def call(op, timeout=30, **fields):
+    """Send one request and return its result. A fresh connection per call, so a slow lookup never holds up logging."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(dict(fields, op=op, station=station)).encode('utf-8') + b"\n")
+        with sock.makefile('rb') as reply_file:
+            line = reply_file.readline()
+    if not line:
+        raise ConnectionError("station daemon closed the connection")
+    reply = json.loads(line)
+    if not reply.get('ok'):
+        raise RuntimeError(reply.get('error', "station daemon error"))
+    return reply['result']
+
+
+def warm_up():
+    """Check that the daemon is up and serves this station."""
+    try:
+        stations = call('ping', timeout=5)['stations']
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Station daemon not reachable at {socket_path}: {e}")
+        return
+    if station not in stations:
+        print(f"Station daemon does not serve station {station!r} (it serves {', '.join(stations)})")
+
+
+def resolve_access(identifier, trace=None):
+    """Same contract as access_client.resolve_access, answered by the daemon."""
+    try:
+        with timing_spans.activate(trace), timing_spans.span('daemon_roundtrip'):
+            reply = call('resolve_access', identifier=identifier)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Station daemon lookup failed: {e}")
+        return {'granted': False, 'message': FAILED_TO_CONTACT, 'data': None}
+    if trace is not None:
+        # The daemon's own stage timings, so the kiosk's histogram still shows where the time went
+        for name, seconds in reply.get('spans', {}).items():
+            trace.add(name, seconds)
+        trace.mark('resolved')
+    return reply['access']
+
+
+# Events waiting for the daemon, sent in order by one background thread so the UI never waits on the socket
+_outgoing = queue.Queue()
+_sender = None
+_sender_lock = threading.Lock()
+_daemon_down_until = 0.0
+DOWN_BACKOFF = 30  # Seconds to log locally after the daemon failed to take an event
+
+
+def log_event(action, user_info=None, log_file_path=None, graylog_fields=None, **fields):
+    """event_log remote hook: queue the event for the daemon and return True at once.
+
+    The sender thread falls back to the local files (and Graylog) for any
+    event the daemon does not take, so nothing is lost.
+    """
+    fields.setdefault('timestamp', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    _start_sender()
+    _outgoing.put((action, user_info or {}, log_file_path, graylog_fields, fields))
+    return True
+
+
+def _start_sender():
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            _sender = threading.Thread(target=_send_events, name="daemon-log-sender", daemon=True)
+            _sender.start()
+            atexit.register(flush, 5)
+
+
+def _send_events():
+    global _daemon_down_until
+    while True:
+        action, user_info, log_file_path, graylog_fields, fields = _outgoing.get()
+        try:
+            if time.monotonic() < _daemon_down_until:
+                _log_locally(action, user_info, log_file_path, graylog_fields, fields)
+                continue
+            try:
+                call('log_event', timeout=5, action=action, user_info=user_info, fields=fields, graylog_fields=graylog_fields)
+            except (OSError, ValueError, RuntimeError) as e:
+                print(f"Station daemon did not take the {action} event, logging locally for {DOWN_BACKOFF}s: {e}")
+                _daemon_down_until = time.monotonic() + DOWN_BACKOFF
+                _log_locally(action, user_info, log_file_path, graylog_fields, fields)
+        except Exception as e:
+            print(f"Could not log the {action} event: {e}")
+        finally:
+            _outgoing.task_done()
+
+
+def _log_locally(action, user_info, log_file_path, graylog_fields, fields):
+    import event_log
+    event_log.get_event_log(log_file_path).log(action, user_info, **fields)
+    if graylog_fields is not None:
+        from graylog_logging import get_graylog_logger, log_user_action
+        graylog_logger = get_graylog_logger()
+        if graylog_logger:
+            log_user_action(action, user_info, graylog_logger, extra_fields=graylog_fields)
+
+
+def flush(timeout=None):
+    """Wait (up to `timeout` seconds) until every queued event was sent or logged locally."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while _outgoing.unfinished_tasks:
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        time.sleep(0.05)
+    return True
@@ -1,10 +1,6 @@
-import httpx
 from loguru import logger
-import configparser
-
-# Load configuration from a file
-config = configparser.ConfigParser()
-config.read('config.txt')
+import http_transport
+from app_config import config
 
 LOGIN_URL = config.get('Login', 'login_url')
 USERNAME = config.get('Login', 'username')
@@ -15,16 +11,8 @@ TEST_URL = config.get('Login', 'test_url')
 logger.add("debug.log", format="{time} {level} {message}", level="DEBUG")
 
 def login_and_test():
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_3) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) "
-            "Chrome/44.0.2403.155 Safari/537.36"
-        ),
-        "Cache-Control": "no-cache",
-    }
-
-    with httpx.Client(headers=headers, follow_redirects=True) as client:
+    # Same pool, protocol and headers as the kiosk itself
+    with http_transport.new_client({"Cache-Control": "no-cache"}) as client:
         # Attempt to login
         login_response = client.post(
             LOGIN_URL,
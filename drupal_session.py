@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+from http.cookiejar import Cookie
+import http_policy
+import http_transport
+import timing_spans
+
+# Responses that mean the Drupal session cookie is no longer accepted
+AUTH_FAILURE_CODES = (401, 403)
+
+
+def saved_cookie(record):
+    """A cookie jar entry from a record written by DrupalSession.save()."""
+    domain = record.get('domain', '')
+    return Cookie(
+        version=0, name=record['name'], value=record['value'], port=None, port_specified=False,
+        domain=domain, domain_specified=bool(domain), domain_initial_dot=domain.startswith('.'),
+        path=record.get('path', '/'), path_specified=True, secure=record.get('secure', False),
+        expires=record.get('expires'), discard=False, comment=None, comment_url=None, rest={},
+    )
+
+
+class DrupalSession:
+    """Logged-in httpx client for the workstation account that survives restarts and heals itself.
+
+    The cookie jar is saved to disk together with an expiry, so a restarted
+    kiosk reuses the existing login. A 401/403 answer triggers one transparent
+    re-login and a single retry, and the keep-alive thread logs in again shortly
+    before the session lapses so a member's scan never has to wait for a login.
+    """
+
+    def __init__(self, login_url, username, password, cookie_path=None, max_age=3600, refresh_margin=300, headers=None):
+        self.login_url = login_url
+        self.username = username
+        self.password = password
+        self.cookie_path = cookie_path
+        self.max_age = max_age
+        self.refresh_margin = refresh_margin
+        self.headers = headers or {}
+
+        self.session = None
+        self.expires_at = 0
+        self._lock = threading.RLock()
+        self._keepalive_thread = None
+
+        self.logins = 0
+        self.relogins = 0
+
+        if self.cookie_path:
+            self.load()
+
+    def _new_session(self):
+        # Its own cookie jar on the shared connection pool, so a re-login keeps the warm connections
+        return http_transport.new_client(self.headers)
+
+    def is_valid(self):
+        return self.session is not None and time.time() < self.expires_at
+
+    def login(self):
+        """POST the login form. Returns True when the server accepted it."""
+        with self._lock:
+            session = self._new_session()
+            try:
+                with timing_spans.span('drupal_login'):
+                    response = http_policy.request("POST", self.login_url, 'login', session=session, data={"name": self.username, "pass": self.password, "form_id": "user_login", "op": "Log in",})
+            except http_transport.HTTPError as e:
+                print(f"Login failed: {e}")
+                return False
+            if response.status_code != 200:
+                print(f"Login failed with status code: {response.status_code}")
+                return False
+
+            self.session = session
+            self.expires_at = self._cookie_expiry(session)
+            self.logins += 1
+        self.save()
+        return True
+
+    def _cookie_expiry(self, session):
+        # Trust the cookie's own expiry when it is sooner than our configured lifetime
+        expires_at = time.time() + self.max_age
+        for cookie in session.cookies.jar:
+            if cookie.expires and cookie.expires < expires_at:
+                expires_at = cookie.expires
+        return expires_at
+
+    def ensure(self):
+        """Make sure there is a live session, logging in only if it is missing or expired."""
+        if self.is_valid():
+            return True
+        # Concurrent lookups wait for a single login instead of each posting the form
+        with self._lock:
+            if self.is_valid():
+                return True
+            return self.login()
+
+    def request(self, method, url, endpoint='api', **kwargs):
+        """Request with the logged-in session under the shared http_policy; on 401/403 log in again and retry once."""
+        if not self.ensure():
+            return None
+        response = http_policy.request(method, url, endpoint, session=self.session, **kwargs)
+        if response.status_code in AUTH_FAILURE_CODES:
+            self.relogins += 1
+            if self.login():
+                response = http_policy.request(method, url, endpoint, session=self.session, **kwargs)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def start_keepalive(self):
+        """Refresh the login in the background shortly before it lapses."""
+        if self._keepalive_thread is not None:
+            return
+
+        def keepalive():
+            while True:
+                wait = self.expires_at - self.refresh_margin - time.time()
+                if wait > 0:
+                    time.sleep(min(wait, 60))
+                    continue
+                if not self.login():
+                    # Server unreachable: try again in a minute, the scan path will still retry on its own
+                    time.sleep(60)
+
+        self._keepalive_thread = threading.Thread(target=keepalive, daemon=True)
+        self._keepalive_thread.start()
+
+    def load(self):
+        """Restore a saved cookie jar if it has not expired yet."""
+        if not os.path.exists(self.cookie_path):
+            return
+        try:
+            with open(self.cookie_path, 'r') as cookie_file:
+                stored = json.load(cookie_file)
+        except (OSError, ValueError) as e:
+            print(f"Could not read saved Drupal session {self.cookie_path}: {e}")
+            return
+
+        if stored.get('expires_at', 0) - self.refresh_margin <= time.time():
+            return
+        session = self._new_session()
+        for cookie in stored.get('cookies', []):
+            session.cookies.jar.set_cookie(saved_cookie(cookie))
+        self.session = session
+        self.expires_at = stored['expires_at']
+
+    def save(self):
+        """Write the cookie jar atomically, readable by the kiosk account only."""
+        if not self.cookie_path or self.session is None:
+            return
+        cookies = [
+            {'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path, 'secure': c.secure, 'expires': c.expires}
+            for c in self.session.cookies.jar
+        ]
+        temp_path = f"{self.cookie_path}.tmp"
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as cookie_file:
+                json.dump({'expires_at': self.expires_at, 'cookies': cookies}, cookie_file)
+            os.replace(temp_path, self.cookie_path)
+        except OSError as e:
+            print(f"Could not save Drupal session {self.cookie_path}: {e}")
@@ -1,71 +1,40 @@
+import startup_profile
 import tkinter as tk
 from tkinter import ttk, messagebox
 import webbrowser
-import requests
-from PIL import Image, ImageTk, ImageDraw
-import qrcode
-import configparser
-import os
-import subprocess
-import sys
-from datetime import datetime
-from io import BytesIO
-import csv
-import json
+import qr_service
+import event_log
+import threading
+import materials_cache
+from app_config import config
+from tk_worker import TkWorker
 window = None
+worker = None  # Loads catalogs and thumbnails off the Tk thread
 
-root = tk.Tk()
-root.withdraw()  # If you don't want the root window to be visible
 
-# Determine the directory of your script
-script_dir = os.path.dirname(os.path.abspath(__file__))
+# configuration values, re-read when config.ini changes so the next ending screen shows new messages
+@config.on_reload
+def load_settings():
+    global show_experience_scale, end_message, experience_question, high_label, low_label, tool_numerical_id
+    show_experience_scale = config.getboolean('EndingPage', 'show_experience_scale', fallback=False)
+    end_message = config.get('EndingPage', 'end_message', fallback="Thank you for using the station.")
+    experience_question = config.get('EndingPage', 'experience_question', fallback="How was your experience?")
+    high_label = config.get('EndingPage', 'high_label', fallback="Excellent")
+    low_label = config.get('EndingPage', 'low_label', fallback="Poor")
+    tool_numerical_id = config.get('Station', 'tool_numerical_id', fallback="0")
 
-# Build the path to the configuration file
-config_path = os.path.join(script_dir, 'config.ini')
 
-# Load configuration
-config = configparser.ConfigParser()
-config.read(config_path)
+load_settings()
+LOG_FILE_PATH = event_log.resolve_log_path()
 
-# configuration values 
-show_ending_window = config.getboolean('EndingPage', 'show_ending_window', fallback=False)
-show_experience_scale = config.getboolean('EndingPage', 'show_experience_scale', fallback=False)
-end_message = config.get('EndingPage', 'end_message', fallback="Please remember to clean up.")
-experience_question = config.get('EndingPage', 'experience_question', fallback="How was your experience?")
-high_label = config.get('EndingPage', 'high_label', fallback="Excellent")
-low_label = config.get('EndingPage', 'low_label', fallback="Poor")
-tool_numerical_id = config.get('Station', 'tool_numerical_id', fallback="0")
-end_message = config.get('EndingPage', 'end_message', fallback="Thank you for using the station.")
-LOG_FILE_PATH = os.path.join(script_dir, 'SessionLog.txt')  # Adjust the filename as necessary
-CSV_LOG_FILE_PATH = config.get('Logging', 'csv_log_file_path', fallback=os.path.join(os.path.dirname(os.path.abspath(__file__)), "SessionLog.csv"))
 
-def initialize_csv_log_file():
-    if not os.path.exists(CSV_LOG_FILE_PATH):
-        with open(CSV_LOG_FILE_PATH, 'w', newline='') as csvfile:
-            csvwriter = csv.writer(csvfile)
-            csvwriter.writerow(["Timestamp", "Action", "First Name", "Last Name", "Permission", "Station", "Duration","Rating", "Details"])
-
-initialize_csv_log_file()
-
-
-def restart_authentication():
-    # Close the current Tkinter window if it exists
-    global window
+def finish_ending(action, user_info, on_done):
+    """Log the member's closing choice, close the ending screen and hand back to the kiosk flow."""
+    log_event(action, "", user_info)
     if window is not None:
-        try:
-            window.destroy()
-        except tk.TclError as e:
-            print(f"Error closing window: {e}")
-    
-    # Restart the authentication process by running maker-light-auth.py script
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    script_path = os.path.join(script_dir, "maker-light-auth.pyw")
-    
-    # Use subprocess to run the script in a new process
-    subprocess.Popen([sys.executable, script_path])
-    
-    # Exit the current script to ensure there's no unintended code execution following this function
-    sys.exit()
+        safe_destroy(window)
+    if on_done is not None:
+        on_done()
 
 def safe_destroy(window):
     """Safely destroy a Tkinter window."""
@@ -84,29 +53,18 @@ def open_url_new_window(url):
         print(f"Failed to open URL in a new browser window: {e}")
 
 def log_event_with_comments(action, rating, comments, user_info=None):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     first_name = user_info.get('first_name', 'Unknown') if user_info else 'Unknown'
     last_name = user_info.get('last_name', 'Unknown') if user_info else 'Unknown'
-    # Prepare the CSV log entry with comments
-    log_entry_csv = [timestamp, action, first_name, last_name, "", "", "", rating, comments]
-    # Prepare the text log entry with comments
-    log_entry_text = f"{timestamp} - {action} - {first_name} {last_name}: Rating: {rating}, Comments: {comments}\n"
-
-    # Write to CSV file
-    with open(CSV_LOG_FILE_PATH, 'a', newline='') as csvfile:
-        csvwriter = csv.writer(csvfile)
-        csvwriter.writerow(log_entry_csv)
-
-    # Write to text file
-    with open(LOG_FILE_PATH, 'a') as log_file:
-        log_file.write(log_entry_text)
+    event_log.log_event(action, user_info, LOG_FILE_PATH, rating=rating, comments=comments,
+                        text=f"{action} - {first_name} {last_name}: Rating: {rating}, Comments: {comments}")
 
 
-def show_ending_window(end_message, show_experience_scale, tool_numerical_id, experience_question, high_label, low_label, user_info):
-    global window
+def show_ending_window(end_message, show_experience_scale, tool_numerical_id, experience_question, high_label, low_label, user_info, master=None, on_done=None, tk_worker=None):
+    global window, worker
     if window:  # If there's an existing window, safely destroy it
         safe_destroy(window)
-    window = tk.Toplevel(root)  # Use Toplevel instead of Tk
+    window = tk.Toplevel(master)  # Use Toplevel instead of Tk
+    worker = tk_worker or worker or TkWorker(master or window)
     window.title("Session Ended")
     window.attributes("-topmost", True)  # Ensure the window stays on top
 
@@ -168,33 +126,32 @@ def show_ending_window(end_message, show_experience_scale, tool_numerical_id, ex
 
     consumables_frame = tk.LabelFrame(consumables_frame_outer, text="Materials for purchase", font=("Helvetica", 14))
     consumables_frame.pack(fill="both", expand=True)
-    # Assuming a two-column layout for materials
-    column_count = 2  # Number of columns
-    materials = fetch_consumables(tool_numerical_id)
-    for index, material in enumerate(materials):
-        label = f"{material['label']} - {material['unit']} - ${material['cost']}"
-        row = index // column_count
-        column = index % column_count
-
-        # Create a button for each material
-        button = ttk.Button(
-            consumables_frame,
-            text=label,
-            style="Material.TButton",
-            command=lambda m=material: open_payment_link(m),
-        )
-        button.grid(row=row, column=column, padx=5, pady=5, sticky="ew")
-        print(f"Created button for: {label}")  # Debugging output
-
+    # Use the catalog prefetched during the session; revalidate it in the background for next time
+    materials = materials_cache.cached_catalog(tool_numerical_id)
+    if materials is None:
+        # Not cached yet: fetch it on the worker and fill the frame when it arrives
+        loading_label = tk.Label(consumables_frame, text="Loading materials...", font=("Helvetica", 12))
+        loading_label.grid(row=0, column=0, padx=5, pady=5)
+
+        def show_fetched(fetched):
+            if consumables_frame.winfo_exists():
+                loading_label.destroy()
+                show_materials(consumables_frame, fetched)
+
+        def show_unavailable(error):
+            print(f"Failed to fetch materials: {error}")
+            if consumables_frame.winfo_exists():
+                loading_label.config(text="Materials are unavailable right now.")
+
+        worker.submit(fetch_consumables, tool_numerical_id, on_done=show_fetched, on_error=show_unavailable)
+    else:
+        show_materials(consumables_frame, materials)
+        threading.Thread(target=materials_cache.prefetch, args=(tool_numerical_id,), daemon=True).start()
 
     # Apply a style to make the text bigger
     style = ttk.Style()
     style.configure("Material.TButton", font=("Helvetica", 14))
 
-    # Configure columns to equally share the frame
-    for i in range(column_count):
-        consumables_frame.grid_columnconfigure(i, weight=1)
-
 
 
 
@@ -207,113 +164,113 @@ def show_ending_window(end_message, show_experience_scale, tool_numerical_id, ex
     button_frame.pack(expand=True)
 
     # Less prominent button for "left open by someone else"
-    btn_left_open = tk.Button(button_frame, text="Not me (reset to login)", command=lambda: [log_event("not_me", "", user_info), safe_destroy(window), restart_authentication()], bg="#add8e6", fg="black", font=("Helvetica", 12))
+    btn_left_open = tk.Button(button_frame, text="Not me (reset to login)", command=lambda: finish_ending("not_me", user_info, on_done), bg="#add8e6", fg="black", font=("Helvetica", 12))
     btn_left_open.pack(side=tk.BOTTOM, pady=(10, 0))  # Positioned at the bottom, less emphasis
 
     # Primary actions with more emphasis
-    btn_no_charges = tk.Button(button_frame, text="Nothing Due", command=lambda: [log_event("nothing_due", "", user_info), safe_destroy(window), restart_authentication()], bg="#add8e6", fg="black", font=("Helvetica", 12))
+    btn_no_charges = tk.Button(button_frame, text="Nothing Due", command=lambda: finish_ending("nothing_due", user_info, on_done), bg="#add8e6", fg="black", font=("Helvetica", 12))
     btn_no_charges.pack(side=tk.LEFT, padx=10, expand=True)
 
-    btn_submitted_payments = tk.Button(button_frame, text="I paid", command=lambda: [log_event("payment_submitted", "", user_info), safe_destroy(window), restart_authentication()], bg="#98fb98", fg="black", font=("Helvetica", 12))
+    btn_submitted_payments = tk.Button(button_frame, text="I paid", command=lambda: finish_ending("payment_submitted", user_info, on_done), bg="#98fb98", fg="black", font=("Helvetica", 12))
     btn_submitted_payments.pack(side=tk.RIGHT, padx=10, expand=True)
 
-    
-    window.mainloop()
+
+def show_materials(consumables_frame, materials):
+    # Assuming a two-column layout for materials
+    column_count = 2  # Number of columns
+    for index, material in enumerate(materials):
+        label = f"{material['label']} - {material['unit']} - ${material['cost']}"
+        row = index // column_count
+        column = index % column_count
+
+        # Create a button for each material
+        button = ttk.Button(
+            consumables_frame,
+            text=label,
+            style="Material.TButton",
+            command=lambda m=material: open_payment_link(m),
+        )
+        button.grid(row=row, column=column, padx=5, pady=5, sticky="ew")
+        print(f"Created button for: {label}")  # Debugging output
+
+    # Configure columns to equally share the frame
+    for i in range(column_count):
+        consumables_frame.grid_columnconfigure(i, weight=1)
+
+
+def run_ending_screen(master, user_info, on_done, tk_worker=None):
+    """Ending screen of the kiosk flow, built from the [EndingPage] settings."""
+    show_ending_window(end_message, show_experience_scale, tool_numerical_id, experience_question, high_label, low_label, user_info or {}, master=master, on_done=on_done, tk_worker=tk_worker)
 
 
 def open_payment_link(material):
     print(f"Button clicked for material: {material}")  # Debugging
-    detail_window = tk.Toplevel()
+    detail_window = tk.Toplevel(window)
     detail_window.title(material['label'])
     detail_window.attributes("-topmost", True)
 
-    # Parse and display the material image if available
-    try:
-        # Extract `src` from `material['image']` (example contains an HTML snippet)
-        image_src = material['image'].split('src="')[1].split('"')[0]
-        image_url = f"https://www.makehaven.org{image_src}"  # Append domain if relative
-        image_response = requests.get(image_url, stream=True)
-        image_response.raw.decode_content = True
-        material_image = Image.open(image_response.raw)
-
-        # Resize the image
-        base_height = 100
-        img_ratio = base_height / float(material_image.size[1])
-        new_width = int((float(material_image.size[0]) * float(img_ratio)))
-        material_image = material_image.resize((new_width, base_height), Image.LANCZOS)
-
-        photo_image = ImageTk.PhotoImage(material_image)
-        img_label = tk.Label(detail_window, image=photo_image)
-        img_label.image = photo_image
-        img_label.pack(pady=10)
-    except Exception as e:
-        print(f"Failed to load image: {e}")
-
-    # Generate and display QR Code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(material['purchase'])
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color='black', back_color='white').convert('RGB')
-
-    qr_img_resized = qr_img.resize((100, 100), Image.LANCZOS)
-    qr_photo = ImageTk.PhotoImage(image=qr_img_resized)
+    # Display the payment QR code; it is rendered once per price and then served from the QR cache
+    qr_photo = qr_service.qr_photo(material['purchase'], 100, 'L', version=material['cost'])
     qr_label = tk.Label(detail_window, image=qr_photo)
     qr_label.image = qr_photo
     qr_label.pack(pady=10)
 
+    def show_image(thumbnail_path):
+        # Above the QR code, from the thumbnail cache (already resized to display size)
+        if not thumbnail_path or not detail_window.winfo_exists():
+            return
+        try:
+            photo_image = tk.PhotoImage(file=thumbnail_path)
+        except tk.TclError as e:
+            print(f"Failed to load image: {e}")
+            return
+        img_label = tk.Label(detail_window, image=photo_image)
+        img_label.image = photo_image
+        img_label.pack(pady=10, before=qr_label)
+
+    # Display the material image if available; a missing thumbnail is fetched on the worker and shown when it arrives
+    image_url = materials_cache.material_image_url(material)
+    if image_url:
+        thumbnail_path = materials_cache.cached_thumbnail(image_url)
+        if thumbnail_path:
+            show_image(thumbnail_path)
+        else:
+            worker.submit(materials_cache.fetch_thumbnail, image_url, on_done=show_image,
+                          on_error=lambda e: print(f"Failed to load image: {e}"))
+
     # Display Material Info
     material_info = f"{material['label']}\nUnit: {material['unit']}\nPrice: ${material['cost']}"
     tk.Label(detail_window, text=material_info, font=("Helvetica", 12)).pack()
 
-    detail_window.mainloop()
-
 
 def log_event(action, rating, user_info=None):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     first_name = user_info.get('first_name', 'Unknown') if user_info else 'Unknown'
     last_name = user_info.get('last_name', 'Unknown') if user_info else 'Unknown'
-    # Prepare the CSV log entry
-    log_entry_csv = [timestamp, action, first_name, last_name," "," "," ", rating]
-    # Prepare the text log entry
-    log_entry_text = f"{timestamp} - {action} - {first_name} {last_name}: {rating}\n"
+    event_log.log_event(action, user_info, LOG_FILE_PATH, rating=rating,
+                        text=f"{action} - {first_name} {last_name}: {rating}")
 
-    # Write to CSV file
-    with open(CSV_LOG_FILE_PATH, 'a', newline='') as csvfile:
-        csvwriter = csv.writer(csvfile)
-        csvwriter.writerow(log_entry_csv)
+def fetch_consumables(tool_numerical_id):
+    # Revalidates the on-disk catalog; falls back to the cached copy when offline
+    return materials_cache.refresh_catalog(tool_numerical_id)
 
-    # Write to text file
-    with open(LOG_FILE_PATH, 'a') as log_file:
-        log_file.write(log_entry_text)
 
-def fetch_consumables(tool_numerical_id):
-    url = f"https://www.makehaven.org/api/v0/materials/equipment/{tool_numerical_id}"
-    response = requests.get(url)
-    if response.status_code == 200:
-        try:
-            data = response.json()
-            return data  # Return the JSON response directly
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON: {e}")
-            return []
-    else:
-        print(f"Error fetching materials: {response.status_code}")
-        return []
 
+def main():
+    # Standalone, for testing the ending screen on its own
+    root = tk.Tk()
+    root.withdraw()  # If you don't want the root window to be visible
+
+    user_info = {'first_name': 'Unknown', 'last_name': 'Unknown'}  # Default values
+    run_ending_screen(root, user_info, on_done=root.destroy)
+
+    def on_first_prompt():
+        root.update_idletasks()
+        startup_profile.first_prompt("ending_window.py", "ending screen shown")
+
+    root.after_idle(on_first_prompt)
+    root.mainloop()
 
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        user_info_path = sys.argv[1]
-        with open(user_info_path, 'r') as f:
-            user_info = json.load(f)
-        os.remove(user_info_path)  # Clean up the temporary file
-    else:
-        user_info = {'first_name': 'Unknown', 'last_name': 'Unknown'}  # Default values
+    main()
 
-    show_ending_window(end_message, show_experience_scale, tool_numerical_id, experience_question, high_label, low_label, user_info)
@@ -0,0 +1,260 @@
+import atexit
+import csv
+import datetime
+import io
+import os
+import queue
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from app_config import config
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# The one row layout every writer uses
+COLUMNS = ["Timestamp", "Action", "First Name", "Last Name", "Permission", "Station", "Duration", "Rating", "Comments", "Usage", "Usage Unit"]
+
+FSYNC_POLICIES = ('never', 'batch', 'always')
+
+
+def resolve_log_path(path=None):
+    """Session log path from config.ini, relative paths taken from the script directory."""
+    path = path or config.get('Logging', 'log_file_path', fallback="SessionLog.txt")
+    if not os.path.isabs(path):
+        path = os.path.normpath(os.path.join(script_dir, path))
+    return path
+
+
+def csv_path_for(log_file_path):
+    return os.path.splitext(log_file_path)[0] + '.csv'
+
+
+class _FileLock:
+    """Exclusive lock on a sidecar file, so several kiosk processes can append to the same logs."""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(self.fd, msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        os.close(self.fd)
+
+
+class EventLogWriter:
+    """Buffered writer for the session CSV and text logs.
+
+    `log()` only puts the event on a queue, so it never blocks the UI. A
+    background thread writes events in batches, one locked append per file per
+    batch, then flushes/fsyncs according to the configured policy and rotates
+    the files by size or by period. With fsync 'always' there is no batching:
+    each event is written and fsynced as soon as the thread takes it.
+    """
+
+    def __init__(self, log_file_path, flush_interval=1.0, batch_size=100, fsync='batch', max_bytes=0, rotate_interval='none'):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, not {fsync!r}")
+        self.text_path = log_file_path
+        self.csv_path = csv_path_for(log_file_path)
+        self.lock_path = self.csv_path + '.lock'
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+
+        self.listeners = []
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add_listener(self, listener):
+        """Call `listener(event)` on the writer thread for every event after it has been written."""
+        self.listeners.append(listener)
+
+    def log(self, action, user_info=None, duration="", rating="", comments="", usage="", usage_unit="", text=None, timestamp=None):
+        user_info = user_info or {}
+        timestamp = timestamp or datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        event = {
+            'timestamp': timestamp,
+            'action': action,
+            'first_name': user_info.get('first_name', 'Unknown'),
+            'last_name': user_info.get('last_name', 'Unknown'),
+            'permission': user_info.get('permission', ''),
+            'station': user_info.get('station', ''),
+            'duration': duration,
+            'rating': rating,
+            'comments': comments,
+            'usage': usage,
+            'usage_unit': usage_unit,
+        }
+        if text is None:
+            text = f"{action} - {event['first_name']} {event['last_name']}"
+            details = [f"{name}: {event[key]}" for name, key in (("Duration", 'duration'), ("Rating", 'rating'), ("Comments", 'comments'), ("Usage", 'usage')) if event[key] != ""]
+            if details:
+                text += ": " + ", ".join(details)
+        event['text'] = f"{timestamp} - {text}"
+        self._queue.put(event)
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                self._queue.task_done()
+                return
+            batch = [event]
+            # Give the batch a moment to fill before writing
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while self.fsync != 'always' and len(batch) < self.batch_size:
+                try:
+                    event = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if event is None:
+                    stop = True
+                    break
+                batch.append(event)
+            try:
+                self._write_batch(batch)
+            except OSError as e:
+                print(f"Failed to write session log: {e}")
+            for event in batch:
+                for listener in self.listeners:
+                    try:
+                        listener(event)
+                    except Exception as e:
+                        print(f"Session log listener failed: {e}")
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, batch):
+        csv_buffer = io.StringIO()
+        writer = csv.writer(csv_buffer)
+        for event in batch:
+            writer.writerow([event['timestamp'], event['action'], event['first_name'], event['last_name'], event['permission'], event['station'], event['duration'], event['rating'], event['comments'], event['usage'], event['usage_unit']])
+        text_block = "".join(event['text'] + "\n" for event in batch)
+
+        with _FileLock(self.lock_path):
+            self._rotate_if_needed()
+            self._append(self.csv_path, csv_buffer.getvalue(), header=True)
+            self._append(self.text_path, text_block)
+
+    def _append(self, path, data, header=False):
+        with open(path, 'a', newline='', encoding='utf-8') as f:
+            if header and f.tell() == 0:
+                header_buffer = io.StringIO()
+                csv.writer(header_buffer).writerow(COLUMNS)
+                data = header_buffer.getvalue() + data
+            f.write(data)
+            if self.fsync != 'never':
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _rotate_if_needed(self):
+        if not os.path.exists(self.csv_path):
+            return
+        reason = None
+        if self._has_legacy_header():
+            reason = "legacy"
+        elif self.max_bytes and os.path.getsize(self.csv_path) >= self.max_bytes:
+            reason = "size"
+        elif self.rotate_interval != 'none' and self._period(os.path.getmtime(self.csv_path)) != self._period(time.time()):
+            reason = "period"
+        if reason is None:
+            return
+
+        suffix = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        if reason == "legacy":
+            suffix = "legacy-" + suffix
+        for path in (self.csv_path, self.text_path):
+            if os.path.exists(path):
+                base, ext = os.path.splitext(path)
+                os.replace(path, f"{base}.{suffix}{ext}")
+
+    def _has_legacy_header(self):
+        # Files started by the old per-module writers have a 7, 8 or 9 column header
+        with open(self.csv_path, newline='', encoding='utf-8') as f:
+            first_row = next(csv.reader(f), None)
+        return first_row is not None and first_row != COLUMNS
+
+    def _period(self, timestamp):
+        moment = datetime.datetime.fromtimestamp(timestamp)
+        if self.rotate_interval == 'daily':
+            return moment.strftime('%Y-%m-%d')
+        if self.rotate_interval == 'weekly':
+            return moment.strftime('%G-%V')
+        if self.rotate_interval == 'monthly':
+            return moment.strftime('%Y-%m')
+        return None
+
+    def flush(self):
+        """Block until every queued event has been written."""
+        self._queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_event_log(log_file_path=None):
+    """The process-wide writer for a log file, created on first use from the [Logging] settings."""
+    path = resolve_log_path(log_file_path)
+    with _writers_lock:
+        if path not in _writers:
+            _writers[path] = EventLogWriter(
+                path,
+                flush_interval=config.getfloat('Logging', 'flush_interval', fallback=1.0),
+                fsync=config.get('Logging', 'fsync', fallback='batch'),
+                max_bytes=config.getint('Logging', 'rotate_max_bytes', fallback=0),
+                rotate_interval=config.get('Logging', 'rotate_interval', fallback='none'),
+            )
+        return _writers[path]
+
+
+_remote = None
+
+
+def set_remote(send):
+    """Hand every event to `send(action, user_info, log_file_path, **fields)` instead of the local files.
+
+    Used by thin kiosk clients of the station daemon. `send` must not block
+    (daemon_client queues the event for a sender thread). When it returns
+    False the event is written locally instead. Pass None to go back to
+    local writing.
+    """
+    global _remote
+    _remote = send
+
+
+def log_event(action, user_info=None, log_file_path=None, **fields):
+    """Queue one event for the session logs; returns immediately."""
+    if _remote is not None and _remote(action, user_info, log_file_path, **fields):
+        return
+    get_event_log(log_file_path).log(action, user_info, **fields)
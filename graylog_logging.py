@@ -1,30 +1,260 @@
 # graylog_logging.py
-import configparser
+import atexit
+import json
 import logging
-import graypy
-
-def get_graylog_logger(config_path='config.ini'):
-    # Load configuration
-    config = configparser.ConfigParser()
-    config.read(config_path)
-    
-    # Check if 'Graylog' section exists
-    if 'Graylog' not in config.sections():
-        print("Graylog section not found in the configuration.")
-        return None
-
-    graylog_host = config.get('Graylog', 'server_ip', fallback=None)
-    graylog_port = config.getint('Graylog', 'server_port', fallback=12201)
-    
-    if not graylog_host:  # Graylog is not set up
-        print("Graylog server IP not configured.")
-        return None
-
-    logger = logging.getLogger('graylog_logger')
-    logger.setLevel(logging.INFO)
-    handler = graypy.GELFUDPHandler(graylog_host, graylog_port)
-    logger.addHandler(handler)
-    return logger
+import logging.handlers
+import os
+import queue
+import socket
+import threading
+import time
+import zlib
+
+from app_config import AppConfig, config as shared_config
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Python logging levels mapped to the syslog levels GELF expects
+SYSLOG_LEVELS = {logging.CRITICAL: 2, logging.ERROR: 3, logging.WARNING: 4, logging.INFO: 6, logging.DEBUG: 7}
+
+# Attributes every LogRecord has; anything else was passed through `extra=` and becomes a GELF field
+_STANDARD_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'id'}
+
+
+def gelf_message(record, host):
+    """Build the GELF 1.1 dict for one log record."""
+    message = {
+        'version': '1.1',
+        'host': host,
+        'short_message': record.getMessage(),
+        'timestamp': record.created,
+        'level': SYSLOG_LEVELS.get(record.levelno, 6),
+        '_logger': record.name,
+    }
+    for key, value in record.__dict__.items():
+        if key in _STANDARD_RECORD_FIELDS or key.startswith('_'):
+            continue
+        message[f'_{key}'] = value if isinstance(value, (int, float)) else str(value)
+    return message
+
+
+class GelfShipper(logging.Handler):
+    """Sends GELF messages in batches over UDP or TCP, spooling to a bounded local file while Graylog is unreachable.
+
+    Runs behind a QueueListener, so none of this ever happens on the caller's thread.
+    The UDP socket is connected, so a Graylog host that refuses the port
+    (an ICMP error) fails the next send and starts spooling. A UDP message
+    that is silently dropped cannot be seen, so only TCP guarantees that
+    messages are spooled during every outage.
+    """
+
+    def __init__(self, host, port, protocol='udp', batch_size=50, flush_interval=2.0, spool_path=None, spool_max_bytes=5_000_000):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self.spool_max_bytes = spool_max_bytes
+        self.source = socket.gethostname()
+
+        self.buffer = []
+        self.sock = None
+        self.retry_at = 0
+        self.reconnect_delay = 1
+
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, name="graylog-flush", daemon=True)
+        self._flusher.start()
+
+    def emit(self, record):
+        try:
+            message = gelf_message(record, self.source)
+        except Exception:
+            self.handleError(record)
+            return
+        self.acquire()
+        try:
+            self.buffer.append(message)
+            if len(self.buffer) >= self.batch_size:
+                self._send_buffer()
+        finally:
+            self.release()
+
+    def flush(self):
+        self.acquire()
+        try:
+            self._send_buffer()
+        finally:
+            self.release()
+
+    def _flush_periodically(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def _send_buffer(self):
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+        if time.monotonic() < self.retry_at:
+            # Still backing off after a failure: keep the messages on disk instead
+            self._spool(batch)
+            return
+        try:
+            self._replay_spool()
+            self._send(batch)
+            self.reconnect_delay = 1
+        except OSError as e:
+            print(f"Graylog unreachable, spooling {len(batch)} messages: {e}")
+            self._close_socket()
+            self.retry_at = time.monotonic() + self.reconnect_delay
+            self.reconnect_delay = min(self.reconnect_delay * 2, 60)
+            self._spool(batch)
+
+    def _send(self, batch):
+        if self.protocol == 'tcp':
+            if self.sock is None:
+                self.sock = socket.create_connection((self.host, self.port), timeout=5)
+            # TCP GELF frames are null-terminated, so a whole batch goes out in one write
+            self.sock.sendall(b"".join(json.dumps(message).encode('utf-8') + b"\0" for message in batch))
+        else:
+            if self.sock is None:
+                self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                # Connected, so ICMP errors from the host surface as OSError on send
+                self.sock.connect((self.host, self.port))
+            for message in batch:
+                self.sock.send(zlib.compress(json.dumps(message).encode('utf-8')))
+
+    def _close_socket(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def _spool(self, batch):
+        if not self.spool_path:
+            return
+        try:
+            with open(self.spool_path, 'a', encoding='utf-8') as spool:
+                for message in batch:
+                    spool.write(json.dumps(message) + "\n")
+            if os.path.getsize(self.spool_path) > self.spool_max_bytes:
+                self._trim_spool()
+        except OSError as e:
+            print(f"Could not spool Graylog messages: {e}")
+
+    def _trim_spool(self):
+        # Keep the newest half so the spool stays bounded during long outages
+        with open(self.spool_path, 'r', encoding='utf-8') as spool:
+            lines = spool.readlines()
+        with open(self.spool_path, 'w', encoding='utf-8') as spool:
+            spool.writelines(lines[len(lines) // 2:])
+
+    def _replay_spool(self):
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return
+        with open(self.spool_path, 'r', encoding='utf-8') as spool:
+            spooled = [json.loads(line) for line in spool if line.strip()]
+        sent = 0
+        try:
+            for sent in range(0, len(spooled), self.batch_size):
+                self._send(spooled[sent:sent + self.batch_size])
+        except OSError:
+            # Keep only what was not delivered, so the next replay does not send anything twice
+            with open(self.spool_path, 'w', encoding='utf-8') as spool:
+                spool.writelines(json.dumps(message) + "\n" for message in spooled[sent:])
+            raise
+        os.remove(self.spool_path)
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+        self._close_socket()
+        super().close()
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops messages instead of blocking or erroring when the queue is full."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_lock = threading.Lock()
+_configured = False
+_logger = None
+_listener = None
+
+
+def get_graylog_logger(config_path=None):
+    """Return the process-wide Graylog logger, building it on first use; None when Graylog is not configured."""
+    global _configured, _logger, _listener
+    with _lock:
+        if _configured:
+            return _logger
+        _configured = True
+
+        # The shared config.ini next to this script, unless a test passes another file
+        config = AppConfig(config_path) if config_path else shared_config
+
+        # Check if 'Graylog' section exists
+        if 'Graylog' not in config.sections():
+            print("Graylog section not found in the configuration.")
+            return None
+        if not config.getboolean('Graylog', 'enabled', fallback=True):
+            return None
+
+        graylog_host = config.get('Graylog', 'server_ip', fallback=None)
+        graylog_port = config.getint('Graylog', 'server_port', fallback=12201)
+
+        if not graylog_host or graylog_host.startswith('#'):  # Graylog is not set up
+            print("Graylog server IP not configured.")
+            return None
+
+        spool_path = config.get('Graylog', 'spool_path', fallback='graylog_spool.jsonl')
+        if spool_path and not os.path.isabs(spool_path):
+            spool_path = os.path.join(script_dir, spool_path)
+        shipper = GelfShipper(
+            graylog_host,
+            graylog_port,
+            protocol=config.get('Graylog', 'protocol', fallback='udp').lower(),
+            batch_size=config.getint('Graylog', 'batch_size', fallback=50),
+            flush_interval=config.getfloat('Graylog', 'flush_interval', fallback=2.0),
+            spool_path=spool_path or None,
+            spool_max_bytes=config.getint('Graylog', 'spool_max_bytes', fallback=5_000_000),
+        )
+
+        log_queue = queue.Queue(maxsize=config.getint('Graylog', 'queue_size', fallback=10000))
+        logger = logging.getLogger('graylog_logger')
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.handlers.clear()
+        logger.addHandler(DroppingQueueHandler(log_queue))
+
+        _listener = logging.handlers.QueueListener(log_queue, shipper)
+        _listener.start()
+        atexit.register(shutdown)
+        _logger = logger
+        return logger
+
+
+def shutdown():
+    """Drain the queue and send whatever is still buffered."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
 
 def log_user_action(action, user_info, graylog_logger=None, extra_fields=None):
     if graylog_logger:
@@ -39,5 +269,6 @@ def log_user_action(action, user_info, graylog_logger=None, extra_fields=None):
         # Update log message with any additional fields provided
         if extra_fields:
             log_message.update(extra_fields)
-        
-        graylog_logger.info(f'User action: {action}', extra=log_message)
\ No newline at end of file
+
+        # Only enqueues; formatting and sending happen on the listener thread
+        graylog_logger.info(f'User action: {action}', extra=log_message)
@@ -0,0 +1,260 @@
+"""Shared request policy for every HTTP call: deadlines, adaptive read timeouts, a circuit breaker and hedging.
+
+Every call names its endpoint (permission, user_info, login, reservations,
+materials, image, ...). Each endpoint has a connect deadline and a read
+timeout ceiling. Once latencies have been observed, the read timeout
+tightens to the smoothed latency plus four deviations (as TCP does for
+retransmits), never below min_read_timeout, and doubles after a timeout
+until a call succeeds again.
+
+A circuit breaker per host and endpoint class opens after breaker_failures
+connection errors, timeouts or 5xx answers in a row. Member lookups
+(permission, user_info, login) have their own breaker, so a failing image or
+materials endpoint never makes a badge scan fail fast. While it is open, calls fail at once with
+CircuitOpenError, an httpx.ConnectError, so every caller's existing error
+path (permission cache, cached catalog, offline logging) takes over. After
+breaker_reset seconds a single trial call is let through.
+
+Requests are sent on the shared pool from http_transport.
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import httpx
+
+import http_transport
+from app_config import config
+
+# Read timeout ceilings in seconds; [HTTP] <endpoint>_timeout overrides them
+READ_TIMEOUTS = {
+    'permission': 10,
+    'user_info': 10,
+    'login': 20,
+    'reservations': 20,
+    'materials': 20,
+    'material': 20,
+    'image': 30,
+    'snapshot': 60,
+    'outbox': 30,
+}
+DEFAULT_READ_TIMEOUT = 30
+
+# Endpoints that share a circuit breaker on a host; any other endpoint has a breaker of its own
+BREAKER_CLASSES = {
+    'permission': 'access',
+    'user_info': 'access',
+    'login': 'access',
+    'materials': 'catalog',
+    'material': 'catalog',
+    'image': 'catalog',
+}
+
+
+def load_settings():
+    global connect_timeout, min_read_timeout, adaptive, breaker_failures, breaker_reset, hedge_after_min
+    connect_timeout = config.getfloat('HTTP', 'connect_timeout', fallback=3.05)
+    min_read_timeout = config.getfloat('HTTP', 'min_read_timeout', fallback=1.0)
+    adaptive = config.getboolean('HTTP', 'adaptive_timeouts', fallback=True)
+    breaker_failures = config.getint('HTTP', 'breaker_failures', fallback=3)
+    breaker_reset = config.getfloat('HTTP', 'breaker_reset', fallback=30)
+    hedge_after_min = config.getfloat('HTTP', 'hedge_after_min', fallback=0.3)
+
+
+load_settings()
+
+
+class CircuitOpenError(httpx.ConnectError):
+    """Raised instead of calling a host whose circuit breaker is open."""
+
+
+class LatencyEstimator:
+    """Smoothed latency and its deviation for one endpoint (RFC 6298 weights)."""
+
+    def __init__(self, ceiling):
+        self.ceiling = ceiling
+        self.srtt = None
+        self.rttvar = None
+        self.samples = 0
+        self.backoff = 1
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples += 1
+            self.backoff = 1
+            if self.srtt is None:
+                self.srtt, self.rttvar = seconds, seconds / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - seconds)
+                self.srtt = 0.875 * self.srtt + 0.125 * seconds
+
+    def timed_out(self):
+        # Double the timeout until a call succeeds again, so a server that got slower is not cut off for good
+        with self._lock:
+            self.backoff = min(self.backoff * 2, 64)
+
+    def read_timeout(self):
+        if not adaptive or self.srtt is None:
+            return self.ceiling
+        return min(self.ceiling, max(min_read_timeout, self.srtt + 4 * self.rttvar) * self.backoff)
+
+    def hedge_after(self):
+        """How long to wait before sending a second copy of a request: past the usual latency, not past the timeout."""
+        if self.srtt is None:
+            return max(hedge_after_min, self.ceiling / 4)
+        return min(self.read_timeout(), max(hedge_after_min, self.srtt + 2 * self.rttvar))
+
+
+class CircuitBreaker:
+    """closed -> open after `failures` failures in a row -> half_open after `reset` seconds -> closed on a success."""
+
+    def __init__(self, failures=3, reset=30):
+        self.failures = failures
+        self.reset = reset
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.consecutive_failures = 0
+            self._trial_running = False
+
+    def failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_running = False
+            if self.state == 'half_open' or self.consecutive_failures >= self.failures:
+                if self.state != 'open':
+                    print(f"Circuit breaker open after {self.consecutive_failures} failures; failing fast for {self.reset:.0f}s")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+_estimators = {}
+_breakers = {}
+_registry_lock = threading.Lock()
+
+
+def read_timeout_ceiling(endpoint):
+    return config.getfloat('HTTP', f'{endpoint}_timeout', fallback=READ_TIMEOUTS.get(endpoint, DEFAULT_READ_TIMEOUT))
+
+
+def estimator(endpoint):
+    with _registry_lock:
+        if endpoint not in _estimators:
+            _estimators[endpoint] = LatencyEstimator(read_timeout_ceiling(endpoint))
+        return _estimators[endpoint]
+
+
+@config.on_reload
+def apply_reloaded_settings():
+    load_settings()
+    with _registry_lock:
+        for endpoint, latency in _estimators.items():
+            latency.ceiling = read_timeout_ceiling(endpoint)
+        for circuit in _breakers.values():
+            circuit.failures, circuit.reset = breaker_failures, breaker_reset
+
+
+def breaker(url, endpoint):
+    key = (urlsplit(url).netloc, BREAKER_CLASSES.get(endpoint, endpoint))
+    with _registry_lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(breaker_failures, breaker_reset)
+        return _breakers[key]
+
+
+def timeout_for(endpoint):
+    """(connect, read) deadline for the next call to `endpoint`."""
+    return (connect_timeout, estimator(endpoint).read_timeout())
+
+
+def request(method, url, endpoint, session=None, **kwargs):
+    """Send one request under the policy. `session` is an httpx client with cookies, or None for the shared client."""
+    circuit = breaker(url, endpoint)
+    if not circuit.allow():
+        raise CircuitOpenError(f"{urlsplit(url).netloc} is failing; not calling {endpoint}")
+    latency = estimator(endpoint)
+    kwargs.setdefault('timeout', http_transport.timeout(*timeout_for(endpoint)))
+    started = time.monotonic()
+    try:
+        response = (session or http_transport.client()).request(method, url, **kwargs)
+    except httpx.TimeoutException:
+        latency.timed_out()
+        circuit.failure()
+        raise
+    except httpx.TransportError:
+        circuit.failure()
+        raise
+    latency.record(time.monotonic() - started)
+    if response.status_code >= 500:
+        circuit.failure()
+    else:
+        circuit.success()
+    return response
+
+
+def get(url, endpoint, session=None, **kwargs):
+    return request("GET", url, endpoint, session=session, **kwargs)
+
+
+# Threads for hedged calls; an abandoned copy finishes (bounded by its timeout) in the background
+_hedge_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hedge")
+
+
+def hedged(fn, endpoint, second=None):
+    """Call `fn()`, and if it is still running after the usual latency for `endpoint`, a second copy; the first non-None result wins.
+
+    `fn` must be safe to run twice (a read) and return None on failure. The
+    second copy runs `second` instead when given (e.g. without timing spans).
+    """
+    first = _hedge_pool.submit(fn)
+    done, _ = wait([first], timeout=estimator(endpoint).hedge_after())
+    if done:
+        # A quick failure is an answer, not slowness; the caller's error path handles it
+        return first.result()
+    pending = {first, _hedge_pool.submit(second or fn)}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.result() is not None:
+                return future.result()
+    return None
+
+
+def stats():
+    """Adaptive timeouts and breaker states, for the debug box and the station daemon."""
+    with _registry_lock:
+        estimators = dict(_estimators)
+        breakers = dict(_breakers)
+    return {
+        'timeouts': {name: round(latency.read_timeout(), 2) for name, latency in estimators.items()},
+        'breakers': {f"{host} {kind}": circuit.state for (host, kind), circuit in breakers.items()},
+        'http2': http_transport.http2_enabled,
+    }
+
+
+def reset():
+    """Forget learned latencies and breaker states (benchmarks start every scenario from scratch)."""
+    with _registry_lock:
+        _estimators.clear()
+        _breakers.clear()
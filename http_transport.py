@@ -0,0 +1,81 @@
+"""One pooled httpx transport for every HTTP call the kiosk makes.
+
+All clients share a single connection pool, so calls to makehaven.org reuse
+warm connections, DNS answers and TLS sessions, whichever module makes them.
+HTTP/2 is used when the h2 package is installed; without it the pool speaks
+HTTP/1.1 keep-alive. `client()` is the shared client for anonymous calls
+(reservations, materials, images). `new_client()` gives a client with its
+own cookie jar on the same pool, for the logged-in Drupal session.
+
+Requests go through http_policy for deadlines and circuit breaking; callers
+catch `HTTPError`.
+"""
+import importlib.util
+import threading
+
+import httpx
+
+from app_config import config
+
+# What callers catch: connection errors, timeouts, open breakers and raise_for_status()
+HTTPError = httpx.HTTPError
+
+_lock = threading.Lock()
+_client_lock = threading.Lock()  # Separate: building the client takes _lock for the pool
+_transport = None
+_client = None
+http2_enabled = None  # Set when the pool is created
+
+
+def default_headers():
+    """Honest headers for every request; [HTTP] user_agent overrides the User-Agent."""
+    workstation_id = config.get('Station', 'workstation_id', fallback='')
+    user_agent = config.get('HTTP', 'user_agent', fallback='') or f"maker-light-auth/{workstation_id or 'kiosk'} httpx/{httpx.__version__}"
+    return {"User-Agent": user_agent, "Accept": "application/json, */*;q=0.5"}
+
+
+def http2_available():
+    return importlib.util.find_spec('h2') is not None
+
+
+def transport():
+    """The shared connection pool, created on first use."""
+    global _transport, http2_enabled
+    with _lock:
+        if _transport is None:
+            http2 = config.getboolean('HTTP', 'http2', fallback=True)
+            if http2 and not http2_available():
+                print("HTTP/2 unavailable (pip install h2); using HTTP/1.1 keep-alive")
+                http2 = False
+            limits = httpx.Limits(
+                max_connections=config.getint('HTTP', 'max_connections', fallback=20),
+                max_keepalive_connections=config.getint('HTTP', 'max_keepalive', fallback=10),
+                keepalive_expiry=config.getfloat('HTTP', 'keepalive_expiry', fallback=60),
+            )
+            _transport = httpx.HTTPTransport(http2=http2, limits=limits)
+            http2_enabled = http2
+        return _transport
+
+
+def new_client(headers=None):
+    """A client with its own cookies and headers on the shared pool."""
+    client_headers = default_headers()
+    client_headers.update(headers or {})
+    # http_policy sets each request's deadlines; redirects are followed as the login form needs
+    return httpx.Client(transport=transport(), headers=client_headers, follow_redirects=True, timeout=30)
+
+
+def client():
+    """The shared client for calls that need no login."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = new_client()
+    return _client
+
+
+def timeout(connect, read):
+    """An httpx timeout from http_policy's (connect, read) deadlines."""
+    return httpx.Timeout(read, connect=connect, pool=connect)
+
@@ -0,0 +1,54 @@
+LOGIN = "login"
+TIMER = "timer"
+USAGE = "usage"
+ENDING = "ending"
+
+
+class KioskFlow:
+    """State machine that drives the kiosk screens inside one long-lived Tk process.
+
+    Each screen is registered as a function taking `user_info`. A screen calls
+    `advance()` when it is finished and the flow moves on to the next screen:
+    login -> timer -> usage -> ending -> login, skipping the screens that are
+    turned off in config.ini. `user_info` is handed from screen to screen in
+    memory instead of through a temporary JSON file.
+    """
+
+    def __init__(self, root, enable_timer=True, require_usage_input=False, show_ending_window=True):
+        self.root = root
+        self.enable_timer = enable_timer
+        self.require_usage_input = require_usage_input
+        self.show_ending_window = show_ending_window
+        self.screens = {}
+        self.state = None
+        self.user_info = None
+
+    def register(self, state, enter):
+        self.screens[state] = enter
+
+    def next_state(self):
+        if self.state == LOGIN:
+            return TIMER if self.enable_timer else LOGIN
+        if self.state == TIMER:
+            if not self.show_ending_window:
+                return LOGIN
+            return USAGE if self.require_usage_input else ENDING
+        if self.state == USAGE:
+            return ENDING
+        return LOGIN
+
+    def go(self, state, user_info=None):
+        if user_info is not None:
+            self.user_info = user_info
+        if state == LOGIN:
+            # A new member cycle starts with no user attached
+            self.user_info = None
+        self.state = state
+        # Enter the next screen from the event loop so the previous screen's callback can unwind first
+        self.root.after_idle(lambda: self.screens[state](self.user_info))
+
+    def advance(self, user_info=None):
+        self.go(self.next_state(), user_info)
+
+    def start(self, state=LOGIN, user_info=None):
+        self.go(state, user_info)
@@ -0,0 +1,220 @@
+"""Streaming readers for the session logs, tolerant of every row layout the kiosk has written.
+
+Events come out one at a time as the same dicts event_log writes (timestamp,
+action, first_name, last_name, permission, station, duration, rating,
+comments, usage, usage_unit), so a year of logs is read in constant memory.
+CSV rows are recognised by column count: the current 11-column layout, the
+7-column session rows and the 8/9-column rows of the old ending and usage
+screens. Plain-text lines ("<timestamp> - <text>") are matched against the
+messages each screen writes. Rows that fit none of them are skipped and
+counted, never fatal.
+"""
+import csv
+import glob
+import os
+import re
+
+FIELDS = ('timestamp', 'action', 'first_name', 'last_name', 'permission', 'station',
+          'duration', 'rating', 'comments', 'usage', 'usage_unit')
+
+_TIMESTAMP = re.compile(r'\d{4}-\d\d-\d\d \d\d:\d\d:\d\d')
+# SessionLog.20261018-101500.csv, SessionLog.legacy-20261018-101500.csv
+_ROTATED_SUFFIX = re.compile(r'\.(?:legacy-)?(\d{8}-\d{6})$')
+
+_TEXT_PATTERNS = [
+    ('session', re.compile(r'Session (start|end) for (\S+) ?(.*?)(?: after (\S+(?: days?, \S+)?))?\.$')),
+    ('usage', re.compile(r'Usage - (\S+) ?(.*?): (\S+) ?(.*)$')),
+    ('comments', re.compile(r'(\w+) - (\S+) ?(.*?): Rating: (.*?), Comments: (.*)$')),
+    ('details', re.compile(r'(\w+) - (\S+) ?(.*?)(?:: (.*))?$')),
+]
+_DETAIL = re.compile(r'(Duration|Rating|Comments|Usage): ')
+
+
+def member_key(first_name, last_name):
+    """Members are identified by name in the logs; normalise it so queries are case-insensitive."""
+    return f"{first_name or ''} {last_name or ''}".strip().lower()
+
+
+def parse_duration(text):
+    """Seconds from a str(timedelta) value such as '1:02:03' or '1 day, 0:00:05', or None."""
+    if not text:
+        return None
+    text = str(text).strip()
+    days = 0
+    if 'day' in text:
+        day_part, text = text.split(',', 1)
+        days = int(day_part.split()[0])
+        text = text.strip()
+    try:
+        hours, minutes, seconds = text.split(':')
+        return days * 86400 + int(hours) * 3600 + int(minutes) * 60 + int(float(seconds))
+    except ValueError:
+        return None
+
+
+def is_timestamp(text):
+    return _TIMESTAMP.fullmatch(text) is not None
+
+
+def _event(timestamp, action, first_name, last_name, **fields):
+    event = dict.fromkeys(FIELDS, "")
+    event.update(fields, timestamp=timestamp, action=action.strip().lower(),
+                 first_name=first_name.strip(), last_name=last_name.strip())
+    return event
+
+
+_PADDING = [[""] * (len(FIELDS) - n) for n in range(len(FIELDS))]
+
+
+def parse_csv_row(row):
+    """One CSV row as an event, or None for headers and rows in no known layout."""
+    count = len(row)
+    if count < 4 or _TIMESTAMP.fullmatch(row[0]) is None:
+        return None
+    if count == len(FIELDS):
+        # The current layout, and nearly every row: built directly, this is the hot loop of a long history
+        return {'timestamp': row[0], 'action': row[1].strip().lower(), 'first_name': row[2], 'last_name': row[3],
+                'permission': row[4], 'station': row[5], 'duration': row[6], 'rating': row[7],
+                'comments': row[8], 'usage': row[9], 'usage_unit': row[10]}
+    # Older layouts padded empty cells with spaces
+    cells = [cell.strip() for cell in row] + _PADDING[count] if count < len(FIELDS) else row
+    event = dict(zip(FIELDS, cells))
+    event['action'] = cells[1].lower()
+    if count == 9 and event['action'] == 'usage':
+        # Old usage screen: [ts, "Usage", first, last, permission, station, "", usage, unit]
+        event.update(rating="", comments="", usage=cells[7], usage_unit=cells[8])
+    return event
+
+
+def parse_text_line(line):
+    """One plain-text log line as an event, or None."""
+    timestamp, sep, text = line.rstrip('\r\n').partition(' - ')
+    if not sep or not is_timestamp(timestamp):
+        return None
+    for kind, pattern in _TEXT_PATTERNS:
+        match = pattern.match(text)
+        if match is None:
+            continue
+        if kind == 'session':
+            action, first_name, last_name, duration = match.groups()
+            return _event(timestamp, action, first_name, last_name, duration=duration or "")
+        if kind == 'usage':
+            first_name, last_name, usage, unit = match.groups()
+            return _event(timestamp, 'usage', first_name, last_name, usage=usage, usage_unit=unit)
+        if kind == 'comments':
+            action, first_name, last_name, rating, comments = match.groups()
+            return _event(timestamp, action, first_name, last_name, rating=rating, comments=comments)
+        action, first_name, last_name, details = match.groups()
+        event = _event(timestamp, action, first_name, last_name)
+        if details:
+            parts = _DETAIL.split(details)
+            if len(parts) == 1:
+                event['rating'] = details.strip()  # Old ending screen: "<action> - F L: <rating>"
+            for name, value in zip(parts[1::2], parts[2::2]):
+                event[name.lower()] = value.strip().rstrip(',')
+        return event
+    return None
+
+
+def iter_records(path, offset=0):
+    """(record, end offset) for each complete record from byte `offset` on.
+
+    A record is a CSV row for .csv files and a line otherwise. A last line
+    without its newline is still being written and is left for the next run,
+    so the returned offsets are always safe places to resume from.
+    """
+    with open(path, 'rb') as log_file:
+        log_file.seek(offset)
+        position = offset
+
+        def lines():
+            nonlocal position
+            for raw in log_file:
+                if not raw.endswith(b'\n'):
+                    return
+                position += len(raw)
+                yield raw.decode('utf-8', 'replace')
+
+        if not path.endswith('.csv'):
+            for line in lines():
+                yield line, position
+            return
+        # csv.reader pulls lines only as far as the row it returns, so `position` is that row's end
+        reader = csv.reader(lines())
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                print(f"Skipping unreadable row in {path} near byte {position}: {e}")
+                continue
+            yield row, position
+
+
+def _is_filler(record):
+    # Headers and blank lines are expected in every file; anything else unparsed is worth counting
+    if isinstance(record, str):
+        return not record.strip()
+    return not any(record) or record[0] == 'Timestamp'
+
+
+class EventReader:
+    """Parses log files into events, counting what it had to skip.
+
+    `actions` (lower-case names) keeps only those events; CSV rows for other
+    actions are dropped before they are parsed, which is most of the work.
+    """
+
+    def __init__(self, actions=None):
+        self.actions = frozenset(actions) if actions else None
+        self.events = 0
+        self.skipped = 0
+
+    def read(self, path, offset=0):
+        """(event, end offset) for every event in `path` from byte `offset` on."""
+        is_csv = path.endswith('.csv')
+        parse = parse_csv_row if is_csv else parse_text_line
+        actions = self.actions
+        for record, position in iter_records(path, offset):
+            if actions is not None and is_csv and len(record) > 1 and record[1].strip().lower() not in actions:
+                continue
+            event = parse(record)
+            if event is None:
+                if not _is_filler(record):
+                    self.skipped += 1
+                continue
+            if actions is not None and event['action'] not in actions:
+                continue
+            self.events += 1
+            yield event, position
+
+
+def rotated_key(path):
+    """Sort key putting rotated logs in the order they were written, the live log last."""
+    match = _ROTATED_SUFFIX.search(os.path.splitext(path)[0])
+    return (0, match.group(1)) if match else (1, "")
+
+
+def log_files(paths, extension='.csv'):
+    """Files to read for `paths`, oldest first within each directory.
+
+    Files are taken as given, except that a live log path also brings its
+    rotated siblings. Directories are searched recursively for `extension`
+    files (one directory per station when logs are collected centrally).
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, subdirectories, files in os.walk(path):
+                subdirectories.sort()
+                names = [os.path.join(directory, name) for name in files if name.endswith(extension)]
+                found.extend(sorted(names, key=rotated_key))
+            continue
+        base, ext = os.path.splitext(path)
+        if ext in ('.csv', '.txt') and not _ROTATED_SUFFIX.search(base):
+            siblings = glob.glob(f"{glob.escape(base)}.*{ext}")
+            found.extend(sorted((p for p in siblings if _ROTATED_SUFFIX.search(os.path.splitext(p)[0])), key=rotated_key))
+        if os.path.exists(path):
+            found.append(path)
+    return found
@@ -1,188 +1,201 @@
-import requests
+import startup_profile
 import tkinter as tk
-from tkinter import ttk, simpledialog, messagebox
+from tkinter import ttk
 from session_timer import SessionTimerWindow
+from kiosk_flow import KioskFlow, LOGIN, TIMER, USAGE, ENDING
 import datetime
 import os
-import csv
-import configparser
-from loguru import logger
-import json
-import uuid
-from graylog_logging import get_graylog_logger, log_user_action
-
-# Load configuration
-config = configparser.ConfigParser()
-config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini')
-config.read(config_path)
+import queue
+import event_log
+import reader_input
+import timing_spans
+from session_journal import SessionJournal
+from tk_worker import TkWorker
+from app_config import config
+
+# Everything that pulls in httpx, sqlite3, PIL or qrcode (access_client, reservation_poller,
+# session_store, outbox, usage_input, ending_window, materials_cache, qr_service) is imported
+# where it is first needed, after the login prompt is on screen.
+startup_profile.mark("imports done")
 
 # Accessing Config Values
-login_url = config.get('Login', 'login_url')
-username = config.get('Login', 'username')
-password = config.get('Login', 'password')
 debug_mode = config.getboolean('DEFAULT', 'debug_mode', fallback=False)
-permission_id = config.get('Login', 'permission_id')
-workstation_id = config.get('Station', 'workstation_id')
-api_url_template = config.get('Login', 'api_url')  # Make sure 'API' section exists in your config file
 tool_numerical_id = config.get('Station', 'tool_numerical_id', fallback="0")
 
 # Determine log file paths based on configuration
 script_dir = os.path.dirname(os.path.abspath(__file__))  # Added for clarity
-log_file_name = "SessionLog.txt"  # This line seems to be missing in your script
-LOG_FILE_PATH = config.get('Logging', 'log_file_path', fallback=os.path.join(script_dir, log_file_name))
-CSV_LOG_FILE_PATH = LOG_FILE_PATH.replace('.txt', '.csv')
+LOG_FILE_PATH = event_log.resolve_log_path()
 
-def initialize_csv_log_file():
-    if not os.path.exists(CSV_LOG_FILE_PATH):
-        with open(CSV_LOG_FILE_PATH, 'w', newline='') as csvfile:
-            csvwriter = csv.writer(csvfile)
-            csvwriter.writerow(["Timestamp", "Action", "First Name", "Last Name", "Permission", "Station", "Duration"])
+# Thin-client mode: lookups and logging are done by the shared station daemon (station_daemon.py)
+use_daemon = config.getboolean('Daemon', 'use_daemon', fallback=False)
 
-# Initialize CSV log file after configuration and paths are set
-initialize_csv_log_file()
+# The open session survives a crash or reboot here, so the timer comes straight back on restart
+session_journal = SessionJournal()
+resume_max_age = config.getfloat('SessionTime', 'resume_max_hours', fallback=12) * 3600
 
-# GUI setup
-root = tk.Tk()
-root.attributes('-fullscreen', True)  # Keep the window in fullscreen mode
-root.attributes("-topmost", True)     # Make the window always stay on top
+# Built by main(); module-level so the screen callbacks below can reach them
+root = None
+debug_box = None
+worker = None
+message_label = None
+scan_entry = None
+flow = None
+event_outbox = None
 
-# Debug box setup based on configuration
-debug_mode = config.getboolean('DEFAULT', 'debug_mode', fallback=False)
-
-if debug_mode:
-    debug_box = tk.Text(root, height=10, width=100)
-    debug_box.pack(side="bottom")
 
 def add_debug_message(message):
     if debug_mode:
         debug_box.insert(tk.END, message + "\n")
         debug_box.see(tk.END)
 
-# Session for persistent login state
-session = requests.Session()
-
-# Function to clear existing reservations display before update
-def clear_frame(frame):
-    for widget in frame.winfo_children():
-        widget.destroy()
-    print("Cleared frame.")  # Debugging
+def access_backend():
+    """access_client, or its stand-in that asks the station daemon when [Daemon] use_daemon is on."""
+    if use_daemon:
+        import daemon_client
+        return daemon_client
+    import access_client
+    return access_client
+
+def drain_debug_messages():
+    access_client = access_backend()
+    # Debug output produced on worker threads is queued by access_client; show it from the UI thread
+    while not access_client.debug_messages.empty():
+        add_debug_message(access_client.debug_messages.get_nowait())
+
+def warm_up():
+    # Runs on the worker pool, so httpx and the Drupal session are loaded without holding up the prompt
+    access_backend().warm_up()
+
+def prewarm_for_reservation(identifiers):
+    # Runs on the pre-warming thread
+    import access_client
+    access_client.prewarm(identifiers)
+    access_client.add_debug_message(f"Pre-warmed for an upcoming reservation: {', '.join(identifiers) or 'session only'}")
+
+def post_outbox_batch(events):
+    import access_client
+    return access_client.post_outbox_batch(events)
+
+def start_session_store():
+    # Mirror session events into the indexed SQLite store (written on the event-log thread)
+    import session_store
+    session_store.attach(event_log.get_event_log(LOG_FILE_PATH))
+
+def start_outbox():
+    """Store-and-forward queue for events bound for the API, replayed in bulk when the server is reachable."""
+    global event_outbox
+    from outbox import open_outbox
+
+    event_outbox = open_outbox(post_outbox_batch)
+    event_outbox.forward_session_events(event_log.get_event_log(LOG_FILE_PATH))
+
+def reservation_label_text(reservation):
+    # Build label text with default values if keys are missing
+    return (
+        f"Asset: {reservation.get('asset', 'Unknown Asset')}\n"
+        f"Time: {reservation.get('range', 'Unknown Time')}\n"
+        f"User: {reservation.get('name', 'Unknown User')}\n"
+        f"Note: {reservation.get('note', 'No Notes')}\n"
+        f"Purpose: {reservation.get('purpose', 'No Purpose Specified')}\n"
+        f"Status: {reservation.get('status', 'Unknown Status')}\n"
+        "-----------------------"
+    )
 
 def display_upcoming_reservations(master_window, equipment_id):
     # Create a frame for displaying reservations
     reservations_frame = ttk.LabelFrame(master_window, text="Upcoming Reservations", padding="10")
     reservations_frame.pack(fill="both", expand=True, padx=20, pady=20)
 
-    def update_reservations_display():
-        # Clear existing content in the frame
-        clear_frame(reservations_frame)
-
-        # Fetch reservations data
-        reservations_data = fetch_upcoming_reservations(equipment_id)
-
-        print(f"Number of reservations to display: {len(reservations_data)}")  # Debugging
-
-        if reservations_data:
-            for index, reservation in enumerate(reservations_data):
-                print(f"Processing reservation {index}: {reservation}")  # Debugging
-                
-                # Build label text with default values if keys are missing
-                label_text = (
-                    f"Asset: {reservation.get('asset', 'Unknown Asset')}\n"
-                    f"Time: {reservation.get('range', 'Unknown Time')}\n"
-                    f"User: {reservation.get('name', 'Unknown User')}\n"
-                    f"Note: {reservation.get('note', 'No Notes')}\n"
-                    f"Purpose: {reservation.get('purpose', 'No Purpose Specified')}\n"
-                    f"Status: {reservation.get('status', 'Unknown Status')}\n"
-                    "-----------------------"
-                )
-
-                # Add the label to the frame
-                tk.Label(
+    min_interval = config.getint('Reservations', 'min_poll_interval', fallback=60)
+    poller = None
+    prewarmer = None
+    labels = {}  # label text -> Label currently shown, in display order
+    empty_label = tk.Label(reservations_frame, text="No upcoming reservations.", anchor="w", font=("Helvetica", 14))
+    empty_label.pack(fill='x')
+
+    def apply_reservations(reservations):
+        # Only touch the rows that changed instead of rebuilding every widget
+        wanted = [reservation_label_text(reservation) for reservation in reservations]
+        for text in list(labels):
+            if text not in wanted:
+                labels.pop(text).destroy()
+        for text in wanted:
+            if text not in labels:
+                labels[text] = tk.Label(
                     reservations_frame,
-                    text=label_text,
+                    text=text,
                     wraplength=1000,
                     anchor="w",
                     justify="left",
                     font=("Helvetica", 14)
-                ).pack(fill='x', pady=2)
+                )
+        # Re-pack only when the order on screen no longer matches
+        if list(labels) != wanted:
+            for text in wanted:
+                labels[text].pack_forget()
+            ordered = {}
+            for text in wanted:
+                labels[text].pack(fill='x', pady=2)
+                ordered[text] = labels[text]
+            labels.clear()
+            labels.update(ordered)
         else:
-            # Show a message if no reservations are available
-            tk.Label(
-                reservations_frame,
-                text="No upcoming reservations.",
-                anchor="w",
-                font=("Helvetica", 14)
-            ).pack(fill='x')
+            for text in wanted:
+                if not labels[text].winfo_manager():
+                    labels[text].pack(fill='x', pady=2)
 
-        # Schedule the next update in 60000 milliseconds (1 minute)
-        master_window.after(60000, update_reservations_display)
+        if wanted:
+            empty_label.pack_forget()
+        elif not empty_label.winfo_manager():
+            # Show a message if no reservations are available
+            empty_label.pack(fill='x')
+        if debug_mode:
+            add_debug_message(f"Reservations updated: {len(wanted)} shown (polls={poller.polls}, unchanged={poller.not_modified}, errors={poller.errors})")
+
+    def first_poll():
+        nonlocal poller, prewarmer
+        # Built on the worker pool, so httpx is imported off the UI thread
+        from reservation_poller import ReservationPoller
+        poller = ReservationPoller(
+            equipment_id,
+            min_interval=min_interval,
+            max_interval=config.getint('Reservations', 'max_poll_interval', fallback=900),
+        )
+        # Look up members with a reservation just before their slot (lookups are the daemon's job in thin-client mode)
+        if config.getboolean('Reservations', 'prewarm', fallback=False) and not use_daemon:
+            from reservation_prewarm import ReservationPrewarmer
+            prewarmer = ReservationPrewarmer(
+                prewarm_for_reservation,
+                window=config.getint('Reservations', 'prewarm_window_minutes', fallback=15) * 60,
+                lead=config.getint('Reservations', 'prewarm_lead', fallback=120),
+            )
+            prewarmer.start()
+        return poller.poll_once()
+
+    def on_polled(changed):
+        if changed:
+            apply_reservations(poller.reservations)
+        if prewarmer is not None:
+            prewarmer.update(poller.reservations)
+        schedule_poll()
+
+    def schedule_poll():
+        # The HTTP request runs on the worker pool; only the result handling comes back to the UI thread
+        poll = poller.poll_once if poller is not None else first_poll
+        delay_ms = int((poller.next_interval() if poller is not None else min_interval) * 1000)
+        master_window.after(delay_ms, lambda: worker.submit(poll, on_done=on_polled, on_error=lambda e: schedule_poll()))
 
     # Start the first update
-    update_reservations_display()
-
-def fetch_upcoming_reservations(equipment_id):
-    api_url = f"https://makehaven.org/api/v0/reservation/upcoming/equipment/{equipment_id}?nocache={uuid.uuid4()}"
-    headers = {
-        "User-Agent": "curl/7.68.0",  # Mimic curl's behavior
-        "Accept": "*/*",
-        "Cache-Control": "no-cache",  # Ensure fresh data
-    }
-    try:
-        response = requests.get(api_url, headers=headers)
-        
-        # Debugging: Print the raw response
-        print("Raw response text:", response.text)
-        
-        if response.status_code == 200:
-            # Attempt to parse the JSON
-            try:
-                data = response.json()
-                print("Parsed JSON data:", data)
-                print("Type of data:", type(data))
-                
-                # If the response is a dictionary, extract reservations if present
-                if isinstance(data, dict):
-                    reservations = data.get("reservations", [])
-                    print("Extracted reservations:", reservations)
-                    return reservations
-                
-                # If the response is already a list, return it directly
-                if isinstance(data, list):
-                    print("Data is a list, returning as is.")
-                    return data
-                
-                # Handle unexpected data formats
-                print("Unexpected data format:", data)
-                return []
-            
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON: {e}")
-                return []
-        else:
-            print(f"Error fetching reservation data: {response.status_code}")
-    except requests.RequestException as e:
-        print(f"Error fetching reservation data: {e}")
-    return []
-
-
+    worker.submit(first_poll, on_done=on_polled, on_error=lambda e: schedule_poll())
 
-def read_last_user_info():
-    """Reads and returns the last user's information from the temporary JSON file."""
-    temp_json_path = 'user_info_temp.json'  # Update the path as necessary
-    
-    if os.path.exists(temp_json_path):
-        try:
-            with open(temp_json_path, 'r') as json_file:
-                user_info = json.load(json_file)
-                return user_info
-        except json.JSONDecodeError as e:
-            print(f"Error reading or parsing the temporary user info file: {e}")
-    return None
+# Last member to start a session on this station, kept in memory for the login screen
+last_user_info = None
+last_user_label = None
 
 def display_last_user_info(master_window):
     """Displays the last user's information in the application's UI."""
-    last_user_info = read_last_user_info()
-    
+    global last_user_label
+
     if last_user_info:
         # Construct the display string using the info from last_user_info
         last_user_text = "Last User: {} {}".format(
@@ -191,164 +204,126 @@ def display_last_user_info(master_window):
     else:
         last_user_text = "Last User: None"
 
-    
-    # Create and pack a label in master_window to display the last user's information
-    last_user_label = tk.Label(master_window, text=last_user_text, font=("Helvetica", 14))
-    last_user_label.pack(pady=10)
+    # Create the label once, then just update its text on later visits to the login screen
+    if last_user_label is None:
+        last_user_label = tk.Label(master_window, text=last_user_text, font=("Helvetica", 14))
+        last_user_label.pack(pady=10)
+    else:
+        last_user_label.config(text=last_user_text)
 
 
 
 def update_message(message):
     message_label.config(text=message)
-    root.update()
     if debug_mode:
         add_debug_message(f"Updating message: {message}")
 
-# Global session for persistent login state
-session = None
-
-def login_to_drupal():
-    global session
-    session = requests.Session()
-    login_url = config.get('Login', 'login_url')
-    username = config.get('Login', 'username')
-    password = config.get('Login', 'password')
-
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_3) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/44.0.2403.155 Safari/537.36",
-        "cache-control": "private, max-age=0, no-cache",
-    }
-
-    session.headers.update(headers)
-
-    try:
-        response = session.post(login_url, data={"name": username, "pass": password, "form_id": "user_login", "op": "Log in",})
-        if response.status_code == 200:
-            return True
-    except Exception as e:
-        print(f"Login failed: {e}")
-    return False
-
-
-def request_access(identifier, is_email):
-    global session
-    if session is None:
-        if not login_to_drupal():
-            if debug_mode:
-                add_debug_message("Login failed. Please check credentials.")
-            return None
-
-    # Determine the endpoint based on the type of request (email or serial)
-    endpoint = "email" if is_email else "serial"
-
-    # Construct the API URL with additional parameters
-    api_url = api_url_template.format(endpoint=endpoint, identifier=identifier, permission_id=permission_id)
-    api_url += f"?source={workstation_id}&method=MakerAuth"
-
-    # Add headers
-    headers = {
-        "User-Agent": "curl/7.68.0",  # Mimic curl's User-Agent
-        "Accept": "*/*",              # Match curl's Accept header
-        "Cache-Control": "no-cache",  # Ensure fresh data
-    }
-
-    # Make the GET request
-    response = session.get(api_url, headers=headers)
-
-    # Debugging outputs
-    if debug_mode:
-        add_debug_message(f"Request URL: {api_url}")
-        add_debug_message(f"Response status code: {response.status_code}")
-        add_debug_message(f"Response headers: {response.headers}")
-        add_debug_message(f"Response text: {response.text}")
-        try:
-            response_data = response.json()
-            add_debug_message(f"Response JSON: {response_data}")
-        except ValueError:
-            add_debug_message("Response body could not be converted to JSON.")
-
-    return response
-
-
-def convert_to_hexadecimal(identifier, input_format):
-    add_debug_message(f"Converting identifier: {identifier} with input format: {input_format}")  # Debugging
-    if input_format == 'decimal':
-        try:
-            # Attempt conversion
-            converted = hex(int(identifier)).lstrip('0x').upper()
-            add_debug_message(f"Converted identifier: {converted}")  # Debugging
-            return converted
-        except ValueError as e:
-            # Log conversion error
-            add_debug_message(f"Error converting identifier: {e}")
-            return identifier.upper()  # Return the original identifier in upper case if conversion fails
-    else:
-        return identifier.upper()
 
+# Lookup for the most recent scan; a new scan supersedes it
+current_job = None
+# Stage timings of the scan being typed, started by its first keystroke
+current_trace = None
+# Repeats of the scan in flight, or of a fresh denial, are answered without another request
+scan_coalescer = reader_input.ScanCoalescer(config.getfloat('Reader', 'duplicate_window', fallback=3))
+# Codes framed by the serial reader thread, handled on the UI thread
+device_scans = queue.Queue()
 
-def handle_access(identifier):
+def submit_scan(raw, trace=None):
+    """Validate a scan and look it up, unless it is garbage or a repeat that already has an answer."""
     # Check if the input is the secret keyword 'exit' to close the application
-    if identifier.lower() == 'exit':  # Use lower() to make it case-insensitive
-        root.destroy()  # Close the application
+    if raw.strip().lower() == 'exit':  # Use lower() to make it case-insensitive
+        on_closing()  # Close the application
         return  # Exit the function early
-    
-    # Initial access request based on the identifier
-    response = request_access(identifier, "@" in identifier)
-    if response and response.status_code == 200:
-        data = response.json()
-
-        # If data is empty, it might be a former member, unrecognized account, or lack permission
-        if not data:
-            # Perform secondary API call to retrieve user information
-            user_info_response = request_user_info(identifier, "@" in identifier)
-            if user_info_response and user_info_response.status_code == 200:
-                user_data = user_info_response.json()
-
-                # Check if the secondary response contains user data
-                if user_data:
-                    # Process user information (for former members, current members, or unauthorized access)
-                    process_user_data(user_data, "Denied because account not recognized as in the system.")
-                else:
-                    # The API call was successful, but no user data was returned - unrecognized account
-                    update_message("Denied because account not recognized as in the system.")
-            else:
-                # Handle failed API call
-                update_message("Failed to contact server or access denied.")
-        else:
-            # Process successful access request based on the first API call
-            process_access_granted(data)
-    else:
-        # Handle failed initial API call or access denied without specific information
-        update_message("Failed to contact server or access denied.")
+
+    identifier = reader_input.normalize_scan(raw)
+    if identifier is None:
+        if debug_mode:
+            add_debug_message(f"Rejected scan {raw!r} (input format {reader_input.input_format})")
+        # A partial or doubled read must not hide the answer to a scan still being checked
+        if current_job is None:
+            update_message("Scan not recognized. Please scan your RFID tag again or enter your email.")
+            root.after(3000, lambda: capture_input(True))
+        return
+
+    duplicate = scan_coalescer.duplicate(identifier)
+    if duplicate is not None:
+        kind, result = duplicate
+        if debug_mode:
+            add_debug_message(f"Duplicate scan of {identifier} ({kind}); no request sent")
+        if kind == 'recent':
+            update_message(result['message'])
+            root.after(3000, lambda: capture_input(True))
+        return
+    handle_access(identifier, trace)
+
+def drain_device_scans():
+    while not device_scans.empty():
+        raw = device_scans.get_nowait()
+        # Reads while the member is already in a session (or being welcomed) are ignored
+        if flow.state == LOGIN and str(scan_entry['state']) == tk.NORMAL:
+            submit_scan(raw, timing_spans.Trace())
+
+def handle_access(identifier, trace=None):
+    global current_job
+    access_client = access_backend()
+
+    # Only the latest scan counts: drop the result of any lookup still in flight
+    if current_job is not None:
+        current_job.cancel()
+
+    # Show feedback at once; the permission and user-info lookups run on the worker pool
+    update_message("Checking…")
+    trace = trace or timing_spans.Trace()
+    scan_coalescer.started(identifier)
+    current_job = worker.submit(
+        access_client.resolve_access, identifier, trace,
+        on_done=lambda result: on_access_resolved(result, identifier, trace),
+        on_error=lambda error: on_access_failed(error, trace, identifier),
+    )
+
+def on_access_resolved(result, identifier=None, trace=None):
+    """Deliver a finished access decision on the UI thread."""
+    global current_job
+    access_client = access_backend()
+    current_job = None
+    # Remember denials for repeat scans; grants leave the login screen and errors deserve a fresh try
+    remembered = result if not result['granted'] and result['message'] != access_client.FAILED_TO_CONTACT else None
+    scan_coalescer.finished(identifier, remembered)
+    if trace is not None:
+        # Time between the worker finishing and the UI thread picking the result up
+        trace.add('result_dispatch', trace.since('resolved'))
+    if event_outbox is not None and identifier is not None:
+        event_outbox.enqueue('access_decision', {
+            'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'identifier': identifier,
+            'granted': result['granted'],
+            'message': result['message'],
+            'permission': access_client.permission_id,
+            'station': access_client.workstation_id,
+        })
+    if result['granted']:
+        # Process successful access request; the kiosk flow takes over from here
+        process_access_granted(result['data'], trace)
+        return
+    update_message(result['message'])
+    if trace is not None:
+        timing_spans.finish(trace)
 
     # Always allow retry regardless of the outcome
     root.after(3000, lambda: capture_input(True))
 
-def request_user_info(identifier, is_email):
-    """Function to make API call to retrieve user information by email or serial number."""
-    # Construct the API URL based on whether the identifier is an email or serial number
-    endpoint = "email" if is_email else "serial"
-    api_url = f"https://makehaven.org/api/v0/{endpoint}/{identifier}/user"
-
-    # Make the API request and return the response
-    return session.get(api_url)
-
-def process_user_data(user_data, default_message):
-    """Process user data from the API response to determine access denial reason."""
-    # Extract 'access' field from the first item in the response data
-    access_status = user_data[0].get('access', '').lower()
-    
-    if "denied" in access_status:
-        # User is a former member with inactive membership
-        update_message("Denied because membership is not active.")
-    elif "member" in access_status:
-        # User is a current member but may not have permission for this specific tool
-        update_message("Denied because does not have badge/permission for this tool.")
-    else:
-        # Default message for unexpected cases
-        update_message(default_message)
+def on_access_failed(error, trace=None, identifier=None):
+    global current_job
+    access_client = access_backend()
+    current_job = None
+    scan_coalescer.finished(identifier)
+    if trace is not None:
+        timing_spans.finish(trace)
+    print(f"Access lookup failed: {error}")
+    update_message(access_client.FAILED_TO_CONTACT)
+    root.after(3000, lambda: capture_input(True))
 
-def process_access_granted(data):
+def process_access_granted(data, trace=None):
     """Handle processing for users granted access."""
     user_info = {
         'first_name': data[0].get('first_name'),
@@ -357,128 +332,251 @@ def process_access_granted(data):
         'station': config.get('Station', 'workstation_id'),
     }
     update_message(f"Access Granted. Welcome, {user_info['first_name']} {user_info['last_name']}.")
-    write_user_data_to_temp_json(user_info)
-    root.after(1500, lambda: close_and_start_session(user_info))
-
-
-def close_and_start_session(user_info):
-    # Log the session start
-    log_session("start", user_info, LOG_FILE_PATH)
-    
-    # Close the authentication window
-    root.destroy()
-    
-    # Start the session timer window
-    start_user_session(user_info)
-
-def write_user_data_to_temp_json(user_info):
-    # Define a path for the temporary JSON file
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    temp_json_path = os.path.join(script_dir, 'temp_user_data.json')
-
-    # Write user data to the temporary JSON file
-    with open(temp_json_path, 'w') as json_file:
-        json.dump(user_info, json_file)
-
-    # Optionally, log that user data has been written
-    print(f"User data written to {temp_json_path}")  # or use logger.info() if you're using Loguru
+    # No further scans until the next member cycle
+    scan_entry.config(state=tk.DISABLED)
+    if trace is not None:
+        trace.mark('granted')
+    root.after(1500, lambda: close_and_start_session(user_info, trace))
+
+
+def close_and_start_session(user_info, trace=None):
+    global last_user_info
+    # Log the session start, with the scan's stage timings as Graylog fields
+    timing_fields = {}
+    if trace is not None:
+        trace.add('grant_handoff', trace.since('granted'))
+        trace.add('scan_to_session', trace.elapsed())
+        timing_fields = trace.fields()
+        timing_spans.finish(trace)
+    log_session("start", user_info, LOG_FILE_PATH, extra_fields=timing_fields)
+    last_user_info = user_info
+
+    # Hide the authentication screen and move on to the session screens
+    root.withdraw()
+    flow.advance(user_info)
+
+
+def show_login_screen(user_info=None):
+    """Login screen of the kiosk flow: bring the fullscreen prompt back and wait for the next scan."""
+    display_last_user_info(root)
+    message_label.config(text="Please scan your RFID tag or enter your email to start the session.")
+    scan_entry.config(state=tk.NORMAL)
+    root.deiconify()
+    root.attributes('-fullscreen', True)
+    root.attributes("-topmost", True)
+    root.after(100, capture_input)
+
+
+def start_session_timer(user_info):
+    # A journal entry at this point is a session that was running when the kiosk went down
+    open_session = session_journal.current()
+    if open_session is not None:
+        elapsed = session_journal.elapsed(open_session)
+    else:
+        session_journal.open(user_info)
+        elapsed = 0.0
 
+    def on_end(user_info):
+        # The end event is queued by now, so the session is complete
+        session_journal.close()
+        flow.advance(user_info)
 
-def start_user_session(user_info):
-    enable_timer = config.get('SessionTime', 'enable_timer_window', fallback='false').lower() == 'true'
-    if enable_timer:
-        # This will directly run the session timer window without threading
-        session_window = SessionTimerWindow(user_info, log_file_path=LOG_FILE_PATH)
-        session_window.run()
+    SessionTimerWindow(user_info, log_file_path=LOG_FILE_PATH, master=root, on_end=on_end, elapsed=elapsed)
+    # Warm the materials catalog, thumbnails and payment QR codes while the member works, so the ending screen opens instantly
+    if flow.show_ending_window:
+        worker.submit(prefetch_ending_assets)
 
-def initialize_log_file(log_file_path):
-    # Check if the log file exists
-    if not os.path.exists(log_file_path):
-        with open(log_file_path, 'w', newline='') as file:
-            writer = csv.writer(file)
-            # Updated headers
-            writer.writerow(["Timestamp", "Action", "First Name", "Last Name", "Permission", "Station", "Duration", "Rating", "Comments", "Usage", "Usage Unit"])
+def prefetch_ending_assets():
+    import materials_cache
+    import qr_service
+    materials = materials_cache.prefetch(tool_numerical_id)
+    qr_service.prefetch_material_qrs(materials)
 
 def log_session(action, user_info, log_file_path, extra_fields=None):
     timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    row = [
-        timestamp, 
-        action, 
-        user_info.get('first_name', 'Unknown'), 
-        user_info.get('last_name', 'User'), 
-        user_info.get('permission', 'N/A'),
-        user_info.get('station', 'N/A'),
-        ""  # Placeholder for Duration as it's empty for session start
-    ]
-    
-    # CSV logging
-    with open(log_file_path.replace('.txt', '.csv'), 'a', newline='') as csvfile:
-        csvwriter = csv.writer(csvfile)
-        csvwriter.writerow(row)
-    
-    # Plain text logging
-    with open(log_file_path, 'a') as logfile:
-        logfile.write(f"{timestamp} - Session {action} for {user_info.get('first_name', 'Unknown')} {user_info.get('last_name', 'User')}.\n")
+
+    text = f"Session {action} for {user_info.get('first_name', 'Unknown')} {user_info.get('last_name', 'User')}."
+    graylog_fields = {'timestamp': timestamp, **(extra_fields or {})}
+    if use_daemon:
+        # Queued for the daemon, which writes the logs and ships the Graylog event; its sender thread logs locally if the daemon is down
+        import daemon_client
+        daemon_client.log_event(action, user_info, log_file_path, timestamp=timestamp, text=text, graylog_fields=graylog_fields)
+        return
+
+    # CSV and plain text logging, written in the background by the shared event log
+    event_log.get_event_log(log_file_path).log(action, user_info, timestamp=timestamp, text=text)
     
-    # Graylog logging
-    graylog_logger = get_graylog_logger()  # Ensure get_graylog_logger() correctly handles config_path internally if needed
+    # Graylog logging (built once; each event is only queued here)
+    from graylog_logging import get_graylog_logger, log_user_action
+    graylog_logger = get_graylog_logger()
     if graylog_logger:
-        # Merge extra_fields with the core log data
-        log_data = {
-            'timestamp': timestamp,
-            'action': action,
-            'first_name': user_info.get('first_name', 'Unknown'),
-            'last_name': user_info.get('last_name', 'User'),
-            'permission': user_info.get('permission', 'N/A'),
-            'station': user_info.get('station', 'N/A'),
-            **(extra_fields or {})  # Unpack extra_fields if provided, otherwise use empty dict
-        }
-        log_user_action(action, log_data, graylog_logger)
-
-# Message label for instructions
-message_label = tk.Label(root, text="Please scan your RFID tag or enter your email to start the session.", font=("Helvetica", 24))
-message_label.pack(expand=True, fill=tk.X, pady=(50, 0))
+        log_user_action(action, user_info, graylog_logger, extra_fields=graylog_fields)
+
+def on_scan_key(event):
+    global current_trace
+    # Runs before the character is inserted, so an empty field means this is the first keystroke of a scan
+    if not scan_entry.get() and event.char and event.char.isprintable():
+        current_trace = timing_spans.Trace()
+
+def on_scan_entered(event=None):
+    global current_trace
+    input_value = scan_entry.get().strip()
+    scan_entry.delete(0, tk.END)
+    trace, current_trace = current_trace or timing_spans.Trace(), None
+    if input_value:
+        # From the first character to Enter: reader or typing speed
+        trace.add('input_capture', trace.elapsed())
+        submit_scan(input_value, trace)
+    else:
+        update_message("Please scan your RFID tag or enter your email.")
+
+def cancel_scan(event=None):
+    global current_job
+    if current_job is not None:
+        current_job.cancel()
+        current_job = None
+        scan_coalescer.finished(scan_coalescer.in_flight)
+        capture_input(True)
 
 # Input capture function
 def capture_input(retry=False):
-    def on_input_close():
-        if not input_received[0]:  # Re-prompt if input was not received
-            root.after(100, capture_input)
-    
-    input_received = [False]  # Use a list to modify it inside nested function
-    
-    while True:
-        input_value = simpledialog.askstring("Input", "Scan RFID Tag or Enter Email:", parent=root)
-        if input_value:
-            input_received[0] = True  # Mark that input was received
-            handle_access(input_value)  # Your existing logic to handle the access based on input
-            break
-        else:
-            messagebox.showerror("Input Required", "Please scan your RFID tag or enter your email.")
-            continue  # Ensure the loop continues until valid input is received
-    
-    root.protocol("WM_DELETE_WINDOW", on_input_close)  # Modify window closing behavior
-
-# Display reservations in the main window
-display_upcoming_reservations(root, tool_numerical_id)
-
-display_last_user_info(root)  # Display the last user's in 
-
-# Ensure the input dialog is displayed after a short delay to allow the main window to initialize
-root.after(100, capture_input)
-
-root.mainloop()
+    # Only prompt while the login screen is showing, and never over a newer scan still being checked
+    if flow.state != LOGIN or (retry and current_job is not None):
+        return
+    if retry:
+        message_label.config(text="Please scan your RFID tag or enter your email to start the session.")
+    scan_entry.focus_force()
 
 # Closing function
 def on_closing():
     if debug_mode:
         add_debug_message("Application closing.")
+    worker.shutdown()
     root.destroy()
 
-root.protocol("WM_DELETE_WINDOW", on_closing)
-
-# Start the application
-capture_input()
-
-# Main loop
-root.mainloop()
+def run_usage_screen(user_info):
+    import usage_input
+    usage_input.run_usage_input(root, user_info, on_done=flow.advance, tk_worker=worker)
+
+def run_ending_screen(user_info):
+    import ending_window
+    ending_window.run_ending_screen(root, user_info, on_done=flow.advance, tk_worker=worker)
+
+
+def resume_open_session():
+    """Bring back the timer of a session that was open when the kiosk stopped; True when one was resumed."""
+    global last_user_info
+    open_session = session_journal.current()
+    if open_session is None:
+        return False
+    user_info = open_session['user_info']
+    elapsed = session_journal.elapsed(open_session)
+    if not flow.enable_timer or elapsed > resume_max_age:
+        # Too old to still be running (or no timer to show it): close it so the log has no unpaired start
+        log_session("end", user_info, LOG_FILE_PATH, extra_fields={'resumed': False})
+        session_journal.close()
+        return False
+    last_user_info = user_info
+    add_debug_message(f"Resuming the session of {user_info.get('first_name')} {user_info.get('last_name')} after {elapsed:.3f}s")
+    root.withdraw()
+    flow.start(TIMER, user_info)
+    return True
+
+
+def start_background_services(reservations_area):
+    """Everything the first prompt does not need: login warm-up, SQLite mirrors, the outbox and reservations."""
+    # Log in (or restore the saved session) in the background so no scan has to wait for it
+    worker.submit(warm_up)
+    if debug_mode:
+        worker.add_poll_hook(drain_debug_messages)
+    # Pick up edits to config.ini (permission, messages, endpoints) without a restart
+    config.watch()
+    if use_daemon:
+        # Every screen's events go to the daemon's shared log pipeline (session store and outbox live there too)
+        import daemon_client
+        event_log.set_remote(daemon_client.log_event)
+    else:
+        if config.getboolean('SessionStore', 'enabled', fallback=False):
+            start_session_store()
+        if config.getboolean('Outbox', 'enabled', fallback=False):
+            start_outbox()
+    # Display reservations in the main window
+    display_upcoming_reservations(reservations_area, tool_numerical_id)
+    reader_device = config.get('Reader', 'device', fallback='')
+    if reader_device:
+        # Scans straight from the serial reader, alongside the keyboard-wedge entry
+        reader = reader_input.DeviceReader(
+            reader_device,
+            device_scans.put,
+            baud_rate=config.getint('Reader', 'baud_rate', fallback=9600),
+            frame_gap=config.getint('Reader', 'frame_gap_ms', fallback=50) / 1000.0,
+        )
+        reader.start()
+        worker.add_poll_hook(drain_device_scans)
+
+
+def main():
+    global root, debug_box, worker, message_label, scan_entry, flow
+
+    # GUI setup
+    root = tk.Tk()
+    root.attributes('-fullscreen', True)  # Keep the window in fullscreen mode
+    root.attributes("-topmost", True)     # Make the window always stay on top
+    startup_profile.mark("Tk root created")
+
+    # Debug box setup based on configuration
+    if debug_mode:
+        debug_box = tk.Text(root, height=10, width=100)
+        debug_box.pack(side="bottom")
+
+    # Network lookups run on this pool so the kiosk never freezes during an HTTP round trip
+    worker = TkWorker(root)
+
+    # Message label for instructions
+    message_label = tk.Label(root, text="Please scan your RFID tag or enter your email to start the session.", font=("Helvetica", 24))
+    message_label.pack(expand=True, fill=tk.X, pady=(50, 0))
+
+    # Scan input: an always-live entry field, so the next scan is accepted even while a lookup is in flight
+    input_frame = tk.Frame(root)
+    input_frame.pack(pady=(20, 0))
+    tk.Label(input_frame, text="Scan RFID Tag or Enter Email:", font=("Helvetica", 16)).pack(side=tk.LEFT, padx=(0, 10))
+    scan_entry = tk.Entry(input_frame, font=("Helvetica", 16), width=40)
+    scan_entry.pack(side=tk.LEFT)
+    scan_entry.bind("<Key>", on_scan_key)
+    scan_entry.bind("<Return>", on_scan_entered)
+    scan_entry.bind("<Escape>", cancel_scan)
+
+    # Reservations are filled in once the prompt is up; the slot keeps them above the last-user line
+    reservations_area = tk.Frame(root)
+    reservations_area.pack(fill="both", expand=True)
+
+    root.protocol("WM_DELETE_WINDOW", on_closing)
+
+    # One resident process drives every screen: login -> timer -> usage -> ending -> login
+    flow = KioskFlow(
+        root,
+        enable_timer=config.getboolean('SessionTime', 'enable_timer_window', fallback=False),
+        require_usage_input=config.getboolean('UsageInput', 'require_usage_input', fallback=False),
+        show_ending_window=config.getboolean('EndingPage', 'show_ending_window', fallback=True),
+    )
+    flow.register(LOGIN, show_login_screen)
+    flow.register(TIMER, start_session_timer)
+    flow.register(USAGE, run_usage_screen)
+    flow.register(ENDING, run_ending_screen)
+
+    def on_first_prompt():
+        root.update_idletasks()
+        startup_profile.first_prompt("maker-light-auth.pyw", "login prompt shown")
+        start_background_services(reservations_area)
+
+    # Start on the login screen once the main window has initialized, or straight back in a session cut short by a crash
+    resumed = resume_open_session()
+    if not resumed:
+        flow.start(LOGIN)
+    root.after_idle(on_first_prompt)
+
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from io import BytesIO
+
+from app_config import config
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+MATERIALS_URL = "https://www.makehaven.org/api/v0/materials/equipment/{tool_numerical_id}"
+SITE_URL = "https://www.makehaven.org"
+
+cache_dir = config.get('Materials', 'cache_dir', fallback='cache/materials')
+if not os.path.isabs(cache_dir):
+    cache_dir = os.path.join(script_dir, cache_dir)
+thumbnail_height = config.getint('Materials', 'thumbnail_height', fallback=100)
+
+_index_lock = threading.Lock()
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp.{threading.get_ident()}"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def _read_json(path, default):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+# --- Materials catalog, one file per tool_numerical_id ---
+
+def _catalog_path(tool_numerical_id):
+    return os.path.join(cache_dir, f"catalog_{tool_numerical_id}.json")
+
+
+def cached_catalog(tool_numerical_id):
+    """Materials list from disk, or None if this tool's catalog was never fetched."""
+    entry = _read_json(_catalog_path(tool_numerical_id), None)
+    return entry['materials'] if entry else None
+
+
+def refresh_catalog(tool_numerical_id):
+    """Revalidate the catalog with the server (ETag/Last-Modified) and return the current materials list.
+
+    Falls back to the cached copy when the server cannot be reached, so the
+    ending screen keeps working offline.
+    """
+    import http_policy  # Not needed when the ending screen is served from the cached catalog
+    import http_transport
+
+    path = _catalog_path(tool_numerical_id)
+    entry = _read_json(path, None)
+    headers = {}
+    if entry and entry.get('etag'):
+        headers["If-None-Match"] = entry['etag']
+    if entry and entry.get('last_modified'):
+        headers["If-Modified-Since"] = entry['last_modified']
+
+    try:
+        response = http_policy.get(MATERIALS_URL.format(tool_numerical_id=tool_numerical_id), 'materials', headers=headers)
+    except http_transport.HTTPError as e:
+        print(f"Error fetching materials: {e}")
+        return entry['materials'] if entry else []
+
+    if response.status_code == 304 and entry:
+        return entry['materials']
+    if response.status_code != 200:
+        print(f"Error fetching materials: {response.status_code}")
+        return entry['materials'] if entry else []
+
+    try:
+        materials = response.json()
+    except ValueError as e:
+        print(f"Error decoding JSON: {e}")
+        return entry['materials'] if entry else []
+
+    entry = {
+        'etag': response.headers.get("ETag"),
+        'last_modified': response.headers.get("Last-Modified"),
+        'fetched_at': time.time(),
+        'materials': materials,
+    }
+    _write_atomic(path, json.dumps(entry).encode('utf-8'))
+    return materials
+
+
+# --- Thumbnails, stored already resized and addressed by the hash of the source image ---
+
+def material_image_url(material):
+    """Pull the image URL out of the `image` HTML snippet of a material, or None."""
+    image = material.get('image') or ''
+    if 'src="' not in image:
+        return None
+    image_src = image.split('src="')[1].split('"')[0]
+    if image_src.startswith('http'):
+        return image_src
+    return f"{SITE_URL}{image_src}"  # Append domain if relative
+
+
+def _index_path():
+    return os.path.join(cache_dir, "thumbnails", "index.json")
+
+
+def cached_thumbnail(image_url, height=None):
+    """Path of the resized PNG for this image URL, or None if it is not cached yet."""
+    height = height or thumbnail_height
+    with _index_lock:
+        index = _read_json(_index_path(), {})
+    content_hash = index.get(image_url)
+    if not content_hash:
+        return None
+    path = os.path.join(cache_dir, "thumbnails", f"{content_hash}_{height}.png")
+    return path if os.path.exists(path) else None
+
+
+def fetch_thumbnail(image_url, height=None):
+    """Download, resize and store one material image. Returns the PNG path, or None on failure."""
+    height = height or thumbnail_height
+    path = cached_thumbnail(image_url, height)
+    if path:
+        return path
+
+    import http_policy
+    import http_transport
+    from PIL import Image  # Only needed when a thumbnail actually has to be built
+
+    try:
+        response = http_policy.get(image_url, 'image')
+        response.raise_for_status()
+    except http_transport.HTTPError as e:
+        print(f"Failed to load image: {e}")
+        return None
+
+    content_hash = hashlib.sha256(response.content).hexdigest()
+    path = os.path.join(cache_dir, "thumbnails", f"{content_hash}_{height}.png")
+    if not os.path.exists(path):
+        material_image = Image.open(BytesIO(response.content))
+        # Resize once to display height, keeping the aspect ratio
+        img_ratio = height / float(material_image.size[1])
+        new_width = int((float(material_image.size[0]) * float(img_ratio)))
+        material_image = material_image.resize((new_width, height), Image.LANCZOS)
+        buffer = BytesIO()
+        material_image.save(buffer, format="PNG")
+        _write_atomic(path, buffer.getvalue())
+
+    with _index_lock:
+        index = _read_json(_index_path(), {})
+        index[image_url] = content_hash
+        _write_atomic(_index_path(), json.dumps(index).encode('utf-8'))
+    return path
+
+
+def prefetch(tool_numerical_id):
+    """Refresh the catalog and build every thumbnail; run in the background while a session is active."""
+    materials = refresh_catalog(tool_numerical_id)
+    for material in materials:
+        image_url = material_image_url(material)
+        if image_url:
+            fetch_thumbnail(image_url)
+    return materials
@@ -0,0 +1,213 @@
+"""Local stand-in for the Drupal/MakeHaven endpoints the kiosk talks to, for benchmarks and offline testing.
+
+Serves the login form, the permission and user lookups, upcoming reservations
+and the materials catalog, with configurable latency, jitter and error
+injection. Members are made up from a hash of the identifier, so the same
+scan always gets the same answer.
+
+Usage:
+    python mock_api.py [--port 8099] [--latency 80] [--jitter 20] [--error-rate 0.02]
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+SESSION_COOKIE = "SSESSmock"
+
+FIRST_NAMES = ["Ada", "Grace", "Alan", "Hedy", "Nikola", "Marie", "Claude", "Radia"]
+LAST_NAMES = ["Lovelace", "Hopper", "Turing", "Lamarr", "Tesla", "Curie", "Shannon", "Perlman"]
+
+
+def member_for(identifier):
+    """Made-up member behind an identifier: about 70% granted, 15% active without the badge, 10% lapsed, 5% unknown."""
+    digest = int(hashlib.sha1(identifier.strip().lower().encode('utf-8')).hexdigest(), 16)
+    bucket = digest % 100
+    if bucket >= 95:
+        return None
+    return {
+        'first_name': FIRST_NAMES[digest % len(FIRST_NAMES)],
+        'last_name': LAST_NAMES[(digest // 7) % len(LAST_NAMES)],
+        'access': "denied" if bucket >= 85 else "member",
+        'granted': bucket < 70,
+    }
+
+
+def sample_reservations(equipment_id):
+    start = time.strftime("%m/%d/%Y", time.localtime(time.time() + 86400))
+    return {'reservations': [
+        {'asset': f"Equipment {equipment_id}", 'range': f"{start} - 10:00am to {start} - 11:00am", 'name': "Ada Lovelace",
+         'note': "", 'purpose': "Prototype", 'status': "Confirmed"},
+        {'asset': f"Equipment {equipment_id}", 'range': f"{start} - 2:00pm to {start} - 4:00pm", 'name': "Alan Turing",
+         'note': "Bring own stock", 'purpose': "Class", 'status': "Confirmed"},
+    ]}
+
+
+def sample_materials(equipment_id):
+    return [
+        {'label': f"Material {n}", 'unit': "sheet", 'cost': f"{n * 2.5:.2f}",
+         'purchase': f"https://www.paypal.com/cgi-bin/webscr?item={equipment_id}-{n}", 'image': ""}
+        for n in range(1, 7)
+    ]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real site, so connection reuse shows up in the numbers
+    disable_nagle_algorithm = True  # Headers and body are written separately; without this each response waits on a delayed ACK
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8', 'replace')
+        if self._fail('login'):
+            return
+        if urlsplit(self.path).path.rstrip('/') != "/user/login":
+            return self._send(404, {'error': "not found"})
+        if "name=" not in body or "pass=" not in body:
+            return self._send(400, {'error': "missing credentials"})
+        token = uuid.uuid4().hex
+        with self.server.lock:
+            self.server.sessions[token] = time.time() + self.server.session_lifetime
+        self._send(200, "<html>Logged in</html>", cookie=f"{SESSION_COOKIE}={token}; Path=/; Max-Age={self.server.session_lifetime}")
+
+    def do_GET(self):
+        parts = [unquote(part) for part in urlsplit(self.path).path.strip('/').split('/')]
+        # /api/v0/{email|serial}/{identifier}/permission/{permission_id} and .../user
+        if len(parts) >= 5 and parts[:2] == ['api', 'v0'] and parts[2] in ('email', 'serial') and parts[4] in ('permission', 'user'):
+            endpoint = parts[4]
+            if self._fail(endpoint):
+                return
+            if not self._authenticated():
+                return self._send(403, {'error': "access denied"})
+            member = member_for(parts[3])
+            if endpoint == 'permission':
+                granted = member is not None and member['granted']
+                return self._send(200, [{'first_name': member['first_name'], 'last_name': member['last_name']}] if granted else [])
+            if member is None:
+                return self._send(200, [])
+            return self._send(200, [{'first_name': member['first_name'], 'last_name': member['last_name'], 'access': member['access']}])
+
+        if len(parts) == 6 and parts[:5] == ['api', 'v0', 'reservation', 'upcoming', 'equipment']:
+            if self._fail('reservations'):
+                return
+            return self._send_cacheable(sample_reservations(parts[5]))
+        if len(parts) == 5 and parts[:4] == ['api', 'v0', 'materials', 'equipment']:
+            if self._fail('materials'):
+                return
+            return self._send_cacheable(sample_materials(parts[4]))
+        self._count('other')
+        self._send(404, {'error': "not found"})
+
+    def _count(self, endpoint):
+        with self.server.lock:
+            self.server.counts[endpoint] = self.server.counts.get(endpoint, 0) + 1
+
+    def _fail(self, endpoint):
+        """Count the request, apply the configured latency, and maybe answer with an injected error."""
+        self._count(endpoint)
+        server = self.server
+        delay = server.latency + random.uniform(-server.jitter, server.jitter)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        if random.random() < server.error_rate:
+            self._count('errors')
+            self._send(503, {'error': "injected failure"})
+            return True
+        return False
+
+    def _authenticated(self):
+        for cookie in (self.headers.get('Cookie') or '').split(';'):
+            name, _, value = cookie.strip().partition('=')
+            if name == SESSION_COOKIE:
+                with self.server.lock:
+                    return self.server.sessions.get(value, 0) > time.time()
+        return False
+
+    def _send_cacheable(self, payload):
+        body = json.dumps(payload).encode('utf-8')
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self._count('not_modified')
+            return self._send(304, None, etag=etag)
+        self._send(200, body, etag=etag)
+
+    def _send(self, status, payload, cookie=None, etag=None):
+        if payload is None:
+            body = b""
+        elif isinstance(payload, bytes):
+            body = payload
+        elif isinstance(payload, str):
+            body = payload.encode('utf-8')
+        else:
+            body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', "text/html" if isinstance(payload, str) else "application/json")
+        self.send_header('Content-Length', str(len(body)))
+        if cookie:
+            self.send_header('Set-Cookie', cookie)
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+
+class MockServer:
+    """The mock API on a background thread; `base_url` is where to point the kiosk modules."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0, jitter=0, error_rate=0.0, session_lifetime=3600):
+        self.httpd = ThreadingHTTPServer((host, port), MockHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.jitter = jitter
+        self.httpd.error_rate = error_rate
+        self.httpd.session_lifetime = session_lifetime
+        self.httpd.lock = threading.Lock()
+        self.httpd.sessions = {}
+        self.httpd.counts = {}
+        self.base_url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = None
+
+    def counts(self):
+        with self.httpd.lock:
+            return dict(self.httpd.counts)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the mock Drupal/MakeHaven API.")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0, help="added latency per request, ms")
+    parser.add_argument('--jitter', type=float, default=0, help="+/- random latency, ms")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument('--session-lifetime', type=int, default=3600, help="seconds before a login cookie is rejected")
+    args = parser.parse_args(argv)
+
+    server = MockServer(args.host, args.port, args.latency, args.jitter, args.error_rate, args.session_lifetime)
+    print(f"Mock API listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
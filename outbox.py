@@ -0,0 +1,145 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from app_config import config
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Session events forwarded to the API; ratings and screen choices stay local
+FORWARDED_ACTIONS = ('start', 'end', 'usage')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class Outbox:
+    """Durable store-and-forward queue for events bound for the MakeHaven API.
+
+    `enqueue()` is a single local SQLite insert, so the kiosk never waits on the
+    network. A background thread replays queued events in bulk through
+    `send_batch(events)`, which returns True once the server has accepted them.
+    Every event carries an idempotency key, so a batch that is re-sent after a
+    lost response is not double counted. Failures back off exponentially.
+    """
+
+    def __init__(self, db_path, send_batch, batch_size=100, base_backoff=5, max_backoff=600):
+        self.db_path = db_path
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+        self.failures = 0
+        self.sent = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enqueue(self, kind, payload, idempotency_key=None):
+        """Journal one event; safe to call from any thread."""
+        idempotency_key = idempotency_key or str(uuid.uuid4())
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO outbox (idempotency_key, kind, payload, created_at) VALUES (?, ?, ?, ?)",
+                (idempotency_key, kind, json.dumps(payload), time.time()),
+            )
+        self._wake.set()
+        return idempotency_key
+
+    def pending(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def flush_once(self):
+        """Send the oldest batch. Returns the number of events delivered (0 if none or on failure)."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, idempotency_key, kind, payload, created_at FROM outbox ORDER BY id LIMIT ?", (self.batch_size,)
+            ).fetchall()
+        if not rows:
+            return 0
+
+        events = [
+            {'idempotency_key': key, 'kind': kind, 'created_at': created_at, 'payload': json.loads(payload)}
+            for _, key, kind, payload, created_at in rows
+        ]
+        try:
+            delivered = self.send_batch(events)
+        except Exception as e:
+            print(f"Outbox delivery failed: {e}")
+            delivered = False
+
+        ids = [(row[0],) for row in rows]
+        with self._lock, self.conn:
+            if delivered:
+                self.conn.executemany("DELETE FROM outbox WHERE id = ?", ids)
+            else:
+                self.conn.executemany("UPDATE outbox SET attempts = attempts + 1 WHERE id = ?", ids)
+        if not delivered:
+            return 0
+        self.sent += len(rows)
+        return len(rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.flush_once():
+                self.failures = 0
+                continue  # Drain the backlog batch after batch while the server is reachable
+            if self.pending():
+                # Server unreachable: exponential backoff before the next attempt
+                self.failures += 1
+                delay = min(self.base_backoff * 2 ** (self.failures - 1), self.max_backoff)
+                self._stop.wait(delay)
+            else:
+                self._wake.wait(self.max_backoff)
+                self._wake.clear()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="outbox", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def forward_session_events(self, event_log_writer):
+        """Queue the session start/end and usage events written by `event_log_writer`."""
+        def forward(event):
+            if event['action'].lower() in FORWARDED_ACTIONS:
+                self.enqueue('session_' + event['action'].lower(), {key: value for key, value in event.items() if key != 'text'})
+
+        event_log_writer.add_listener(forward)
+
+
+def open_outbox(send_batch):
+    """Outbox built from the [Outbox] settings and already running."""
+    db_path = config.get('Outbox', 'db_path', fallback='outbox.db')
+    if not os.path.isabs(db_path):
+        db_path = os.path.join(script_dir, db_path)
+    outbox = Outbox(
+        db_path,
+        send_batch,
+        batch_size=config.getint('Outbox', 'batch_size', fallback=100),
+        max_backoff=config.getint('Outbox', 'max_backoff', fallback=600),
+    )
+    outbox.start()
+    return outbox
@@ -0,0 +1,212 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_identifier(identifier):
+    """Normalize a scanned identifier so the same card or email always maps to one cache key."""
+    identifier = identifier.strip()
+    if "@" in identifier:
+        return identifier.lower()
+    return identifier.upper()
+
+
+class PermissionCache:
+    """Bounded LRU cache of permission lookups, keyed on (identifier, permission_id).
+
+    Both grants (non-empty API result) and denials (empty list) are kept, each
+    with its own TTL. A fresh hit is answered straight away and refreshed in a
+    background thread; an entry past its TTL but still inside the stale window
+    is served the same way (stale-while-revalidate). Anything older is a miss.
+
+    Changes are written to `persist_path` by a timer `save_delay` seconds
+    after the first unsaved change, so lookups never wait on the disk.
+    """
+
+    def __init__(self, max_entries=500, grant_ttl=3600, deny_ttl=60, stale_window=0,
+                 revalidate_after=30, persist_path=None, save_delay=2):
+        self.max_entries = max_entries
+        self.grant_ttl = grant_ttl
+        self.deny_ttl = deny_ttl
+        self.stale_window = stale_window
+        self.revalidate_after = revalidate_after
+        self.persist_path = persist_path
+        self.save_delay = save_delay
+
+        self._entries = OrderedDict()  # key -> (data, stored_at wall-clock seconds)
+        self._lock = threading.Lock()
+        self._revalidating = set()
+        self._save_timer = None
+
+        # Counters shown in the debug box
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+        if self.persist_path:
+            self.load()
+            atexit.register(self.flush)
+
+    def _key(self, identifier, permission_id):
+        return f"{normalize_identifier(identifier)}|{permission_id}"
+
+    def _ttl_for(self, data):
+        return self.grant_ttl if data else self.deny_ttl
+
+    def get(self, identifier, permission_id):
+        """Return (data, age, state) where state is 'fresh', 'stale' or None for a miss."""
+        key = self._key(identifier, permission_id)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, None, None
+            data, stored_at = entry
+            age = now - stored_at
+            ttl = self._ttl_for(data)
+            if age < ttl:
+                self._entries.move_to_end(key)
+                return data, age, "fresh"
+            if age < ttl + self.stale_window:
+                self._entries.move_to_end(key)
+                return data, age, "stale"
+            # Too old to serve at all
+            del self._entries[key]
+            return None, None, None
+
+    def put(self, identifier, permission_id, data):
+        key = self._key(identifier, permission_id)
+        with self._lock:
+            self._entries[key] = (data, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        self.schedule_save()
+
+    def invalidate(self, identifier, permission_id):
+        key = self._key(identifier, permission_id)
+        with self._lock:
+            self._entries.pop(key, None)
+        self.schedule_save()
+
+    def lookup(self, identifier, permission_id, fetch, background_fetch=None):
+        """Answer a permission check, going to the network only on a miss.
+
+        `fetch()` returns the parsed API data (a list) or None when the server
+        could not be reached. `background_fetch` is used for revalidation and
+        must not touch the UI; it defaults to `fetch`.
+        """
+        data, age, state = self.get(identifier, permission_id)
+        if state == "fresh":
+            self.hits += 1
+            if age >= self.revalidate_after or not data:
+                self.revalidate(identifier, permission_id, background_fetch or fetch)
+            return data
+        if state == "stale":
+            self.stale_hits += 1
+            self.revalidate(identifier, permission_id, background_fetch or fetch)
+            return data
+
+        self.misses += 1
+        data = fetch()
+        if data is not None:
+            self.put(identifier, permission_id, data)
+        return data
+
+    def revalidate(self, identifier, permission_id, fetch):
+        """Refresh one entry in a background thread, at most once in flight per key."""
+        key = self._key(identifier, permission_id)
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+
+        def worker():
+            try:
+                data = fetch()
+                if data is not None:
+                    self.put(identifier, permission_id, data)
+                    self.revalidations += 1
+            except Exception as e:
+                print(f"Permission cache revalidation failed: {e}")
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'revalidations': self.revalidations,
+            'evictions': self.evictions,
+        }
+
+    def stats_line(self):
+        return ", ".join(f"{name}={value}" for name, value in self.stats().items())
+
+    def load(self):
+        """Load persisted entries, dropping anything already too old to serve."""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, 'r') as cache_file:
+                stored = json.load(cache_file)
+        except (OSError, ValueError) as e:
+            print(f"Could not read permission cache {self.persist_path}: {e}")
+            return
+
+        now = time.time()
+        with self._lock:
+            for key, data, stored_at in stored.get('entries', []):
+                if now - stored_at < self._ttl_for(data) + self.stale_window:
+                    self._entries[key] = (data, stored_at)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def schedule_save(self):
+        """Save in the background shortly; changes made meanwhile go into the same write."""
+        if not self.persist_path:
+            return
+        with self._lock:
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(self.save_delay, self._timed_save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _timed_save(self):
+        with self._lock:
+            self._save_timer = None
+        self.save()
+
+    def flush(self):
+        """Write pending changes now (at exit)."""
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+        if timer is not None:
+            timer.cancel()
+            self.save()
+
+    def save(self):
+        """Write the cache to disk atomically (temp file + rename)."""
+        if not self.persist_path:
+            return
+        with self._lock:
+            entries = [[key, data, stored_at] for key, (data, stored_at) in self._entries.items()]
+        temp_path = f"{self.persist_path}.tmp.{threading.get_ident()}"
+        try:
+            with open(temp_path, 'w') as cache_file:
+                json.dump({'entries': entries}, cache_file)
+            os.replace(temp_path, self.persist_path)
+        except OSError as e:
+            print(f"Could not write permission cache {self.persist_path}: {e}")
@@ -0,0 +1,260 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+from permission_cache import normalize_identifier
+
+# File layout: header, then a power-of-two open-addressing table of
+# (key hash, payload offset, payload length) slots, then the JSON payloads.
+# Identifiers themselves are never written, only a keyed 64-bit hash.
+MAGIC = b"MHPS"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHdII64s64s")  # magic, format, unused, synced_at, slot count, entry count, version, permission
+SLOT = struct.Struct("<QII")
+EMPTY = 0
+
+
+def identifier_hash(identifier, permission_id):
+    digest = hashlib.blake2b(normalize_identifier(identifier).encode('utf-8'), digest_size=8,
+                             key=permission_id.encode('utf-8')[:64]).digest()
+    return int.from_bytes(digest, 'little') or 1  # 0 marks an empty slot
+
+
+def member_identifiers(member):
+    """Every serial and email a snapshot member record can be scanned with."""
+    identifiers = []
+    for key in ('serial', 'email', 'serials', 'emails'):
+        value = member.get(key)
+        if isinstance(value, (list, tuple)):
+            identifiers.extend(str(item) for item in value if item)
+        elif value:
+            identifiers.append(str(value))
+    return identifiers
+
+
+def member_payload(member):
+    """What a grant needs from the snapshot: the same fields the permission API returns for the kiosk."""
+    return json.dumps({'first_name': member.get('first_name'), 'last_name': member.get('last_name')}).encode('utf-8')
+
+
+class PermissionSnapshot:
+    """On-disk, mmap'd index of everyone holding one permission, answering a scan in constant time.
+
+    `sync(fetch)` downloads the full list once and deltas after that (plus a
+    full download every `full_every` seconds to correct any drift).
+    `lookup()` answers only while the last successful sync is younger than
+    `max_age`; a stale or missing snapshot returns None and the caller uses
+    the live API. A member not in the snapshot also returns None, so a
+    permission granted since the last sync is still honoured.
+    """
+
+    def __init__(self, path, permission_id, max_age=3600, full_every=86400):
+        self.path = path
+        self.permission_id = permission_id
+        self.max_age = max_age
+        self.full_every = full_every
+
+        self.version = None
+        self.synced_at = 0.0
+        self.full_synced_at = 0.0
+        self.entry_count = 0
+        self._slot_count = 0
+        self._map = None
+        self._lock = threading.Lock()
+        self._sync_thread = None
+
+        # Counters shown in the debug box
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.syncs = 0
+        self.sync_failures = 0
+
+        self.load()
+
+    def load(self):
+        """Map the index file if it exists and belongs to this permission."""
+        try:
+            with open(self.path, 'rb') as index_file:
+                mapped = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return  # No snapshot yet (ValueError: empty file)
+        try:
+            magic, file_format, _, synced_at, slot_count, entry_count, version, permission = HEADER.unpack_from(mapped, 0)
+        except struct.error:
+            magic = None
+        if magic != MAGIC or file_format != FORMAT_VERSION or permission.rstrip(b"\0").decode('utf-8') != self.permission_id:
+            print(f"Ignoring permission snapshot {self.path}: not a snapshot for {self.permission_id}")
+            mapped.close()
+            return
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+            self._map = mapped
+            self._slot_count = slot_count
+            self.entry_count = entry_count
+            self.synced_at = synced_at
+            self.version = version.rstrip(b"\0").decode('utf-8') or None
+
+    def age(self):
+        return time.time() - self.synced_at
+
+    def is_fresh(self):
+        return self._map is not None and self.age() < self.max_age
+
+    def _find(self, key_hash):
+        """Payload offset and length for a key hash, or None. Caller holds the lock."""
+        mask = self._slot_count - 1
+        slot = key_hash & mask
+        table_start = HEADER.size
+        for _ in range(self._slot_count):
+            stored_hash, offset, length = SLOT.unpack_from(self._map, table_start + slot * SLOT.size)
+            if stored_hash == EMPTY:
+                return None
+            if stored_hash == key_hash:
+                return offset, length
+            slot = (slot + 1) & mask
+        return None
+
+    def lookup(self, identifier):
+        """The permission API's answer for a member in a fresh snapshot, else None (ask the live API)."""
+        with self._lock:
+            if self._map is None:
+                return None
+            if time.time() - self.synced_at >= self.max_age:
+                self.stale += 1
+                return None
+            found = self._find(identifier_hash(identifier, self.permission_id))
+            if found is None:
+                self.misses += 1
+                return None
+            offset, length = found
+            payload = self._map[offset:offset + length]
+            self.hits += 1
+        return [json.loads(payload)]
+
+    def _entries(self):
+        """Key hash -> payload bytes of the current index, to apply a delta to."""
+        entries = {}
+        with self._lock:
+            if self._map is None:
+                return entries
+            for slot in range(self._slot_count):
+                stored_hash, offset, length = SLOT.unpack_from(self._map, HEADER.size + slot * SLOT.size)
+                if stored_hash != EMPTY:
+                    entries[stored_hash] = self._map[offset:offset + length]
+        return entries
+
+    def write(self, entries, version, synced_at=None):
+        """Write a new index atomically (temp file, fsync, rename) and map it."""
+        synced_at = time.time() if synced_at is None else synced_at
+        slot_count = 8
+        while slot_count < len(entries) * 2:  # Load factor at most one half keeps probes short
+            slot_count *= 2
+        table = bytearray(slot_count * SLOT.size)
+        payloads = bytearray()
+        payload_start = HEADER.size + len(table)
+        for key_hash, payload in entries.items():
+            slot = key_hash & (slot_count - 1)
+            while SLOT.unpack_from(table, slot * SLOT.size)[0] != EMPTY:
+                slot = (slot + 1) & (slot_count - 1)
+            SLOT.pack_into(table, slot * SLOT.size, key_hash, payload_start + len(payloads), len(payload))
+            payloads += payload
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, synced_at, slot_count, len(entries),
+                             str(version or "").encode('utf-8')[:64], self.permission_id.encode('utf-8')[:64])
+
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'wb') as index_file:
+            index_file.write(header)
+            index_file.write(table)
+            index_file.write(payloads)
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        with self._lock:
+            # Unmapped first: Windows cannot replace a file that is still mapped
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+        try:
+            os.replace(temp_path, self.path)
+        finally:
+            self.load()
+
+    def apply(self, response):
+        """Fold one sync response into the index.
+
+        A full snapshot is {"version", "members": [...]}; a delta is
+        {"version", "added": [...], "removed": [...]}; {"not_modified": true}
+        only confirms that the snapshot is still current.
+        """
+        if response.get('not_modified'):
+            entries = self._entries()
+            version = self.version
+        elif 'members' in response:
+            entries = {}
+            for member in response['members']:
+                for identifier in member_identifiers(member):
+                    entries[identifier_hash(identifier, self.permission_id)] = member_payload(member)
+            version = response.get('version')
+            self.full_synced_at = time.time()
+        else:
+            entries = self._entries()
+            for member in response.get('removed', []):
+                for identifier in member_identifiers(member):
+                    entries.pop(identifier_hash(identifier, self.permission_id), None)
+            for member in response.get('added', []):
+                for identifier in member_identifiers(member):
+                    entries[identifier_hash(identifier, self.permission_id)] = member_payload(member)
+            version = response.get('version', self.version)
+        self.write(entries, version)
+
+    def sync(self, fetch):
+        """One sync round. `fetch(since)` returns the parsed response, or None if the server could not be used."""
+        full = self.version is None or self._map is None or time.time() - self.full_synced_at >= self.full_every
+        response = fetch(None if full else self.version)
+        if response is None:
+            self.sync_failures += 1
+            return False
+        try:
+            self.apply(response)
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"Could not apply permission snapshot: {e}")
+            self.sync_failures += 1
+            return False
+        self.syncs += 1
+        return True
+
+    def start_sync(self, fetch, interval=300):
+        """Sync now and then every `interval` seconds in a background thread."""
+        if self._sync_thread is not None:
+            return
+
+        def worker():
+            while True:
+                try:
+                    self.sync(fetch)
+                except Exception as e:
+                    print(f"Permission snapshot sync failed: {e}")
+                time.sleep(interval)
+
+        self._sync_thread = threading.Thread(target=worker, name="permission-snapshot", daemon=True)
+        self._sync_thread.start()
+
+    def stats(self):
+        return {
+            'entries': self.entry_count,
+            'version': self.version,
+            'age': round(self.age()) if self._map is not None else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'syncs': self.syncs,
+            'sync_failures': self.sync_failures,
+        }
+
+    def stats_line(self):
+        return ", ".join(f"{name}={value}" for name, value in self.stats().items())
@@ -0,0 +1,121 @@
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from app_config import config
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+memory_entries = config.getint('QRCode', 'memory_entries', fallback=64)
+disk_cache = config.getboolean('QRCode', 'disk_cache', fallback=True)
+cache_dir = config.get('QRCode', 'cache_dir', fallback='cache/qr')
+if not os.path.isabs(cache_dir):
+    cache_dir = os.path.join(script_dir, cache_dir)
+
+QUIET_ZONE = 4  # modules of white border required by the QR spec
+
+_png_cache = OrderedDict()    # key -> PNG bytes
+_photo_cache = OrderedDict()  # key -> tk.PhotoImage (only touched on the Tk thread)
+_lock = threading.Lock()
+
+renders = 0
+hits = 0
+
+
+def _key(payload, size, error_correction, version):
+    return hashlib.sha256(f"{payload}|{size}|{error_correction}|{version}".encode('utf-8')).hexdigest()
+
+
+def _remember(cache, key, value):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > memory_entries:
+        cache.popitem(last=False)
+
+
+def render_qr_png(payload, size, error_correction='H'):
+    """Render a QR code straight at `size` pixels: whole-pixel modules, no resampling, so edges stay sharp."""
+    import qrcode  # Only loaded the first time a QR code is actually drawn
+
+    levels = {
+        'L': qrcode.constants.ERROR_CORRECT_L,
+        'M': qrcode.constants.ERROR_CORRECT_M,
+        'Q': qrcode.constants.ERROR_CORRECT_Q,
+        'H': qrcode.constants.ERROR_CORRECT_H,
+    }
+    qr = qrcode.QRCode(version=None, error_correction=levels[error_correction], box_size=1, border=QUIET_ZONE)
+    qr.add_data(payload)
+    qr.make(fit=True)
+
+    # Largest whole box size that fits the target, then pad the rest with white
+    modules = qr.modules_count + 2 * QUIET_ZONE
+    qr.box_size = max(1, size // modules)
+    img = qr.make_image(fill_color="black", back_color="white").convert('RGB')
+    if img.size[0] < size:
+        from PIL import Image
+        canvas = Image.new('RGB', (size, size), 'white')
+        offset = (size - img.size[0]) // 2
+        canvas.paste(img, (offset, offset))
+        img = canvas
+
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def qr_png(payload, size, error_correction='H', version=None):
+    """PNG bytes for a QR code, memoized in memory and on disk.
+
+    `version` is an extra cache tag (e.g. a material's price) so a code is
+    rendered again only when that value changes.
+    """
+    global renders, hits
+    key = _key(payload, size, error_correction, version)
+    with _lock:
+        if key in _png_cache:
+            hits += 1
+            _png_cache.move_to_end(key)
+            return _png_cache[key]
+
+    path = os.path.join(cache_dir, f"{key}.png")
+    png = None
+    if disk_cache and os.path.exists(path):
+        with open(path, 'rb') as f:
+            png = f.read()
+    if png is None:
+        png = render_qr_png(payload, size, error_correction)
+        renders += 1
+        if disk_cache:
+            os.makedirs(cache_dir, exist_ok=True)
+            temp_path = f"{path}.tmp.{threading.get_ident()}"
+            with open(temp_path, 'wb') as f:
+                f.write(png)
+            os.replace(temp_path, path)
+
+    with _lock:
+        _remember(_png_cache, key, png)
+    return png
+
+
+def qr_photo(payload, size, error_correction='H', version=None, master=None):
+    """tk.PhotoImage of a QR code; call from the Tk thread only."""
+    import tkinter as tk
+
+    key = _key(payload, size, error_correction, version)
+    if key in _photo_cache:
+        _photo_cache.move_to_end(key)
+        return _photo_cache[key]
+    png = qr_png(payload, size, error_correction, version)
+    photo = tk.PhotoImage(master=master, data=base64.b64encode(png))
+    _remember(_photo_cache, key, photo)
+    return photo
+
+
+def prefetch_material_qrs(materials, size=100):
+    """Render the per-material payment codes ahead of time (safe to run on a worker thread)."""
+    for material in materials:
+        if material.get('purchase'):
+            qr_png(material['purchase'], size, 'L', version=material.get('cost'))
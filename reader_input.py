@@ -0,0 +1,207 @@
+"""RFID reader input: framing of the raw character stream, format checks and duplicate-scan suppression.
+
+Scans reach the kiosk either through the keyboard-wedge entry field or, when
+[Reader] device is set, straight from a serial device (or a pty stand-in)
+read by `DeviceReader`. In both cases the kiosk validates a code for the
+configured input_format with `normalize_scan` before any network call, and a
+`ScanCoalescer` answers a repeat of a scan that is still being checked (or
+was just denied) without another request.
+"""
+import os
+import re
+import select
+import threading
+import time
+
+from app_config import config
+
+input_format = config.get('Login', 'input_format', fallback='hexadecimal').strip().lower()
+min_length = config.getint('Reader', 'min_length', fallback=4)
+max_length = config.getint('Reader', 'max_length', fallback=20)
+
+STX, ETX = '\x02', '\x03'  # Some serial readers wrap each code in these
+TERMINATORS = ('\r', '\n', ETX)
+
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+HEX_PATTERN = re.compile(r"^[0-9A-Fa-f]+$")
+DECIMAL_PATTERN = re.compile(r"^[0-9]+$")
+
+
+def convert_to_hexadecimal(identifier, input_format):
+    """Card number as the uppercase hex the API expects; decimal readers are converted."""
+    if input_format == 'decimal':
+        try:
+            return format(int(identifier), 'X')
+        except ValueError:
+            return identifier.upper()  # Return the original identifier in upper case if conversion fails
+    return identifier.upper()
+
+
+def normalize_scan(raw, input_format=input_format):
+    """The identifier to look up for one framed code, or None when it cannot be a valid tag or email.
+
+    Rejected codes (partial reads, two codes run together, line noise) never
+    cause a network request.
+    """
+    code = raw.strip().strip(STX + ETX).strip()
+    if "@" in code:
+        return code.lower() if EMAIL_PATTERN.match(code) else None
+    if not min_length <= len(code) <= max_length:
+        return None
+    if input_format == 'decimal':
+        return convert_to_hexadecimal(code, input_format) if DECIMAL_PATTERN.match(code) else None
+    return code.upper() if HEX_PATTERN.match(code) else None
+
+
+class ScanFramer:
+    """Splits a reader's character stream into codes.
+
+    A code ends at CR, LF or ETX, or when the reader pauses for longer than
+    `frame_gap` seconds (for readers that send no terminator). STX starts a
+    new code and drops anything half-read before it.
+    """
+
+    def __init__(self, frame_gap=0.05):
+        self.frame_gap = frame_gap
+        self.buffer = []
+        self.last_char_at = None
+
+    def feed(self, text, now=None):
+        """Add received characters; returns the codes completed by them."""
+        now = time.monotonic() if now is None else now
+        codes = self.flush_if_idle(now)
+        for char in text:
+            if char == STX:
+                self.buffer = []
+            elif char in TERMINATORS:
+                codes.extend(self._take())
+            elif char.isprintable():
+                self.buffer.append(char)
+        self.last_char_at = now
+        return codes
+
+    def flush_if_idle(self, now=None):
+        """The pending code if the reader has gone quiet for longer than the frame gap."""
+        now = time.monotonic() if now is None else now
+        if self.buffer and self.last_char_at is not None and now - self.last_char_at > self.frame_gap:
+            return self._take()
+        return []
+
+    def _take(self):
+        code, self.buffer = "".join(self.buffer), []
+        return [code] if code else []
+
+
+class ScanCoalescer:
+    """Answers repeated scans without another request.
+
+    The kiosk checks one scan at a time. A repeat of the scan still in flight
+    is folded into it, and a repeat of a denial within `window` seconds gets
+    the same answer again.
+    """
+
+    def __init__(self, window=3.0):
+        self.window = window
+        self.in_flight = None
+        self.recent = {}  # identifier -> (finished_at, result)
+        self.coalesced = 0
+
+    def duplicate(self, identifier, now=None):
+        """('in_flight', None) or ('recent', result) for a duplicate scan, None for a scan that needs a lookup."""
+        now = time.monotonic() if now is None else now
+        if identifier == self.in_flight:
+            self.coalesced += 1
+            return 'in_flight', None
+        finished_at, result = self.recent.get(identifier, (None, None))
+        if finished_at is not None and now - finished_at <= self.window:
+            self.coalesced += 1
+            return 'recent', result
+        return None
+
+    def started(self, identifier):
+        self.in_flight = identifier
+
+    def finished(self, identifier, result=None, now=None):
+        """Clear the in-flight scan; keep `result` for repeats when given (denials only, never errors)."""
+        now = time.monotonic() if now is None else now
+        if self.in_flight == identifier:
+            self.in_flight = None
+        # Drop expired answers so the map stays small
+        self.recent = {key: value for key, value in self.recent.items() if now - value[0] <= self.window}
+        if result is not None:
+            self.recent[identifier] = (now, result)
+
+
+class DeviceReader:
+    """Reads a serial reader (or pty) on a background thread and hands each framed code to `on_code` (POSIX only).
+
+    `on_code(raw)` is called on the reader thread; the kiosk queues the code
+    for the UI thread, where it is validated like a typed scan.
+    """
+
+    def __init__(self, path, on_code, baud_rate=9600, frame_gap=0.05):
+        self.path = path
+        self.on_code = on_code
+        self.baud_rate = baud_rate
+        self.framer = ScanFramer(frame_gap)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _open(self):
+        fd = os.open(self.path, os.O_RDONLY | os.O_NOCTTY | os.O_NONBLOCK)
+        if not os.isatty(fd):
+            return fd
+        import termios
+        import tty
+        try:
+            tty.setraw(fd)
+            speed = getattr(termios, f"B{self.baud_rate}", None)
+            if speed is not None:
+                attributes = termios.tcgetattr(fd)
+                attributes[4] = attributes[5] = speed
+                termios.tcsetattr(fd, termios.TCSANOW, attributes)
+        except termios.error as e:
+            # Close the fd so _run's retries do not leak one each time; termios.error is not an OSError, so wrap it
+            os.close(fd)
+            raise OSError(f"could not configure the tty: {e}") from e
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    def _deliver(self, codes):
+        for raw in codes:
+            self.on_code(raw)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                fd = self._open()
+            except OSError as e:
+                print(f"Could not open reader {self.path}: {e}")
+                self._stop.wait(5)  # Unplugged: try again shortly
+                continue
+            try:
+                while not self._stop.is_set():
+                    # Wake up at least once per frame gap so unterminated codes are framed on time
+                    ready, _, _ = select.select([fd], [], [], self.framer.frame_gap)
+                    if ready:
+                        data = os.read(fd, 256)
+                        if not data:
+                            break  # Device went away
+                        self._deliver(self.framer.feed(data.decode('ascii', 'ignore')))
+                    else:
+                        self._deliver(self.framer.flush_if_idle())
+            except OSError as e:
+                print(f"Reader {self.path} failed: {e}")
+            finally:
+                os.close(fd)
+            self._stop.wait(1)  # Reopen after the device disappeared, without spinning
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="rfid-reader", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,146 @@
+import datetime
+import hashlib
+import json
+import http_policy
+import http_transport
+
+RESERVATIONS_URL = "https://makehaven.org/api/v0/reservation/upcoming/equipment/{equipment_id}"
+
+# Formats tried when reading a reservation's start time (the API sends it as text)
+START_TIME_FORMATS = [
+    "%Y-%m-%dT%H:%M:%S%z",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%m/%d/%Y - %I:%M%p",
+    "%m/%d/%Y %I:%M %p",
+    "%a, %m/%d/%Y - %H:%M",
+]
+
+
+def parse_reservations(data):
+    """Extract the reservation list from the API response (either a list or {'reservations': [...]})."""
+    if isinstance(data, dict):
+        return data.get("reservations", [])
+    if isinstance(data, list):
+        return data
+    print("Unexpected reservation data format:", data)
+    return []
+
+
+def reservation_start(reservation):
+    """Best-effort start time of a reservation as a naive local datetime, or None."""
+    for key in ('start', 'start_time', 'start_date', 'range'):
+        value = reservation.get(key)
+        if not value:
+            continue
+        if isinstance(value, (int, float)):
+            return datetime.datetime.fromtimestamp(value)
+        # A range like "03/04/2025 - 10:00am to 03/04/2025 - 11:00am": keep the first half
+        text = str(value).split(" to ")[0].strip()
+        for time_format in START_TIME_FORMATS:
+            try:
+                start = datetime.datetime.strptime(text, time_format)
+            except ValueError:
+                continue
+            if start.tzinfo is not None:
+                start = start.astimezone().replace(tzinfo=None)
+            return start
+    return None
+
+
+def fetch_upcoming_reservations(equipment_id):
+    """Unconditional fetch of the upcoming reservations, returning a list."""
+    poller = ReservationPoller(equipment_id)
+    poller.poll_once()
+    return poller.reservations
+
+
+class ReservationPoller:
+    """Conditional, adaptive polling of the upcoming-reservations endpoint.
+
+    `poll_once()` does the HTTP work and is meant to run on a worker thread.
+    It sends ETag/Last-Modified validators and also compares a hash of the body,
+    so an unchanged payload is never parsed or re-rendered. `next_interval()`
+    backs off while nothing changes and while the next reservation is far away.
+    Failed polls are counted as errors and keep the current interval, so an
+    outage does not stretch the polling out to max_interval.
+    """
+
+    def __init__(self, equipment_id, min_interval=60, max_interval=900):
+        self.equipment_id = equipment_id
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+
+        self.etag = None
+        self.last_modified = None
+        self.content_hash = None
+        self.reservations = []
+
+        self.polls = 0
+        self.not_modified = 0
+        self.errors = 0
+
+    def poll_once(self):
+        """Fetch reservations if they changed. Returns True when `self.reservations` was updated."""
+        self.polls += 1
+        headers = {"Accept": "application/json"}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+
+        try:
+            response = http_policy.get(RESERVATIONS_URL.format(equipment_id=self.equipment_id), 'reservations', headers=headers)
+        except http_transport.HTTPError as e:
+            print(f"Error fetching reservation data: {e}")
+            return self._failed()
+
+        if response.status_code == 304:
+            return self._unchanged()
+        if response.status_code != 200:
+            print(f"Error fetching reservation data: {response.status_code}")
+            return self._failed()
+
+        self.etag = response.headers.get("ETag", self.etag)
+        self.last_modified = response.headers.get("Last-Modified", self.last_modified)
+
+        # Servers that ignore the validators still send the same bytes; skip those too
+        content_hash = hashlib.sha1(response.content).hexdigest()
+        if content_hash == self.content_hash:
+            return self._unchanged()
+
+        try:
+            reservations = parse_reservations(response.json())
+        except json.JSONDecodeError as e:
+            print(f"Error decoding JSON: {e}")
+            return self._failed()
+
+        self.content_hash = content_hash
+        self.reservations = reservations
+        self.interval = self.min_interval
+        return True
+
+    def _unchanged(self):
+        self.not_modified += 1
+        # Nothing new: wait a bit longer before asking again
+        self.interval = min(self.interval * 1.5, self.max_interval)
+        return False
+
+    def _failed(self):
+        # Not evidence that nothing changed: retry at the current pace
+        self.errors += 1
+        return False
+
+    def next_interval(self, now=None):
+        """Seconds until the next poll."""
+        now = now or datetime.datetime.now()
+        interval = self.interval
+        starts = [start for start in map(reservation_start, self.reservations) if start is not None]
+        upcoming = [start for start in starts if start > now]
+        if upcoming:
+            # Poll more often as the next reservation approaches, never less than min_interval
+            seconds_until = (min(upcoming) - now).total_seconds()
+            interval = min(interval, max(self.min_interval, seconds_until / 4))
+        return interval
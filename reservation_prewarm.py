@@ -0,0 +1,106 @@
+import threading
+import time
+
+from reservation_poller import reservation_start
+
+# Reservation fields that can carry the member's badge serial or email. The
+# current API only sends a display name, so these are used when present.
+IDENTIFIER_KEYS = ('email', 'mail', 'user_email', 'serial', 'card_serial', 'rfid', 'identifier')
+
+
+def reservation_identifiers(reservation):
+    """Identifiers a member could scan for this reservation, as far as the reservation tells us."""
+    identifiers = []
+    for key in IDENTIFIER_KEYS:
+        value = reservation.get(key)
+        if isinstance(value, (list, tuple)):
+            identifiers.extend(str(item).strip() for item in value if item)
+        elif value:
+            identifiers.append(str(value).strip())
+    return identifiers
+
+
+class ReservationPrewarmer:
+    """Looks up members with upcoming reservations shortly before their slot, so their scan is a cache hit.
+
+    `update(reservations)` is called after every poll and plans every
+    upcoming reservation, so one that is hours away when the list last
+    changed is still warmed on time. A background thread calls
+    `warm(identifiers)` `lead` seconds before the start, once the start is
+    within `window` seconds. `warm`
+    checks the Drupal session and fills the permission cache for whatever
+    identifiers the reservation carries. Each reservation is warmed once.
+    """
+
+    def __init__(self, warm, window=900, lead=120):
+        self.warm = warm
+        self.window = window
+        self.lead = lead
+
+        self.planned = {}   # (name, start) -> (warm_at, identifiers)
+        self.done = set()
+        self.warmed = 0
+        self.without_identifiers = 0
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def update(self, reservations, now=None):
+        now = time.time() if now is None else now
+        planned = {}
+        for reservation in reservations:
+            start = reservation_start(reservation)
+            if start is None:
+                continue
+            starts_at = start.timestamp()
+            if starts_at < now - self.lead:
+                continue
+            key = (reservation.get('name', ''), starts_at)
+            if key not in self.done:
+                planned[key] = (starts_at - self.lead, reservation_identifiers(reservation))
+        with self._lock:
+            self.planned = planned
+            # Forget reservations long gone so the set stays small
+            self.done = {key for key in self.done if key[1] > now - self.window}
+        self._wake.set()
+
+    def run_due(self, now=None):
+        """Warm every planned reservation whose time has come. Returns how many were warmed."""
+        now = time.time() if now is None else now
+        with self._lock:
+            due = [(key, identifiers) for key, (warm_at, identifiers) in self.planned.items()
+                   if warm_at <= now and key[1] <= now + self.window]
+            for key, _ in due:
+                del self.planned[key]
+                self.done.add(key)
+        for key, identifiers in due:
+            if not identifiers:
+                self.without_identifiers += 1
+            try:
+                self.warm(identifiers)
+            except Exception as e:
+                print(f"Pre-warming for the reservation of {key[0]} failed: {e}")
+                continue
+            self.warmed += 1
+        return len(due)
+
+    def next_wakeup(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            if not self.planned:
+                return None
+            return max(0.0, min(max(warm_at, key[1] - self.window) for key, (warm_at, _) in self.planned.items()) - now)
+
+    def _run(self):
+        while True:
+            wait = self.next_wakeup()
+            # Re-check at least every minute (clock changes, new reservations)
+            self._wake.wait(60 if wait is None else min(wait, 60))
+            self._wake.clear()
+            self.run_due()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="reservation-prewarm", daemon=True)
+            self._thread.start()
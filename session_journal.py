@@ -0,0 +1,121 @@
+import json
+import os
+import time
+
+from app_config import config
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+BOOT_ID_PATH = '/proc/sys/kernel/random/boot_id'
+
+
+def resolve_journal_path(path=None):
+    path = path or config.get('SessionTime', 'journal_path', fallback='session_journal.json')
+    if not os.path.isabs(path):
+        path = os.path.join(script_dir, path)
+    return path
+
+
+def boot_id():
+    """The kernel's id for the current boot, or None where there is none (not Linux)."""
+    try:
+        with open(BOOT_ID_PATH, 'r') as boot_id_file:
+            return boot_id_file.read().strip() or None
+    except OSError:
+        return None
+
+
+class SessionJournal:
+    """The session currently open on this station, in one small file that survives crashes and reboots.
+
+    `open()` records the member and the start time on both clocks; `close()`
+    removes the record once the session end is logged. Every write goes to a
+    temp file that is fsynced and renamed over the journal, so after a power
+    cut the file holds either the old record or the new one, never half of
+    one. On start-up the kiosk calls `current()` and resumes the timer with
+    `elapsed()`: monotonic time when the machine has not rebooted since (immune
+    to clock changes), wall-clock time otherwise. Reboots are detected with the
+    kernel's boot id where there is one.
+    """
+
+    def __init__(self, path=None):
+        self.path = resolve_journal_path(path)
+
+    def _write(self, record):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as journal_file:
+            json.dump(record, journal_file)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        os.replace(temp_path, self.path)
+        self._sync_directory()
+
+    def _sync_directory(self):
+        # Makes the rename itself durable; directories cannot be opened this way on Windows
+        if os.name != 'posix':
+            return
+        fd = os.open(os.path.dirname(self.path) or '.', os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def open(self, user_info):
+        """Record a newly started session. Returns the record."""
+        now_monotonic, now_wall = time.monotonic(), time.time()
+        record = {
+            'user_info': user_info,
+            'started_wall': now_wall,
+            'started_monotonic': now_monotonic,
+            # Wall-clock time of the monotonic clock's zero: stays put until the machine reboots
+            'boot_wall': now_wall - now_monotonic,
+            'boot_id': boot_id(),
+        }
+        try:
+            self._write(record)
+        except OSError as e:
+            print(f"Could not write session journal {self.path}: {e}")
+        return record
+
+    def close(self):
+        try:
+            os.remove(self.path)
+            self._sync_directory()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Could not clear session journal {self.path}: {e}")
+
+    def current(self):
+        """The open session's record, or None."""
+        try:
+            with open(self.path, 'r') as journal_file:
+                record = json.load(journal_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable session journal {self.path}: {e}")
+            return None
+        if not isinstance(record, dict) or 'user_info' not in record or 'started_wall' not in record:
+            return None
+        return record
+
+    @staticmethod
+    def same_boot(record, tolerance=120):
+        """True when the monotonic clock the record was written with is still running (no reboot since)."""
+        now_monotonic = time.monotonic()
+        if now_monotonic < record.get('started_monotonic', float('inf')):
+            return False
+        current_boot = boot_id()
+        if current_boot is not None and record.get('boot_id') is not None:
+            # Exact, and unaffected by however far the wall clock was stepped
+            return record['boot_id'] == current_boot
+        # Without a boot id: NTP corrections move the wall clock a little; a reboot moves the estimate by the downtime
+        return abs((time.time() - now_monotonic) - record.get('boot_wall', 0)) <= tolerance
+
+    @classmethod
+    def elapsed(cls, record):
+        """Seconds the session has been open."""
+        if cls.same_boot(record):
+            return time.monotonic() - record['started_monotonic']
+        return max(0.0, time.time() - record['started_wall'])
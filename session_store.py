@@ -0,0 +1,262 @@
+"""Indexed SQLite store of session events, with start/end pairing, usage queries and compaction.
+
+Usage:
+    python session_store.py minutes --member "Jane Doe" [--station laser] [--month 2026-10]
+    python session_store.py members [--station laser] [--month 2026-10]
+    python session_store.py import SessionLog.csv
+    python session_store.py compact --keep-days 90 [--archive sessions-archive.db]
+"""
+import argparse
+import csv
+import datetime
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from app_config import config
+from log_parsing import member_key, parse_csv_row, parse_duration
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL,
+    action TEXT NOT NULL,
+    member TEXT NOT NULL,
+    first_name TEXT,
+    last_name TEXT,
+    permission TEXT,
+    station TEXT,
+    duration_seconds INTEGER,
+    rating TEXT,
+    comments TEXT,
+    usage TEXT,
+    usage_unit TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts);
+CREATE INDEX IF NOT EXISTS idx_events_member ON events(member, ts);
+CREATE INDEX IF NOT EXISTS idx_events_station ON events(station, ts);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    member TEXT NOT NULL,
+    first_name TEXT,
+    last_name TEXT,
+    permission TEXT,
+    station TEXT,
+    started_at TEXT,
+    ended_at TEXT,
+    duration_seconds INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_started ON sessions(started_at);
+CREATE INDEX IF NOT EXISTS idx_sessions_member ON sessions(member, started_at);
+CREATE INDEX IF NOT EXISTS idx_sessions_station ON sessions(station, started_at);
+CREATE INDEX IF NOT EXISTS idx_sessions_open ON sessions(station, member) WHERE ended_at IS NULL;
+"""
+
+
+EVENT_COLUMNS = "ts, action, member, first_name, last_name, permission, station, duration_seconds, rating, comments, usage, usage_unit"
+SESSION_COLUMNS = "member, first_name, last_name, permission, station, started_at, ended_at, duration_seconds"
+
+
+def resolve_db_path(path=None):
+    path = path or config.get('SessionStore', 'db_path', fallback='sessions.db')
+    if not os.path.isabs(path):
+        path = os.path.join(script_dir, path)
+    return path
+
+
+def month_range(month):
+    """('YYYY-MM-01 00:00:00', first instant of next month) for 'YYYY-MM'."""
+    start = datetime.datetime.strptime(month, '%Y-%m')
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start.strftime(TIMESTAMP_FORMAT), end.strftime(TIMESTAMP_FORMAT)
+
+
+class SessionStore:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def record(self, event):
+        """Store one event (as produced by event_log) and pair session starts with ends."""
+        member = member_key(event.get('first_name'), event.get('last_name'))
+        duration_seconds = parse_duration(event.get('duration'))
+        action = event.get('action', '')
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO events (ts, action, member, first_name, last_name, permission, station, duration_seconds, rating, comments, usage, usage_unit)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (event['timestamp'], action, member, event.get('first_name'), event.get('last_name'), event.get('permission'),
+                 event.get('station'), duration_seconds, event.get('rating'), event.get('comments'), event.get('usage'), event.get('usage_unit')),
+            )
+            if action == 'start':
+                self.conn.execute(
+                    "INSERT INTO sessions (member, first_name, last_name, permission, station, started_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (member, event.get('first_name'), event.get('last_name'), event.get('permission'), event.get('station'), event['timestamp']),
+                )
+            elif action == 'end':
+                self._close_session(member, event, duration_seconds)
+
+    def _close_session(self, member, event, duration_seconds):
+        row = self.conn.execute(
+            "SELECT id, started_at FROM sessions WHERE member = ? AND station IS ? AND ended_at IS NULL ORDER BY started_at DESC LIMIT 1",
+            (member, event.get('station')),
+        ).fetchone()
+        if row is not None:
+            session_id, started_at = row
+            if duration_seconds is None:
+                started = datetime.datetime.strptime(started_at, TIMESTAMP_FORMAT)
+                ended = datetime.datetime.strptime(event['timestamp'], TIMESTAMP_FORMAT)
+                duration_seconds = int((ended - started).total_seconds())
+            self.conn.execute("UPDATE sessions SET ended_at = ?, duration_seconds = ? WHERE id = ?",
+                              (event['timestamp'], duration_seconds, session_id))
+            return
+        # An end without a recorded start: derive the start from the duration when we can
+        started_at = None
+        if duration_seconds is not None:
+            ended = datetime.datetime.strptime(event['timestamp'], TIMESTAMP_FORMAT)
+            started_at = (ended - datetime.timedelta(seconds=duration_seconds)).strftime(TIMESTAMP_FORMAT)
+        self.conn.execute(
+            "INSERT INTO sessions (member, first_name, last_name, permission, station, started_at, ended_at, duration_seconds) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (member, event.get('first_name'), event.get('last_name'), event.get('permission'), event.get('station'), started_at, event['timestamp'], duration_seconds),
+        )
+
+    def _filters(self, member=None, station=None, since=None, until=None):
+        clauses, params = ["duration_seconds IS NOT NULL"], []
+        if member:
+            clauses.append("member = ?")
+            params.append(" ".join(member.split()).lower())
+        if station:
+            clauses.append("station = ?")
+            params.append(station)
+        if since:
+            clauses.append("started_at >= ?")
+            params.append(since)
+        if until:
+            clauses.append("started_at < ?")
+            params.append(until)
+        return " AND ".join(clauses), params
+
+    def total_minutes(self, member=None, station=None, since=None, until=None):
+        where, params = self._filters(member, station, since, until)
+        with self._lock:
+            seconds, count = self.conn.execute(f"SELECT COALESCE(SUM(duration_seconds), 0), COUNT(*) FROM sessions WHERE {where}", params).fetchone()
+        return seconds / 60.0, count
+
+    def minutes_by_member(self, station=None, since=None, until=None):
+        where, params = self._filters(None, station, since, until)
+        with self._lock:
+            return self.conn.execute(
+                f"SELECT first_name, last_name, SUM(duration_seconds) / 60.0, COUNT(*) FROM sessions WHERE {where}"
+                " GROUP BY member ORDER BY 3 DESC", params).fetchall()
+
+    def compact(self, keep_days, archive_path=None):
+        """Move closed sessions and events older than `keep_days` out of the working database."""
+        cutoff = (datetime.datetime.now() - datetime.timedelta(days=keep_days)).strftime(TIMESTAMP_FORMAT)
+        with self._lock:
+            if archive_path:
+                self.conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+            try:
+                if archive_path:
+                    self.conn.executescript(SCHEMA.replace("CREATE TABLE IF NOT EXISTS ", "CREATE TABLE IF NOT EXISTS archive.")
+                                            .replace("CREATE INDEX IF NOT EXISTS ", "CREATE INDEX IF NOT EXISTS archive."))
+                with self.conn:
+                    if archive_path:
+                        # Ids are left out: the working tables reuse them once emptied, the archive assigns its own
+                        self.conn.execute(f"INSERT INTO archive.events ({EVENT_COLUMNS}) SELECT {EVENT_COLUMNS} FROM events WHERE ts < ?", (cutoff,))
+                        self.conn.execute(f"INSERT INTO archive.sessions ({SESSION_COLUMNS}) SELECT {SESSION_COLUMNS} FROM sessions"
+                                          " WHERE ended_at IS NOT NULL AND ended_at < ?", (cutoff,))
+                    moved_events = self.conn.execute("DELETE FROM events WHERE ts < ?", (cutoff,)).rowcount
+                    moved_sessions = self.conn.execute("DELETE FROM sessions WHERE ended_at IS NOT NULL AND ended_at < ?", (cutoff,)).rowcount
+            finally:
+                if archive_path:
+                    self.conn.execute("DETACH DATABASE archive")
+            # Give the space back to the SD card
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.conn.execute("VACUUM")
+        return moved_events, moved_sessions
+
+    def import_csv(self, csv_path):
+        """Backfill from a session CSV in any of the layouts the kiosk has written."""
+        count = 0
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                event = parse_csv_row(row)
+                if event is None:
+                    continue
+                try:
+                    self.record(event)
+                except ValueError as e:
+                    print(f"Skipping unreadable row {row}: {e}")
+                    continue
+                count += 1
+        return count
+
+    def close(self):
+        self.conn.close()
+
+
+def attach(event_log_writer, db_path=None):
+    """Store every event written by `event_log_writer` (runs on its writer thread, never the UI)."""
+    store = SessionStore(resolve_db_path(db_path))
+    event_log_writer.add_listener(store.record)
+    return store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the session store.")
+    parser.add_argument('--db', help="database path (default: [SessionStore] db_path)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for name in ('minutes', 'members'):
+        command = commands.add_parser(name)
+        if name == 'minutes':
+            command.add_argument('--member', required=True, help='"First Last"')
+        command.add_argument('--station')
+        command.add_argument('--month', help="YYYY-MM")
+        command.add_argument('--since', help="YYYY-MM-DD[ HH:MM:SS]")
+        command.add_argument('--until', help="YYYY-MM-DD[ HH:MM:SS]")
+
+    import_command = commands.add_parser('import')
+    import_command.add_argument('csv_path')
+
+    compact_command = commands.add_parser('compact')
+    compact_command.add_argument('--keep-days', type=int, default=config.getint('SessionStore', 'keep_days', fallback=90))
+    compact_command.add_argument('--archive', help="archive database to move old rows into")
+
+    args = parser.parse_args(argv)
+    store = SessionStore(resolve_db_path(args.db))
+    started = time.perf_counter()
+
+    if args.command in ('minutes', 'members'):
+        since, until = args.since, args.until
+        if args.month:
+            since, until = month_range(args.month)
+        if args.command == 'minutes':
+            minutes, count = store.total_minutes(args.member, args.station, since, until)
+            print(f"{args.member}: {minutes:.1f} minutes over {count} sessions")
+        else:
+            for first_name, last_name, minutes, count in store.minutes_by_member(args.station, since, until):
+                print(f"{first_name} {last_name}: {minutes:.1f} minutes over {count} sessions")
+    elif args.command == 'import':
+        print(f"Imported {store.import_csv(args.csv_path)} rows")
+    elif args.command == 'compact':
+        events, sessions = store.compact(args.keep_days, args.archive)
+        print(f"Compacted {events} events and {sessions} sessions older than {args.keep_days} days")
+
+    print(f"({(time.perf_counter() - started) * 1000:.1f} ms)", file=sys.stderr)
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,23 @@
+import startup_profile
 import tkinter as tk
 import time
 import datetime
-import os
-import csv
-import configparser
-import subprocess
-import sys
-import json
+import event_log
+from app_config import config
 
-# Load configuration
-config = configparser.ConfigParser()
-config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini')
-config.read(config_path)
-
-log_file_path = config.get('Logging', 'log_file_path', fallback=os.path.join(os.path.dirname(os.path.abspath(__file__)), "SessionLog.txt"))
-
-# Load EndingPage configuration
-show_ending_window = config.getboolean('EndingPage', 'show_ending_window', fallback=True)
+log_file_path = event_log.resolve_log_path()
 
 
 class SessionTimerWindow:
-    def __init__(self, user_info=None, log_file_path=log_file_path):
+    def __init__(self, user_info=None, log_file_path=log_file_path, master=None, on_end=None, elapsed=0.0):
         self.log_file_path = log_file_path  # Store the log file path
         if user_info is None:
             user_info = {'first_name': 'Unregistered', 'last_name': 'User'}
         self.user_info = user_info
-        self.root = tk.Tk()
+        # Called with user_info once the session has ended (the kiosk moves to the next screen)
+        self.on_end = on_end
+        # Inside the kiosk process the timer is a Toplevel of the shared root; standalone it owns its own Tk
+        self.root = tk.Toplevel(master) if master is not None else tk.Tk()
         
         # Remove the standard title bar and make the window always on top
         self.root.overrideredirect(True)
@@ -65,7 +57,10 @@ class SessionTimerWindow:
         self.root.geometry(f"{window_width}x{window_height}+{position_right}+{position_bottom}")
         
         self.setup_ui()
-        self.start_time = time.time()
+        # `elapsed` > 0 resumes a session that was already running before a restart
+        self.start_time = time.time() - elapsed
+        # Elapsed time is measured on the monotonic clock, so clock changes do not bend the session length
+        self.start_monotonic = time.monotonic() - elapsed
         self.update_timer()
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
        
@@ -88,10 +83,11 @@ class SessionTimerWindow:
 
     def update_timer(self):
         if self.root:  # Check if the root window exists
-            elapsed_time = time.time() - self.start_time
+            elapsed_time = time.monotonic() - self.start_monotonic
             formatted_time = time.strftime("%H:%M:%S", time.gmtime(elapsed_time))
             self.timer_label.config(text=formatted_time)
-            self.after_id = self.root.after(1000, self.update_timer) 
+            # Tick on the second boundary, so a resumed timer stays in step with the real start
+            self.after_id = self.root.after(1000 - int(elapsed_time * 1000) % 1000, self.update_timer)
 
             pass
 
@@ -100,35 +96,24 @@ class SessionTimerWindow:
             self.root.after_cancel(self.after_id)
 
         # Log session end
-        end_time = time.time()
-        session_duration = end_time - self.start_time
+        session_duration = time.monotonic() - self.start_monotonic
         duration_str = str(datetime.timedelta(seconds=int(session_duration)))
         timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
-        # Log entry for CSV
-        log_entry = [timestamp, "end", self.user_info['first_name'], self.user_info['last_name'], self.user_info.get('permission', 'N/A'), self.user_info.get('station', 'N/A'), duration_str]
-        with open(self.log_file_path.replace('.txt', '.csv'), 'a', newline='') as csvfile:
-            csv.writer(csvfile).writerow(log_entry)
-            
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        user_info_path = os.path.join(script_dir, "temp_user_data.json")
-
-        with open(user_info_path, 'w') as file:
-            json.dump(self.user_info, file)
-
-        if not show_ending_window:
-            # If show_ending_window is False, launch maker-light-auth.pyw
-            auth_script_path = os.path.join(script_dir, "maker-light-auth.pyw")
-            subprocess.Popen([sys.executable, auth_script_path])
-        else:
-            require_usage_input = config.getboolean('UsageInput', 'require_usage_input', fallback=False)
-            # Your existing logic for determining the next script based on require_usage_input...
-            next_script_path = os.path.join(script_dir, "usage_input.py") if require_usage_input else os.path.join(script_dir, "ending_window.py")
-            if next_script_path is not None:
-                subprocess.Popen([sys.executable, next_script_path, user_info_path])
-        
+        # Session end goes through the shared, buffered event log
+        event_log.log_event(
+            "end", self.user_info, self.log_file_path,
+            timestamp=timestamp,
+            duration=duration_str,
+            text=f"Session end for {self.user_info['first_name']} {self.user_info['last_name']} after {duration_str}.",
+        )
+
         self.root.destroy()  # Close the timer window
 
+        # Hand the user over to the next screen in the same process
+        if self.on_end is not None:
+            self.on_end(self.user_info)
+
 
     def start_move(self, event):
         self._drag_start_x = event.x
@@ -149,11 +134,8 @@ class SessionTimerWindow:
     def run(self):
         self.root.mainloop()
 
-if __name__ == "__main__":
-    config = configparser.ConfigParser()
-    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini')
-    config.read(config_path)
-
+def main():
+    # Standalone, for testing the timer on its own
     permission_id = config.get('Login', 'permission_id', fallback='deftemp_user_datalt_permission_id')
     workstation_id = config.get('Station', 'workstation_id', fallback='default_workstation_id')
 
@@ -169,4 +151,13 @@ if __name__ == "__main__":
     if session_window.root.winfo_exists():
         session_window.root.protocol("WM_DELETE_WINDOW", session_window.on_closing)
 
-    session_window.run()
\ No newline at end of file
+    def on_first_prompt():
+        session_window.root.update_idletasks()
+        startup_profile.first_prompt("session_timer.py", "timer window shown")
+
+    session_window.root.after_idle(on_first_prompt)
+    session_window.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Cold-start timing for the kiosk entry points.
+
+Run any entry point with `--profile-startup` to print how long it took to get
+its first prompt on screen, then exit:
+
+    python maker-light-auth.pyw --profile-startup
+    python session_timer.py --profile-startup
+
+Import this module first thing in the entry point so the marks line up with
+the imports that follow.
+"""
+import os
+import sys
+import time
+
+FLAG = '--profile-startup'
+
+# Heavy dependencies that should only be loaded once a screen actually needs them
+HEAVY_MODULES = ('requests', 'PIL', 'qrcode', 'loguru', 'graypy', 'sqlite3')
+
+
+def _process_age():
+    """Seconds since this process started (Linux only), so interpreter start-up is counted too."""
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0.0
+
+
+_started = time.perf_counter() - _process_age()
+marks = [("process start", 0.0), ("startup_profile imported", time.perf_counter() - _started)]
+
+
+def requested(argv=None):
+    return FLAG in (sys.argv[1:] if argv is None else argv)
+
+
+def mark(label):
+    """Record how far into start-up we are; cheap enough to leave in the normal start path."""
+    marks.append((label, time.perf_counter() - _started))
+
+
+def report(entry_point, stream=None):
+    stream = stream or sys.stderr
+    print(f"Startup profile for {entry_point}:", file=stream)
+    previous = 0.0
+    for label, at in marks:
+        print(f"  {at * 1000:8.1f} ms  (+{(at - previous) * 1000:7.1f})  {label}", file=stream)
+        previous = at
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    print(f"  time to first prompt: {marks[-1][1] * 1000:.1f} ms", file=stream)
+    print(f"  heavy modules loaded: {', '.join(loaded) or 'none'}", file=stream)
+
+
+def first_prompt(entry_point, label="first prompt shown"):
+    """Mark the first prompt; in --profile-startup mode print the report and exit the process."""
+    mark(label)
+    if requested():
+        report(entry_point)
+        raise SystemExit(0)
@@ -0,0 +1,437 @@
+"""Per-station utilization from the session logs: busy hours, session lengths, back-to-back use and "not me" resets.
+
+The logs go through a generator pipeline: log files -> events (log_parsing,
+any row layout) -> sessions (start/end pairs per member and station log)
+-> hour-of-week busy time, binned in chunks with NumPy when it is installed
+and in plain Python otherwise.
+
+Results are cached with the byte offset reached in every file, so a re-run
+only reads what was appended since. Files are recognised by their first
+bytes, so a rotated log is not read twice. Sessions still open and the
+last session end per station are cached too, so sessions are paired across
+runs.
+
+Usage:
+    python station_analytics.py                      # the configured log and its rotated files
+    python station_analytics.py logs/ --hourly       # every station's CSV logs under logs/
+    python station_analytics.py --weekly --station laser
+    python station_analytics.py --format json --no-cache
+"""
+import argparse
+import bisect
+import datetime
+import hashlib
+import json
+import os
+import sys
+import time
+
+import event_log
+from log_parsing import EventReader, log_files, member_key, parse_duration
+
+try:
+    import numpy as np
+except ImportError:  # Plain Python binning, a few times slower
+    np = None
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+CACHE_VERSION = 1
+HOUR = 3600
+WEEK_HOURS = 7 * 24
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+DURATION_BUCKETS = (5, 15, 30, 60, 120, 240)  # Upper bounds in minutes; the last bucket is open-ended
+FINGERPRINT_BYTES = 1024
+CHUNK_SIZE = 10000
+UNIX_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+_day_seconds = {}
+
+
+def local_seconds(timestamp):
+    """Seconds since 1970 for a 'YYYY-MM-DD HH:MM:SS' log timestamp, read as local wall-clock time.
+
+    No time zone is applied, so hour and weekday bins are the ones on the
+    station's clock, DST changes included.
+    """
+    day = _day_seconds.get(timestamp[:10])
+    if day is None:
+        date = datetime.date(int(timestamp[:4]), int(timestamp[5:7]), int(timestamp[8:10]))
+        day = _day_seconds[timestamp[:10]] = (date.toordinal() - UNIX_EPOCH_ORDINAL) * 86400
+    return day + int(timestamp[11:13]) * HOUR + int(timestamp[14:16]) * 60 + int(timestamp[17:19])
+
+
+def week_hour(hours):
+    """weekday * 24 + hour (Monday 0) for a count of hours since 1970; works on ints and NumPy arrays."""
+    return ((hours // 24 + 3) % 7) * 24 + hours % 24  # 1970-01-01 was a Thursday
+
+
+def bin_busy_seconds(starts, ends):
+    """Busy seconds per hour of the week for sessions [start, end), split at hour boundaries."""
+    if np is not None:
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        first = starts // HOUR
+        spans = (ends - 1) // HOUR - first + 1
+        # One entry per (session, hour it touches)
+        owner = np.repeat(np.arange(len(starts)), spans)
+        hours = first[owner] + np.arange(owner.size) - np.repeat(np.cumsum(spans) - spans, spans)
+        seconds = np.minimum(ends[owner], (hours + 1) * HOUR) - np.maximum(starts[owner], hours * HOUR)
+        return np.bincount(week_hour(hours), weights=seconds, minlength=WEEK_HOURS)
+    busy = [0] * WEEK_HOURS
+    for start, end in zip(starts, ends):
+        hour = start // HOUR
+        while hour * HOUR < end:
+            busy[week_hour(hour)] += min(end, (hour + 1) * HOUR) - max(start, hour * HOUR)
+            hour += 1
+    return busy
+
+
+def bin_durations(durations):
+    """Session counts per DURATION_BUCKETS bucket."""
+    bounds = [minutes * 60 for minutes in DURATION_BUCKETS]
+    if np is not None:
+        buckets = np.searchsorted(np.asarray(bounds), np.asarray(durations), side='right')
+        return np.bincount(buckets, minlength=len(bounds) + 1)
+    counts = [0] * (len(bounds) + 1)
+    for duration in durations:
+        counts[bisect.bisect_right(bounds, duration)] += 1
+    return counts
+
+
+class StationStats:
+    """Running aggregates for one station; everything is a sum, so chunks and runs simply add up."""
+
+    FIELDS = ('sessions', 'busy_seconds', 'abandoned', 'not_me', 'back_to_back', 'wait_seconds', 'first_day', 'last_day')
+    SERIES = {'weekly': WEEK_HOURS, 'durations': len(DURATION_BUCKETS) + 1, 'not_me_hourly': 24, 'back_to_back_hourly': 24}
+
+    def __init__(self, data=None):
+        for name in self.FIELDS:
+            setattr(self, name, 0)
+        self.first_day = None
+        self.last_day = None
+        for name, size in self.SERIES.items():
+            setattr(self, name, [0] * size)
+        for name, value in (data or {}).items():
+            if name in self.FIELDS or name in self.SERIES:
+                setattr(self, name, value)
+
+    def add_sessions(self, starts, ends):
+        durations = [end - start for start, end in zip(starts, ends)]
+        self.sessions += len(durations)
+        self.busy_seconds += sum(durations)
+        self.weekly = [a + float(b) for a, b in zip(self.weekly, bin_busy_seconds(starts, ends))]
+        self.durations = [a + int(b) for a, b in zip(self.durations, bin_durations(durations))]
+
+    def saw(self, seconds):
+        day = seconds // 86400
+        self.first_day = day if self.first_day is None else min(self.first_day, day)
+        self.last_day = day if self.last_day is None else max(self.last_day, day)
+
+    def days_per_weekday(self):
+        """How many of each weekday (Monday first) the station's logs cover."""
+        counts = [0] * 7
+        if self.first_day is not None:
+            for day in range(self.first_day, self.last_day + 1):
+                counts[(day + 3) % 7] += 1
+        return counts
+
+    def hourly(self):
+        """Busy seconds per hour of the day, all weekdays together."""
+        return [sum(self.weekly[weekday * 24 + hour] for weekday in range(7)) for hour in range(24)]
+
+    def hourly_utilization(self):
+        days = sum(self.days_per_weekday())
+        return [busy / (days * HOUR) if days else 0.0 for busy in self.hourly()]
+
+    def weekly_utilization(self):
+        days = self.days_per_weekday()
+        return [[self.weekly[weekday * 24 + hour] / (days[weekday] * HOUR) if days[weekday] else 0.0
+                 for hour in range(24)] for weekday in range(7)]
+
+    def peak_hours(self, count=3):
+        hourly = self.hourly()
+        peaks = sorted(range(24), key=lambda hour: -hourly[hour])[:count]
+        return [f"{hour:02d}-{hour + 1:02d}h" for hour in peaks if hourly[hour] > 0]
+
+    def summary(self):
+        return {
+            'sessions': self.sessions,
+            'average_minutes': round(self.busy_seconds / self.sessions / 60, 1) if self.sessions else None,
+            'busy_hours': round(self.busy_seconds / HOUR, 1),
+            'abandoned': self.abandoned,
+            'not_me': self.not_me,
+            'back_to_back': self.back_to_back,
+            'average_wait_minutes': round(self.wait_seconds / self.back_to_back / 60, 1) if self.back_to_back else None,
+            'peak_hours': self.peak_hours(),
+            'duration_minutes': dict(zip([f"<{m}" for m in DURATION_BUCKETS] + [f">={DURATION_BUCKETS[-1]}"], self.durations)),
+        }
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS + tuple(self.SERIES)}
+
+
+class Sessionizer:
+    """Pairs starts with ends per (log source, member) and keeps the per-station counters that are not sessions.
+
+    `max_seconds` drops sessions longer than that (a start whose end was
+    never logged and got paired much later) and counts them as abandoned.
+    A start within `queue_gap` seconds of the station's previous session end
+    counts as back-to-back use: someone was waiting.
+    """
+
+    def __init__(self, stats, max_seconds, queue_gap, state=None):
+        self.stats = stats
+        self.max_seconds = max_seconds
+        self.queue_gap = queue_gap
+        state = state or {}
+        self.open = state.get('open', {})            # "source\tmember" -> [station, start]
+        self.recent_end = state.get('recent_end', {})  # "source\tmember" -> last end, to spot a second end row
+        self.last_end = state.get('last_end', {})      # station -> last session end
+        self.source_station = state.get('source_station', {})  # source -> last station named in it
+
+    def state(self):
+        return {'open': self.open, 'recent_end': self.recent_end, 'last_end': self.last_end, 'source_station': self.source_station}
+
+    def station(self, name):
+        if name not in self.stats:
+            self.stats[name] = StationStats()
+        return self.stats[name]
+
+    def sessions(self, events):
+        """(station, start, end) for every completed session in `events` ((source, event) pairs)."""
+        for source, event in events:
+            try:
+                seconds = local_seconds(event['timestamp'])
+            except ValueError:
+                continue
+            action = event['action']
+            # The old ending screen left the station empty; those rows belong to the station the log was last written for
+            station = event['station']
+            if station:
+                self.source_station[source] = station
+            else:
+                station = self.source_station.get(source) or os.path.basename(source)
+            key = f"{source}\t{member_key(event['first_name'], event['last_name'])}"
+            if action == 'start':
+                self.station(station).saw(seconds)
+                self.open[key] = [station, seconds]
+                last_end = self.last_end.get(station)
+                if last_end is not None and 0 <= seconds - last_end <= self.queue_gap:
+                    stats = self.station(station)
+                    stats.back_to_back += 1
+                    stats.wait_seconds += seconds - last_end
+                    stats.back_to_back_hourly[(seconds // HOUR) % 24] += 1
+            elif action == 'end':
+                session = self._close(key, station, seconds, parse_duration(event['duration']))
+                if session is not None:
+                    yield session
+            elif action == 'not_me':
+                stats = self.station(station)
+                stats.not_me += 1
+                stats.not_me_hourly[(seconds // HOUR) % 24] += 1
+
+    def _close(self, key, station, end, duration):
+        opened = self.open.pop(key, None)
+        if opened is None:
+            # The timer window and the main script each log an end; only the first one closes the session
+            if abs(end - self.recent_end.get(key, -HOUR)) <= 60 or duration is None:
+                return None
+            start = end - duration
+        else:
+            station, start = opened
+            if duration is not None:
+                start = end - duration  # Measured on the monotonic clock, so preferred over the timestamps
+        self.recent_end[key] = end
+        self.last_end[station] = max(end, self.last_end.get(station, end))
+        self.station(station).saw(end)
+        if end <= start:
+            return None
+        if end - start > self.max_seconds:
+            self.station(station).abandoned += 1
+            return None
+        return station, start, end
+
+
+def chunked(sessions, size=CHUNK_SIZE):
+    """Lists of up to `size` sessions, so binning runs vectorized over many at once."""
+    chunk = []
+    for session in sessions:
+        chunk.append(session)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def aggregate(chunks, stats):
+    for chunk in chunks:
+        by_station = {}
+        for station, start, end in chunk:
+            starts, ends = by_station.setdefault(station, ([], []))
+            starts.append(start)
+            ends.append(end)
+        for station, (starts, ends) in by_station.items():
+            stats.setdefault(station, StationStats()).add_sessions(starts, ends)
+
+
+def resolve_cache_path(path=None):
+    path = path or 'station_analytics_cache.json'
+    if not os.path.isabs(path):
+        path = os.path.join(script_dir, path)
+    return path
+
+
+class AnalyticsCache:
+    """Aggregates, pairing state and per-file read offsets from the previous run."""
+
+    def __init__(self, path, settings):
+        self.path = path
+        self.settings = settings
+        self.files = {}
+        self.state = {}
+        self.stations = {}
+        if path is None:
+            return
+        try:
+            with open(path, 'r') as cache_file:
+                data = json.load(cache_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable analytics cache {path}: {e}")
+            return
+        if data.get('version') != CACHE_VERSION or data.get('settings') != settings:
+            print("Analytics settings changed; reading every log again")
+            return
+        self.files = data.get('files', {})
+        self.state = data.get('state', {})
+        self.stations = {name: StationStats(stats) for name, stats in data.get('stations', {}).items()}
+
+    @staticmethod
+    def _head(path):
+        with open(path, 'rb') as log_file:
+            return log_file.read(FINGERPRINT_BYTES)
+
+    def resume_offset(self, path):
+        """Where to continue reading `path`: the cached offset of the file that starts with the same bytes."""
+        head = self._head(path)
+        size = os.path.getsize(path)
+        for entry in self.files.values():
+            prefix = entry['prefix']
+            if prefix <= len(head) and entry['offset'] <= size and hashlib.sha1(head[:prefix]).hexdigest() == entry['fingerprint']:
+                return entry['offset']
+        return 0
+
+    def remember(self, path, offset):
+        head = self._head(path)
+        stale = [name for name, entry in self.files.items()
+                 if entry['path'] == path or hashlib.sha1(head[:entry['prefix']]).hexdigest() == entry['fingerprint']]
+        for name in stale:
+            del self.files[name]
+        fingerprint = hashlib.sha1(head).hexdigest()
+        self.files[fingerprint] = {'path': path, 'prefix': len(head), 'fingerprint': fingerprint, 'offset': offset}
+
+    def save(self, sessionizer):
+        if self.path is None:
+            return
+        data = {
+            'version': CACHE_VERSION,
+            'settings': self.settings,
+            'files': self.files,
+            'state': sessionizer.state(),
+            'stations': {name: stats.as_dict() for name, stats in self.stations.items()},
+        }
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as cache_file:
+            json.dump(data, cache_file)
+        os.replace(temp_path, self.path)
+
+
+def new_events(files, cache, reader, progress):
+    """(source, event) for everything appended to `files` since the cached offsets; records the new offsets."""
+    for path in files:
+        offset = cache.resume_offset(path)
+        source = os.path.dirname(os.path.abspath(path))
+        end = offset
+        for event, end in reader.read(path, offset):
+            yield source, event
+        progress[path] = end - offset
+        cache.remember(path, end)
+
+
+def print_table(stats):
+    print(f"{'Station':<20} {'Sessions':>8} {'Avg min':>8} {'Busy h':>8} {'Not me':>7} {'Back-to-back':>12} {'Avg wait':>8}  Peak hours")
+    for name in sorted(stats):
+        summary = stats[name].summary()
+        average = summary['average_minutes']
+        wait = summary['average_wait_minutes']
+        print(f"{name[:20]:<20} {summary['sessions']:>8} {average if average is not None else '-':>8} {summary['busy_hours']:>8} "
+              f"{summary['not_me']:>7} {summary['back_to_back']:>12} {wait if wait is not None else '-':>8}  {', '.join(summary['peak_hours'])}")
+
+
+def print_hourly(name, stats):
+    print(f"\n{name}: share of each hour in use")
+    for hour, share in enumerate(stats.hourly_utilization()):
+        print(f"  {hour:02d}:00 {share * 100:5.1f}% {'#' * round(share * 40)}")
+
+
+def print_weekly(name, stats):
+    print(f"\n{name}: % of each hour in use, by weekday")
+    print("     " + "".join(f"{hour:>4}" for hour in range(24)))
+    for weekday, row in zip(WEEKDAYS, stats.weekly_utilization()):
+        print(f"  {weekday}" + "".join(f"{share * 100:>4.0f}" for share in row))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-station utilization from the session logs.")
+    parser.add_argument('paths', nargs='*', help="log files or directories (default: [Logging] log_file_path and its rotated files)")
+    parser.add_argument('--station', help="only show this station")
+    parser.add_argument('--hourly', action='store_true', help="show use by hour of day")
+    parser.add_argument('--weekly', action='store_true', help="show use by weekday and hour")
+    parser.add_argument('--format', choices=('table', 'json'), default='table')
+    parser.add_argument('--text', action='store_true', help="read .txt logs in directories instead of .csv")
+    parser.add_argument('--max-hours', type=float, default=12, help="longer sessions count as abandoned (default 12)")
+    parser.add_argument('--queue-gap', type=float, default=5, help="minutes between sessions that count as back-to-back (default 5)")
+    parser.add_argument('--cache', help="cache file (default: station_analytics_cache.json next to this script)")
+    parser.add_argument('--no-cache', action='store_true', help="read everything and do not write a cache")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    paths = args.paths or [event_log.csv_path_for(event_log.resolve_log_path())]
+    files = log_files(paths, '.txt' if args.text else '.csv')
+    settings = {'paths': sorted(os.path.abspath(path) for path in paths), 'text': args.text,
+                'max_hours': args.max_hours, 'queue_gap': args.queue_gap}
+    cache = AnalyticsCache(None if args.no_cache else resolve_cache_path(args.cache), settings)
+
+    stats = cache.stations
+    sessionizer = Sessionizer(stats, int(args.max_hours * HOUR), int(args.queue_gap * 60), cache.state)
+    reader = EventReader(('start', 'end', 'not_me'))
+    progress = {}
+    aggregate(chunked(sessionizer.sessions(new_events(files, cache, reader, progress))), stats)
+    cache.save(sessionizer)
+
+    shown = {name: station for name, station in stats.items() if not args.station or name == args.station}
+    if args.format == 'json':
+        json.dump({name: {**station.summary(),
+                          'hourly_utilization': [round(share, 4) for share in station.hourly_utilization()],
+                          'weekly_utilization': [[round(share, 4) for share in row] for row in station.weekly_utilization()]}
+                   for name, station in shown.items()}, sys.stdout, indent=2)
+        print()
+    else:
+        print_table(shown)
+        for name in sorted(shown):
+            if args.hourly:
+                print_hourly(name, shown[name])
+            if args.weekly:
+                print_weekly(name, shown[name])
+
+    read_bytes = sum(progress.values())
+    print(f"{len(files)} files, {read_bytes / 1e6:.1f} MB new, {reader.events} events ({reader.skipped} unreadable rows skipped), "
+          f"{'numpy' if np is not None else 'python'} binning ({(time.perf_counter() - started):.2f} s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""Headless daemon that does the network and logging work for several kiosk stations in one process.
+
+All stations share one Drupal login and connection pool, one permission
+cache and one event-log pipeline (CSV/text logs, session store, outbox,
+Graylog). The Tk kiosks become thin clients (daemon_client.py) that talk to
+it over a local UNIX socket with one JSON object per line.
+
+Stations are configured as [Station:<name>] sections with workstation_id,
+permission_id and tool_numerical_id. Without any, the daemon serves the
+station from [Station]/[Login]. Needs UNIX domain sockets (Linux, macOS).
+
+Usage:
+    python station_daemon.py [--socket /run/maker-light-auth.sock]
+"""
+import argparse
+import datetime
+import json
+import os
+import socketserver
+
+import event_log
+import timing_spans
+from app_config import config
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+STATION_SECTION_PREFIX = "Station:"
+
+
+def resolve_socket_path(path=None):
+    path = path or config.get('Daemon', 'socket_path', fallback='maker-light-auth.sock')
+    if not os.path.isabs(path):
+        path = os.path.join(script_dir, path)
+    return path
+
+
+def load_profiles():
+    """Station name -> {'workstation_id', 'permission_id', 'tool_numerical_id'}."""
+    profiles = {}
+    for section in config.sections():
+        if section.startswith(STATION_SECTION_PREFIX):
+            name = section[len(STATION_SECTION_PREFIX):].strip()
+            profiles[name] = {
+                'workstation_id': config.get(section, 'workstation_id', fallback=name),
+                'permission_id': config.get(section, 'permission_id', fallback=config.get('Login', 'permission_id')),
+                'tool_numerical_id': config.get(section, 'tool_numerical_id', fallback="0"),
+            }
+    if not profiles:
+        workstation_id = config.get('Station', 'workstation_id')
+        profiles[workstation_id] = {
+            'workstation_id': workstation_id,
+            'permission_id': config.get('Login', 'permission_id'),
+            'tool_numerical_id': config.get('Station', 'tool_numerical_id', fallback="0"),
+        }
+    return profiles
+
+
+class StationRequestHandler(socketserver.StreamRequestHandler):
+    """One client connection: read a JSON request per line, answer with a JSON line."""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                reply = {'ok': True, 'result': self.server.dispatch(request)}
+            except Exception as e:
+                reply = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(reply).encode('utf-8') + b"\n")
+            self.wfile.flush()
+
+
+class StationDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, profiles, outbox=None):
+        self.profiles = profiles
+        self.outbox = outbox
+        self.requests_served = 0
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # Left over from a previous run
+        # Kiosk clients run as the same user or group; the umask makes bind() create the socket 0660, never wider
+        old_umask = os.umask(0o117)
+        try:
+            super().__init__(socket_path, StationRequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def profile(self, request):
+        station = request.get('station')
+        if station not in self.profiles:
+            raise KeyError(f"unknown station {station!r}")
+        return self.profiles[station]
+
+    def dispatch(self, request):
+        import access_client
+        import http_policy
+
+        self.requests_served += 1
+        op = request.get('op')
+        if op == 'ping':
+            return {'stations': sorted(self.profiles)}
+        if op == 'resolve_access':
+            profile = self.profile(request)
+            trace = timing_spans.Trace()
+            result = access_client.resolve_access(request['identifier'], trace, profile=profile)
+            if self.outbox is not None:
+                self.outbox.enqueue('access_decision', {
+                    'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'identifier': request['identifier'],
+                    'granted': result['granted'],
+                    'message': result['message'],
+                    'permission': profile['permission_id'],
+                    'station': profile['workstation_id'],
+                })
+            timing_spans.finish(trace)
+            return {'access': result, 'spans': trace.spans}
+        if op == 'log_event':
+            user_info = request.get('user_info') or {}
+            event_log.log_event(request['action'], user_info, **request.get('fields', {}))
+            if request.get('graylog_fields') is not None:
+                from graylog_logging import get_graylog_logger, log_user_action
+                graylog_logger = get_graylog_logger()
+                if graylog_logger:
+                    log_user_action(request['action'], user_info, graylog_logger, extra_fields=request['graylog_fields'])
+            return {}
+        if op == 'stats':
+            stats = {
+                'stations': sorted(self.profiles),
+                'requests_served': self.requests_served,
+                'drupal_logins': access_client.drupal.logins,
+                'drupal_relogins': access_client.drupal.relogins,
+            }
+            if access_client.permission_cache is not None:
+                stats['permission_cache'] = access_client.permission_cache.stats()
+            if access_client.permission_snapshot is not None:
+                stats['permission_snapshot'] = access_client.permission_snapshot.stats()
+            stats['http'] = http_policy.stats()
+            if self.outbox is not None:
+                stats['outbox_pending'] = self.outbox.pending()
+            return stats
+        raise ValueError(f"unknown op {op!r}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve several kiosk stations from one process over a UNIX socket.")
+    parser.add_argument('--socket', help="socket path (default: [Daemon] socket_path)")
+    args = parser.parse_args(argv)
+
+    import access_client
+
+    profiles = load_profiles()
+    writer = event_log.get_event_log()
+    if config.getboolean('SessionStore', 'enabled', fallback=False):
+        import session_store
+        session_store.attach(writer)
+    outbox = None
+    if config.getboolean('Outbox', 'enabled', fallback=False):
+        from outbox import open_outbox
+        outbox = open_outbox(access_client.post_outbox_batch)
+        outbox.forward_session_events(writer)
+
+    # One login for every station, kept alive in the background
+    access_client.warm_up()
+
+    socket_path = resolve_socket_path(args.socket)
+    server = StationDaemon(socket_path, profiles, outbox)
+
+    @config.on_reload
+    def reload_profiles():
+        server.profiles = load_profiles()
+
+    config.watch()
+    print(f"Serving stations {', '.join(sorted(profiles))} on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Monotonic timing spans for the scan -> grant path, aggregated into an in-process histogram.
+
+A `Trace` follows one scan. Code on the path wraps each stage in
+`with span("name"):`. The span is recorded into whichever trace is active on
+the current thread and is a no-op when none is. Finished traces feed the
+per-stage histogram, which is written to [Timing] dump_path now and then.
+
+Usage:
+    python timing_spans.py [timing_stats.json]
+"""
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from app_config import config
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+dump_path = config.get('Timing', 'dump_path', fallback='timing_stats.json')
+if dump_path and not os.path.isabs(dump_path):
+    dump_path = os.path.join(script_dir, dump_path)
+dump_interval = config.getfloat('Timing', 'dump_interval', fallback=60)
+
+# Upper bounds of the histogram buckets, in milliseconds (the last bucket is open-ended)
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Trace:
+    """Stage timings for one scan. Spans may be added from any thread."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.spans = {}
+        self.marks = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            # A stage that runs twice (e.g. a retried login) counts with its total time
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def mark(self, name):
+        self.marks[name] = time.monotonic()
+
+    def since(self, name):
+        """Seconds since mark `name`, or since the trace started if it was never set."""
+        return time.monotonic() - self.marks.get(name, self.started)
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @contextmanager
+    def span(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - started)
+
+    def fields(self):
+        """Spans as flat `<stage>_ms` fields for Graylog."""
+        with self._lock:
+            return {f"{name}_ms": round(seconds * 1000, 1) for name, seconds in self.spans.items()}
+
+
+_local = threading.local()
+
+
+def current():
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def activate(trace):
+    """Make `trace` the one that `span()` records into on this thread."""
+    previous = current()
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+def traced(trace, fn):
+    """Wrap `fn` so it records into `trace` on whatever thread it ends up running."""
+    def run(*args, **kwargs):
+        with activate(trace):
+            return fn(*args, **kwargs)
+    return run
+
+
+@contextmanager
+def span(name):
+    trace = current()
+    if trace is None:
+        yield
+        return
+    with trace.span(name):
+        yield
+
+
+class Histogram:
+    """Per-stage bucket counts with sum and max, cheap enough to update on every scan."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+
+    def record(self, name, ms):
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {'count': 0, 'sum_ms': 0.0, 'max_ms': 0.0, 'buckets': [0] * (len(BUCKETS_MS) + 1)}
+            stage['count'] += 1
+            stage['sum_ms'] += ms
+            stage['max_ms'] = max(stage['max_ms'], ms)
+            index = len(BUCKETS_MS)
+            for i, bound in enumerate(BUCKETS_MS):
+                if ms <= bound:
+                    index = i
+                    break
+            stage['buckets'][index] += 1
+
+    @staticmethod
+    def quantile(stage, q):
+        """Upper bound of the bucket holding the q-th quantile, never more than the largest value seen."""
+        target = q * stage['count']
+        seen = 0
+        for i, count in enumerate(stage['buckets']):
+            seen += count
+            if count and seen >= target:
+                return min(BUCKETS_MS[i], stage['max_ms']) if i < len(BUCKETS_MS) else stage['max_ms']
+        return stage['max_ms']
+
+    def snapshot(self):
+        with self._lock:
+            stages = {name: dict(stage, buckets=list(stage['buckets'])) for name, stage in self.stages.items()}
+        for stage in stages.values():
+            stage['mean_ms'] = stage['sum_ms'] / stage['count']
+            for label, q in (('p50_ms', 0.5), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+                stage[label] = self.quantile(stage, q)
+        return stages
+
+
+histogram = Histogram()
+_last_dump = time.monotonic()
+
+
+def finish(trace):
+    """Fold a completed trace into the histogram and dump it if the interval has passed."""
+    global _last_dump
+    for name, seconds in list(trace.spans.items()):
+        histogram.record(name, seconds * 1000)
+    if dump_path and time.monotonic() - _last_dump >= dump_interval:
+        _last_dump = time.monotonic()
+        dump()
+
+
+def dump(path=None):
+    """Write the histogram atomically as JSON."""
+    path = path or dump_path
+    if not path:
+        return
+    data = {'written_at': time.strftime('%Y-%m-%d %H:%M:%S'), 'buckets_ms': list(BUCKETS_MS), 'stages': histogram.snapshot()}
+    temp_path = f"{path}.tmp"
+    try:
+        with open(temp_path, 'w') as f:
+            json.dump(data, f, indent=1)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"Could not write timing stats {path}: {e}")
+
+
+def _dump_at_exit():
+    if histogram.stages:
+        dump()
+
+
+atexit.register(_dump_at_exit)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    path = argv[0] if argv else dump_path
+    with open(path) as f:
+        data = json.load(f)
+    print(f"Timing stats written {data['written_at']}")
+    print(f"{'stage':<24} {'count':>7} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>9}")
+    for name, stage in sorted(data['stages'].items(), key=lambda item: -item[1]['mean_ms']):
+        print(f"{name:<24} {stage['count']:>7} {stage['mean_ms']:>9.1f} {stage['p50_ms']:>8} {stage['p95_ms']:>8} {stage['p99_ms']:>8} {stage['max_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    """Handle for one piece of background work; cancelling it drops the result."""
+
+    def __init__(self, future, on_done=None, on_error=None):
+        self.future = future
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = False
+
+    def cancel(self):
+        # A request already on the wire cannot be interrupted, but its result will never reach the UI
+        self.cancelled = True
+        self.future.cancel()
+
+
+class TkWorker:
+    """Thread pool bridged to Tk: work runs off the UI thread and results come back through after() polling.
+
+    Tk widgets must only be touched from the thread running mainloop(), so the
+    callbacks given to `submit()` are always invoked from the poll loop.
+    """
+
+    def __init__(self, root, max_workers=4, poll_interval=50):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kiosk-worker")
+        self.jobs = []
+        self.poll_hooks = []
+        self._poll_id = None
+
+    def submit(self, fn, *args, on_done=None, on_error=None):
+        job = Job(self.executor.submit(fn, *args), on_done, on_error)
+        self.jobs.append(job)
+        self._schedule_poll()
+        return job
+
+    def add_poll_hook(self, hook):
+        """Run `hook()` on the UI thread on every poll (e.g. to drain a message queue)."""
+        self.poll_hooks.append(hook)
+        self._schedule_poll()
+
+    def _schedule_poll(self):
+        if self._poll_id is None:
+            self._poll_id = self.root.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        self._poll_id = None
+        for hook in self.poll_hooks:
+            hook()
+
+        pending = []
+        for job in self.jobs:
+            if job.cancelled:
+                continue
+            if not job.future.done():
+                pending.append(job)
+                continue
+            error = job.future.exception()
+            if error is not None:
+                if job.on_error is not None:
+                    job.on_error(error)
+                else:
+                    print(f"Background job failed: {error}")
+            elif job.on_done is not None:
+                job.on_done(job.future.result())
+        self.jobs = pending
+
+        if self.jobs or self.poll_hooks:
+            self._schedule_poll()
+
+    def shutdown(self):
+        for job in self.jobs:
+            job.cancel()
+        self.jobs = []
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,181 +1,150 @@
+import startup_profile
 import tkinter as tk
 from tkinter import simpledialog, messagebox, ttk
-import requests
-from PIL import Image, ImageTk
-import qrcode
-import configparser
-import os
-from loguru import logger
-import sys
+import qr_service
 import math
-import csv
-import subprocess
-from datetime import datetime
-import json
+import event_log
+from app_config import config
+from tk_worker import TkWorker
 
-# Configuration and Logging Setup
-config = configparser.ConfigParser()
-script_dir = os.path.dirname(os.path.abspath(__file__))
-config_path = os.path.join(script_dir, 'config.ini')
-config.read(config_path)
+_logger = None
 
-logger.add("debug.log", format="{time} {level} {message}", level="DEBUG")
+def get_logger():
+    """loguru logger with the debug.log sink, set up the first time the usage screen logs something."""
+    global _logger
+    if _logger is None:
+        from loguru import logger
+        logger.add("debug.log", format="{time} {level} {message}", level="DEBUG")
+        _logger = logger
+    return _logger
 
-# Configuration Settings
-require_usage_input = config.getboolean('UsageInput', 'require_usage_input', fallback=True)
-usage_unit = config.get('UsageInput', 'usage_unit', fallback="units")
-material_id = config.get('UsageInput', 'material_id', fallback="")
-BASE_URL = config.get('API', 'base_url', fallback="https://www.makehaven.org/api/v0/material/")
+# Configuration Settings, re-read when config.ini changes
+@config.on_reload
+def load_settings():
+    global require_usage_input, usage_unit, material_id, BASE_URL
+    require_usage_input = config.getboolean('UsageInput', 'require_usage_input', fallback=True)
+    usage_unit = config.get('UsageInput', 'usage_unit', fallback="units")
+    material_id = config.get('UsageInput', 'material_id', fallback="")
+    BASE_URL = config.get('Materials', 'material_url', fallback="https://www.makehaven.org/api/v0/material/")
+
+
+load_settings()
 
 # Function to fetch material data
 def fetch_material_data(material_id):
+    import http_policy
     url = f"{BASE_URL}{material_id}"
-    response = requests.get(url)
+    response = http_policy.get(url, 'material')
     if response.status_code == 200:
         return response.json()
     else:
         return None
 
-# Function to create a QR code
+# Function to create a QR code (rendered at its final size and memoized by qr_service)
 def create_qr_code(url, size=300):
-    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_H, box_size=10, border=4)
-    qr.add_data(url)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white").convert('RGB')
-    img = img.resize((size, size), Image.Resampling.LANCZOS)
-    return img
-
-def read_user_data_from_temp_json():
-    # Define the path to the temporary JSON file
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    temp_json_path = os.path.join(script_dir, 'user_info_temp.json')
-
-    # Check if the file exists
-    if not os.path.exists(temp_json_path):
-        print(f"Temporary JSON file does not exist: {temp_json_path}")
-        return None
-
-    # Read user data from the JSON file
-    try:
-        with open(temp_json_path, 'r') as json_file:
-            user_info = json.load(json_file)
-            return user_info
-    except json.JSONDecodeError as e:
-        print(f"Error reading JSON file: {e}")
-        return None
-    except Exception as e:
-        print(f"Failed to load user data: {e}")
-        return None
-
-# Example usage
-user_data = read_user_data_from_temp_json()
-if user_data:
-    print("User data loaded successfully:", user_data)
-else:
-    print("Failed to load user data.")
+    return qr_service.qr_photo(url, size, 'H')
 
 # Function to display QR code with additional UI elements
-def display_qr_code(qr_img):
-    detail_window = tk.Toplevel()
+def display_qr_code(photo_image, master, on_done):
+    detail_window = tk.Toplevel(master)
     detail_window.title("QR Code for Payment")
-    detail_window.protocol("WM_DELETE_WINDOW", lambda: on_close(detail_window))
+    detail_window.attributes("-topmost", True)
+    detail_window.protocol("WM_DELETE_WINDOW", lambda: on_close(detail_window, on_done))
     
     # Message above the QR code
     tk.Label(detail_window, text="Scan QR code to pay for usage", font=("Helvetica", 14)).pack(pady=10)
     
     # Displaying the QR code
-    photo_image = ImageTk.PhotoImage(qr_img)
     qr_label = tk.Label(detail_window, image=photo_image)
     qr_label.image = photo_image  # Keep a reference
     qr_label.pack(pady=20)
     
     # Submit usage and proceed button
-    proceed_button = tk.Button(detail_window, text="Submit Usage and Proceed", command=lambda: on_close(detail_window))
+    proceed_button = tk.Button(detail_window, text="Submit Usage and Proceed", command=lambda: on_close(detail_window, on_done))
     proceed_button.pack(pady=10)
 
-    detail_window.mainloop()
-
 # Function to handle closing behavior
-def on_close(window):
-    logger.info("Usage submitted. Proceeding to the ending page.")
+def on_close(window, on_done):
+    get_logger().info("Usage submitted. Proceeding to the ending page.")
     window.destroy()
-    open_ending_screen()
-
-
-def open_ending_screen():
-    ending_script = os.path.join(script_dir, "ending_window.py")
-    subprocess.Popen([sys.executable, ending_script])
-
-# Example variables - replace these with actual data/logic to gather the values
-user_data = {}  # Populate this dictionary with actual user data
-material_name = "Example Material"
-station = user_data.get('station', 'Unknown')  # Example; replace with actual logic to determine station
-usage_amount = 1.5  # Example; replace with actual logic to determine usage amount
-unit = "Example Unit"
-
-
-# Assuming script_dir is defined somewhere in your script
-script_dir = os.path.dirname(os.path.abspath(__file__))
+    on_done()
 
 # Define the log_usage_to_csv function
 def log_usage_to_csv(first_name, last_name, permission, station, usage, usage_unit):
-    csv_log_file = 'SessionLog.csv'  # Example file name, adjust as needed
-    csv_file_path = os.path.join(script_dir, csv_log_file)
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Ensure the directory for the CSV file exists
-    os.makedirs(os.path.dirname(csv_file_path), exist_ok=True)
-    
-    # Write to CSV
-    try:
-        with open(csv_file_path, mode='a', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            # Write headers if the file is new
-            if os.path.getsize(csv_file_path) == 0:
-                writer.writerow(["Timestamp", "Action", "First Name", "Last Name", "Permission", "Station", "Usage", "Usage Unit"])
-            # Write the usage data
-            writer.writerow([timestamp, "Usage", first_name, last_name, permission, station,"", usage, usage_unit])
-    except Exception as e:
-        print(f"Failed to log usage data: {e}")
-
-
+    # Same schema and file as every other session event, written by the shared event log
+    user_info = {'first_name': first_name, 'last_name': last_name, 'permission': permission, 'station': station}
+    event_log.log_event("Usage", user_info, usage=usage, usage_unit=usage_unit,
+                        text=f"Usage - {first_name} {last_name}: {usage} {usage_unit}")
+
+
+def run_usage_input(master, user_info, on_done, tk_worker=None):
+    """Usage screen of the kiosk flow: ask for usage, log it, show the payment QR, then call on_done()."""
+    import http_transport
+    user_info = user_info or {}
+    if not require_usage_input:
+        on_done()
+        return
+
+    # The material lookup runs on the worker while the member types; the payment QR is shown once both are in
+    state = {}
+
+    def material_fetched(material_data):
+        state['material_data'] = material_data
+        show_payment()
+
+    def material_failed(error):
+        # Usage is recorded even when the material lookup fails; only the payment QR needs it
+        if isinstance(error, http_transport.HTTPError):
+            get_logger().error(f"Material data could not be fetched: {error}")
+        else:
+            get_logger().error(f"Material data could not be read: {error}")
+        material_fetched(None)
+
+    def show_payment():
+        if 'material_data' not in state or 'usage' not in state:
+            return
+        material_data, usage = state['material_data'], state['usage']
+        if not material_data:
+            get_logger().error("Material data could not be fetched; usage logged without a payment QR code.")
+            messagebox.showinfo("Usage Recorded", "Your usage was recorded. Payment is unavailable right now; please pay at the front desk.", parent=master)
+            on_done()
+            return
+
+        # Construct PayPal URL with the rounded quantity
+        paypal_base_url = material_data['materials'][0]['material']['purchase'] # Ensure this key exists and is correct
+        paypal_url_with_quantity = f"{paypal_base_url}&quantity={usage}"
+
+        # Create QR code with the updated PayPal URL and show it until the member proceeds
+        qr_img = create_qr_code(paypal_url_with_quantity)
+        display_qr_code(qr_img, master, on_done)
+
+    lookup = (tk_worker or TkWorker(master)).submit(fetch_material_data, material_id, on_done=material_fetched, on_error=material_failed)
+
+    # Ask user for the amount of usage
+    if startup_profile.requested():
+        # Runs from the dialog's own event loop, i.e. once the prompt is up
+        master.after_idle(lambda: startup_profile.first_prompt("usage_input.py", "usage prompt shown"))
+    usage_amount = simpledialog.askinteger("Usage Input", f"Enter the amount of {usage_unit} used:", parent=master)
+    if usage_amount is None:
+        get_logger().error("Usage input was cancelled or invalid.")
+        lookup.cancel()
+        on_done()
+        return
+
+    # Ensure to round up the usage_amount to the nearest whole number
+    usage = math.ceil(usage_amount)
+    log_usage_to_csv(user_info.get('first_name', 'Unknown'), user_info.get('last_name', 'Unknown'), user_info.get('permission', 'Unknown'), user_info.get('station', 'Unknown'), usage, usage_unit)
+    state['usage'] = usage
+    show_payment()
+
+
+# Main script execution (standalone, for testing the usage screen on its own)
+def main():
+    root = tk.Tk()
+    root.withdraw()
+    root.after(0, lambda: run_usage_input(root, {}, on_done=root.destroy))
+    root.mainloop()
 
 
-# Main script execution
 if __name__ == "__main__":
-    if require_usage_input:
-        material_data = fetch_material_data(material_id)
-        if material_data:
-            # Hide the root window immediately after creation
-            root = tk.Tk()
-            root.withdraw()
-            
-            # Ask user for the amount of usage
-            usage_amount = simpledialog.askinteger("Usage Input", f"Enter the amount of {usage_unit} used:", parent=root)
-            if usage_amount is not None:
-                material_name = material_data['materials'][0]['material']['label']  # Example: Adjust according to your data structure
-                unit = usage_unit  # From your config or however you define it# Assuming 'material_data' has the necessary information to construct the PayPal URL
-                usage = math.ceil(usage_amount)
-                log_usage_to_csv(user_data.get('first_name', 'Unknown'), user_data.get('last_name', 'Unknown'), user_data.get('permission', 'Unknown'), station, usage, unit)
-
-                # Ensure to round up the usage_amount to the nearest whole number
-                rounded_usage_amount = math.ceil(usage_amount)
-
-                # Construct PayPal URL with the rounded quantity
-                paypal_base_url = material_data['materials'][0]['material']['purchase'] # Ensure this key exists and is correct
-                paypal_url_with_quantity = f"{paypal_base_url}&quantity={rounded_usage_amount}"
-
-                # Create QR code with the updated PayPal URL
-                qr_img = create_qr_code(paypal_url_with_quantity)
-
-                # Display QR code in a new window without creating an empty root window
-                display_qr_code(qr_img)
-                
-                # Destroy the hidden root window after displaying QR code window
-                root.destroy()
-            else:
-                logger.error("Usage input was cancelled or invalid.")
-                # Ensure the root window is destroyed even if no usage amount is entered
-                root.destroy()
-        else:
-            logger.error("Material data could not be fetched.")
\ No newline at end of file
+    main()